@@ -0,0 +1,167 @@
+"""
+Alert rules: the former per-device if-chain vs AlertRuleEngine over all devices.
+
+Each cycle draws random metrics for --devices devices (power ratio, unbalance,
+PF, idle hours, plus voltage / current / THD-style extras for the additional
+rules). Variants:
+
+- chain:     the former analyze_monitor_device alert code, device by device
+             (default rules only, no hysteresis)
+- evaluate:  AlertRuleEngine.evaluate() on the (devices, metrics) table
+- run:       AlertRuleEngine.run(): table from dicts + evaluate + alert dicts
+
+The engine runs DEFAULT_RULES padded to --rules with extra threshold rules.
+The chain's alerts are compared with an engine holding DEFAULT_RULES without
+hysteresis (clear = value).
+
+Usage:
+    python benchmarks/bench_alert_rules.py --devices 1000 --rules 20 --cycles 50
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.alert_rules import AlertRuleEngine, DEFAULT_RULES
+
+
+def legacy_alerts(m):
+    """Alert section of analyze_monitor_device before the rule engine."""
+    current_power_kw, baseline_kw = m["power_kw"], m["baseline_kw"]
+    alerts = []
+    if baseline_kw and current_power_kw > baseline_kw:
+        ratio = current_power_kw / baseline_kw
+        if ratio > 1.2:
+            alerts.append({"msg": f"🔥 能耗严重超标: {current_power_kw:.1f}kW (>120%)", "level": "CRITICAL",
+                           "confidence": "高"})
+        elif ratio > 1.1:
+            alerts.append({"msg": f"⚠️ 能耗偏高: {current_power_kw:.1f}kW (>110%)", "level": "WARNING",
+                           "confidence": "中"})
+    unbal = m["unbalance"]
+    if unbal > 25:
+        alerts.append({"msg": f"⚡ 三相严重不平: {unbal:.1f}%", "level": "CRITICAL", "confidence": "高"})
+    elif unbal > 15:
+        alerts.append({"msg": f"⚠️ 三相不平衡: {unbal:.1f}%", "level": "WARNING", "confidence": "中"})
+    avg_pf = m["avg_pf"]
+    if avg_pf < 0.85:
+        alerts.append({"msg": f"📉 功率因数过低: {avg_pf:.2f}", "level": "WARNING", "confidence": "高"})
+    elif avg_pf < 0.90:
+        alerts.append({"msg": f"ℹ️ 功率因数需优化: {avg_pf:.2f}", "level": "NOTICE", "confidence": "低"})
+    idle_hrs = m["idle_hours"]
+    if idle_hrs > 1.0:
+        alerts.append({"msg": f"💤 长时间空转: {idle_hrs:.1f}h", "level": "WARNING", "confidence": "高"})
+    elif idle_hrs > 0.2:
+        alerts.append({"msg": f"ℹ️ 识别到间歇空转: {idle_hrs*60:.0f}min", "level": "NOTICE", "confidence": "中"})
+    if not any(a['level'] == 'CRITICAL' for a in alerts):
+        if baseline_kw and current_power_kw <= baseline_kw * 1.05:
+            alerts.insert(0, {"msg": "✅ 机器能耗未超越基线模型，能耗正常", "level": "NOTICE", "confidence": "高"})
+        if avg_pf > 0.95:
+            alerts.append({"msg": "✅ 功率因数优异，无需补偿", "level": "NOTICE", "confidence": "高"})
+        if unbal < 5:
+            alerts.append({"msg": "✅ 三相平衡良好", "level": "NOTICE", "confidence": "高"})
+    return alerts
+
+
+def extra_rules(count):
+    metrics = [("voltage", "<", 360.0, "⚠️ 电压偏低: {voltage:.0f}V"), ("voltage", ">", 420.0, "⚠️ 电压偏高: {voltage:.0f}V"),
+               ("current", ">", 180.0, "⚠️ 电流过大: {current:.0f}A"), ("thd", ">", 8.0, "⚠️ 谐波畸变: {thd:.1f}%")]
+    rules = []
+    for i in range(count):
+        metric, op, value, msg = metrics[i % len(metrics)]
+        value = value * (1 + 0.02 * (i // len(metrics)))
+        rules.append({"id": f"extra_{i}", "metric": metric, "op": op, "value": value, "clear": value * 0.98,
+                      "group": f"{metric}{op}", "level": "WARNING", "msg": msg})
+    return rules
+
+
+def draw_metrics(rng, devices):
+    power = rng.uniform(5, 80, devices)
+    baseline = np.where(rng.random(devices) < 0.9, power / rng.normal(1.0, 0.12, devices), np.nan)
+    idle = rng.exponential(0.5, devices)
+    return {
+        "power_kw": power,
+        "baseline_kw": baseline,
+        "power_ratio": power / baseline,
+        "unbalance": rng.gamma(2.0, 6.0, devices),
+        "avg_pf": rng.uniform(0.8, 0.99, devices),
+        "idle_hours": idle,
+        "idle_minutes": idle * 60,
+        "voltage": rng.normal(390, 15, devices),
+        "current": rng.uniform(20, 200, devices),
+        "thd": rng.gamma(2.0, 2.0, devices),
+    }
+
+
+def as_dicts(device_ids, columns):
+    rows = [dict(zip(columns, values)) for values in zip(*[columns[c].tolist() for c in columns])]
+    for row in rows:
+        if np.isnan(row["baseline_kw"]):
+            row["baseline_kw"] = None
+            row["power_ratio"] = None
+    return dict(zip(device_ids, rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--rules', type=int, default=20)
+    parser.add_argument('--cycles', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    device_ids = [f"energy*{i // 50}*{i % 50}" for i in range(args.devices)]
+    cycles = [as_dicts(device_ids, draw_metrics(rng, args.devices)) for _ in range(args.cycles)]
+
+    # Same alerts as the if-chain (no hysteresis)
+    plain = AlertRuleEngine([{k: v for k, v in r.items() if k != "clear"} for r in DEFAULT_RULES])
+    mismatches = 0
+    for metrics in cycles[:5]:
+        alerts, _ = plain.run(metrics)
+        mismatches += sum(alerts[d] != legacy_alerts(metrics[d]) for d in device_ids)
+
+    rules = [dict(r) for r in DEFAULT_RULES] + extra_rules(max(0, args.rules - len(DEFAULT_RULES)))
+    engine = AlertRuleEngine(rules)
+    tables = [engine.table(m) for m in cycles]
+
+    t0 = time.perf_counter()
+    for metrics in cycles:
+        for d in device_ids:
+            legacy_alerts(metrics[d])
+    chain_s = (time.perf_counter() - t0) / args.cycles
+
+    t0 = time.perf_counter()
+    active_total = 0
+    for ids, values in tables:
+        active, _ = engine.evaluate(ids, values)
+        active_total += int(active.sum())
+    evaluate_s = (time.perf_counter() - t0) / args.cycles
+
+    def timed_run(rules):
+        engine = AlertRuleEngine(rules)
+        t0 = time.perf_counter()
+        sends = 0
+        for metrics in cycles:
+            _, notify = engine.run(metrics)
+            sends += len(notify)
+        return (time.perf_counter() - t0) / args.cycles, sends
+
+    default_s, _ = timed_run(DEFAULT_RULES)
+    run_s, sends = timed_run(rules)
+
+    print(f"{args.devices} devices, {len(rules)} rules ({len(DEFAULT_RULES)} default), {args.cycles} cycles; "
+          f"if-chain vs engine mismatches: {mismatches}")
+    print(f"active alerts per cycle: {active_total / args.cycles:.0f}, DingTalk sends per cycle: "
+          f"{sends / args.cycles:.1f} (new activations only)")
+    print(f"{'variant':<10}{'rules':>6}{'ms / cycle':>12}{'cycles / s':>12}{'rule evals / s':>16}")
+    for name, n_rules, seconds in (("chain", len(DEFAULT_RULES), chain_s), ("run", len(DEFAULT_RULES), default_s),
+                                   ("evaluate", len(rules), evaluate_s), ("run", len(rules), run_s)):
+        print(f"{name:<10}{n_rules:>6}{seconds * 1000:>12.2f}{1 / seconds:>12.0f}"
+              f"{args.devices * n_rules / seconds:>16.3g}")
+
+
+if __name__ == "__main__":
+    main()
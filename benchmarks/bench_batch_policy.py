@@ -0,0 +1,84 @@
+"""
+Per-reading vs vectorized RL decisions.
+
+For N devices, compares decisions/sec of:
+- loop:   LubricationAI_RL.analyze() called once per device (today's path)
+- batch:  LubricationAI_RL.analyze_batch() over all N controllers
+- kernel: decide_lubrication() on preassembled arrays (no dict/controller overhead)
+
+Usage:
+    python benchmarks/bench_batch_policy.py --sizes 1,100,10000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from energy_model.rl_policy import (
+    LUBRICATION_POLICY, TENSION_POLICY, LubricationAI_RL, TensionAI_RL, decide_lubrication, decide_tension,
+    policy_registry,
+)
+
+
+def rate(fn, n_decisions, min_time=0.5):
+    reps = 0
+    t0 = time.perf_counter()
+    while True:
+        fn()
+        reps += 1
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            return reps * n_decisions / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,100,10000')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lub_greedy = policy_registry.greedy(LUBRICATION_POLICY)
+    ten_greedy = policy_registry.greedy(TENSION_POLICY)
+
+    print(f"{'policy':<12}{'N':>7}{'loop/s':>14}{'batch/s':>14}{'kernel/s':>14}")
+    for n in [int(x) for x in args.sizes.split(',')]:
+        current = rng.uniform(9.0, 12.9, n)
+        temperature = rng.uniform(25.0, 54.0, n)
+        readings = [{"current_a": c, "temperature_c": t} for c, t in zip(current.tolist(), temperature.tolist())]
+        controllers = [LubricationAI_RL() for _ in range(n)]
+        cooldown = np.zeros(n, dtype=np.int64)
+
+        def loop():
+            for c, r in zip(controllers, readings):
+                c.cooldown = 0
+                c.analyze(r)
+
+        def batch():
+            for c in controllers:
+                c.cooldown = 0
+            LubricationAI_RL.analyze_batch(controllers, readings)
+
+        print(f"{'lubrication':<12}{n:>7}{rate(loop, n):>14.0f}{rate(batch, n):>14.0f}"
+              f"{rate(lambda: decide_lubrication(lub_greedy, current, temperature, cooldown), n):>14.0f}")
+
+        tension = rng.uniform(2.5, 12.0, n)
+        yarn_pct = rng.uniform(0.0, 100.0, n)
+        t_readings = [{"tension": t, "yarn_pct": y} for t, y in zip(tension.tolist(), yarn_pct.tolist())]
+        t_controllers = [TensionAI_RL() for _ in range(n)]
+
+        def t_loop():
+            for c, r in zip(t_controllers, t_readings):
+                c.analyze(r)
+
+        print(f"{'tension':<12}{n:>7}{rate(t_loop, n):>14.0f}"
+              f"{rate(lambda: TensionAI_RL.analyze_batch(t_controllers, t_readings), n):>14.0f}"
+              f"{rate(lambda: decide_tension(ten_greedy, tension, yarn_pct), n):>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Per-reading Socket.IO emits vs the tick-based TickBroadcaster.
+
+Simulates N devices each sending one reading per second to the server while C
+dashboards are connected, and pushes the resulting updates through a fake
+Socket.IO hub that, like python-socketio's broadcast path, JSON-encodes the
+packet once per recipient.
+
+- per-reading: device_update + full stats_update for every reading (old path)
+- tick:        TickBroadcaster.update_* per reading, flush() every tick
+- rooms:       tick, plus per-line rooms: devices are spread over --lines
+               production lines and each dashboard subscribes to one line
+
+Reports WebSocket frames/sec, bytes/sec and CPU seconds spent per simulated
+second (i.e. the fraction of one core used by the push path).
+
+Usage:
+    python benchmarks/bench_broadcast.py --devices 500 --clients 20 --tick-ms 250 --lines 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.broadcaster import TickBroadcaster
+from energy_model.subscriptions import device_room, line_room
+
+
+class FakeHub:
+    def __init__(self, clients, room_members=None):
+        self.clients = clients
+        self.room_members = room_members or {}
+        self.frames = 0
+        self.bytes = 0
+
+    def emit(self, event, payload, to=None):
+        recipients = self.clients if to is None else self.room_members.get(to, 0)
+        for _ in range(recipients):
+            packet = '42' + json.dumps([event, payload])
+            self.frames += 1
+            self.bytes += len(packet)
+
+
+def make_reading(rng, ip, d_type):
+    if d_type == "LUBRICATION_BOT":
+        data = {"device_type": d_type, "timestamp": time.strftime('%H:%M:%S'),
+                "current_a": round(rng.uniform(9.5, 13.0), 2), "temperature_c": round(rng.uniform(30.0, 50.0), 2)}
+    else:
+        data = {"device_type": d_type, "tension": round(rng.uniform(3.0, 6.0), 2),
+                "yarn_pct": round(rng.uniform(0, 100), 1), "power": round(rng.uniform(3.0, 5.0), 2)}
+    data["action"] = "INJECT" if rng.random() < 0.05 else "MONITOR"
+    return data
+
+
+def simulate(devices, clients, seconds, tick_s, mode, lines=1, seed=0):
+    rng = random.Random(seed)
+    keys = [(f"10.0.{i // 250}.{i % 250}", "LUBRICATION_BOT" if i % 2 else "TENSION_BOT") for i in range(devices)]
+    if mode == "rooms":
+        line_of = {f"{ip}_{t}": i % lines for i, (ip, t) in enumerate(keys)}
+        members = {}
+        for c in range(clients):
+            members[line_room(c % lines)] = members.get(line_room(c % lines), 0) + 1
+        hub = FakeHub(clients, members)
+        broadcaster = TickBroadcaster(hub.emit, interval=tick_s,
+                                      rooms_for=lambda key: [device_room(key), line_room(line_of[key])])
+    else:
+        hub = FakeHub(clients)
+        broadcaster = TickBroadcaster(hub.emit, interval=tick_s)
+    counters = {k: {"inject_count": 0, "optimize_count": 0} for k in keys}
+    stats = {"total_savings_kwh": 0.0, "total_savings_elec_cost": 0.0, "total_savings_oil_liters": 0.0,
+             "total_savings_cost": 0.0, "current_total_power": 0.0, "baseline_total_power": 0.0}
+    # Readings of one second are spread evenly over the second
+    offsets = sorted((rng.random(), k) for k in keys)
+    ticks_per_s = max(1, round(1 / tick_s))
+
+    t0 = time.process_time()
+    for second in range(seconds):
+        next_tick = 1
+        for offset, (ip, d_type) in offsets:
+            if mode != "per-reading":
+                while offset >= next_tick / ticks_per_s:
+                    broadcaster.flush()
+                    next_tick += 1
+            data = make_reading(rng, ip, d_type)
+            if data["action"] == "INJECT":
+                counters[(ip, d_type)]["inject_count"] += 1
+            stats["total_savings_kwh"] += 0.0001
+            stats["total_savings_cost"] += 0.00007
+            stats["current_total_power"] = round(rng.uniform(800, 1200), 2)
+            record = {"ip": ip, "type": d_type, "data": data, "last_seen": second + offset,
+                      "stats": dict(counters[(ip, d_type)])}
+            if mode != "per-reading":
+                broadcaster.update_device(f"{ip}_{d_type}", record)
+                broadcaster.update_stats(stats)
+            else:
+                hub.emit('device_update', record)
+                hub.emit('stats_update', stats)
+        if mode != "per-reading":
+            while next_tick <= ticks_per_s:
+                broadcaster.flush()
+                next_tick += 1
+    cpu = time.process_time() - t0
+    return hub.frames / seconds, hub.bytes / seconds, cpu / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=500)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--tick-ms', type=float, default=250)
+    parser.add_argument('--lines', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{args.devices} devices @ 1 Hz, {args.clients} dashboards, tick {args.tick_ms:.0f} ms, {args.lines} lines")
+    print(f"{'mode':<12}{'frames/s':>12}{'KB/s':>12}{'KB/s/client':>13}{'CPU %':>10}")
+    for mode in ("per-reading", "tick", "rooms"):
+        frames, nbytes, cpu = simulate(args.devices, args.clients, args.seconds, args.tick_ms / 1000.0, mode,
+                                       lines=args.lines)
+        print(f"{mode:<12}{frames:>12.0f}{nbytes / 1024:>12.0f}{nbytes / 1024 / args.clients:>13.1f}{cpu * 100:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
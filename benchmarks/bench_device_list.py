@@ -0,0 +1,126 @@
+"""
+/api/devices/list latency: query per request vs the cached DeviceDirectory.
+
+A minimal Flask app serves the device list the way backend_server_influx does
+(remote gateways merged with --sim local devices from a DeviceRegistry), once
+querying the remote gateway list on every request and once reading the
+background-refreshed DeviceDirectory. The remote query is simulated with
+--gateways ids and three conditions:
+
+- normal: answers after --latency-ms
+- slow:   answers after --slow-ms
+- down:   fails after --slow-ms (connection timeout)
+
+Requests go through Flask's test client; p50 / p99 / max are per request.
+
+Usage:
+    python benchmarks/bench_device_list.py --requests 200 --latency-ms 80 --slow-ms 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask, jsonify, request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.device_directory import DeviceDirectory
+from energy_model.device_registry import DeviceRegistry
+
+
+class Remote:
+    def __init__(self, gateways, latency):
+        self.gateways = [f"energy*{i // 50 + 1}*{i % 50 + 1}" for i in range(gateways)]
+        self.latency = latency
+        self.up = True
+
+    def query(self):
+        time.sleep(self.latency)
+        if not self.up:
+            raise ConnectionError("timed out")
+        return set(self.gateways)
+
+
+def make_app(remote, registry, directory):
+    app = Flask(__name__)
+
+    def local(devices):
+        for record in registry.records():
+            devices.add(record.key)
+        return sorted(devices)
+
+    @app.route('/per-request')
+    def per_request():
+        devices = set()
+        try:
+            devices.update(remote.query())
+        except Exception:
+            pass
+        return jsonify(local(devices))
+
+    @app.route('/cached')
+    def cached():
+        if request.args.get('refresh') == '1':
+            directory.request_refresh(wait=2.0)
+        response = jsonify(local(set(directory.devices())))
+        age = directory.age()
+        response.headers['X-Cache-Age'] = f"{age:.1f}" if age is not None else "-1"
+        return response
+
+    return app
+
+
+def measure(client, path, n):
+    times = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        r = client.get(path)
+        times.append(time.perf_counter() - t0)
+        assert r.status_code == 200
+    times.sort()
+    return (times[len(times) // 2] * 1000, times[min(len(times) - 1, int(len(times) * 0.99))] * 1000,
+            times[-1] * 1000, len(r.get_json()), r.headers.get('X-Cache-Age'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--gateways', type=int, default=300)
+    parser.add_argument('--sim', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--slow-ms', type=float, default=2000)
+    args = parser.parse_args()
+
+    remote = Remote(args.gateways, args.latency_ms / 1000.0)
+    registry = DeviceRegistry()
+    for i in range(args.sim):
+        registry.update(f"10.0.0.{i}_LUBRICATION_BOT", f"10.0.0.{i}", "LUBRICATION_BOT", {})
+    directory = DeviceDirectory(remote.query, interval=1.0, name="bench")
+    directory.start()
+    directory.request_refresh(wait=5)
+    client = make_app(remote, registry, directory).test_client()
+
+    print(f"{args.gateways} remote gateways + {args.sim} local devices")
+    print(f"{'remote':<8}{'endpoint':<13}{'requests':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'devices':>9}{'X-Cache-Age':>13}")
+    for condition in ("normal", "slow", "down"):
+        remote.latency = (args.latency_ms if condition == "normal" else args.slow_ms) / 1000.0
+        remote.up = condition != "down"
+        for path in ("/per-request", "/cached"):
+            # Querying per request is slow by construction; a few requests are enough
+            n = args.requests if path == "/cached" else max(3, min(args.requests, int(5 / remote.latency)))
+            p50, p99, worst, count, age = measure(client, path, n)
+            print(f"{condition:<8}{path:<13}{n:>9}{p50:>9.2f}{p99:>9.2f}{worst:>9.2f}{count:>9}{age or '':>13}")
+
+    remote.latency, remote.up = args.latency_ms / 1000.0, True
+    directory.request_refresh(wait=args.slow_ms / 1000.0 * 3)  # let the slow refresh in flight finish
+    t0 = time.perf_counter()
+    r = client.get('/cached?refresh=1')
+    print(f"forced refresh (?refresh=1): {(time.perf_counter() - t0) * 1000:.0f} ms, "
+          f"X-Cache-Age {r.headers['X-Cache-Age']}")
+    print(f"directory stats: {directory.stats()}")
+    directory.stop()
+
+
+if __name__ == "__main__":
+    main()
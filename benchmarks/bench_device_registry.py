@@ -0,0 +1,153 @@
+"""
+GLOBAL_STATE['devices'] dict-of-dicts vs the slotted DeviceRegistry.
+
+For both variants, every message updates the device's entry twice (before
+and after the AI decision), the way handle_message does:
+
+- dicts:    GLOBAL_STATE['devices'][key] = {"ip", "type", "data", "last_seen", "stats": {...}} (x2)
+- registry: DeviceRegistry.update(...) (x2), plus the to_dict bound method
+            handed to the broadcaster
+
+Sensor payloads are created before the measured section (the decoder creates
+them in both cases). Reported per variant, each in a fresh subprocess:
+
+- objects and bytes allocated per message: everything a message creates is kept
+  alive (replaced dicts / returned views go to a graveyard list) so CPython's
+  free lists cannot recycle it, and tracemalloc counts the growth
+- us per message
+- bytes retained and RSS growth with --devices registered devices
+
+Usage:
+    python benchmarks/bench_device_registry.py --devices 5000
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.device_registry import DeviceRegistry
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def payloads(n):
+    return [{"device_type": "LUBRICATION_BOT", "timestamp": "12:00:00",
+             "current_a": 10.0 + i % 30 / 10.0, "temperature_c": 35.0 + i % 20 / 2.0, "action": None}
+            for i in range(n)]
+
+
+class Graveyard(dict):
+    """dict that keeps replaced values alive, so their allocations stay visible."""
+    dead = None
+
+    def __setitem__(self, key, value):
+        if self.dead is not None and key in self:
+            self.dead.append(self[key])
+        super().__setitem__(key, value)
+
+
+def make_variant(name, dead):
+    if name == "dicts":
+        devices = Graveyard()
+        devices.dead = dead
+
+        def handle(key, ip, data, inject, optimize):
+            devices[key] = {"ip": ip, "type": "LUBRICATION_BOT", "data": data, "last_seen": time.time(),
+                            "stats": {"inject_count": inject, "optimize_count": optimize}}
+            data['action'] = 'MONITOR'
+            devices[key] = {"ip": ip, "type": "LUBRICATION_BOT", "data": data, "last_seen": time.time(),
+                            "stats": {"inject_count": inject, "optimize_count": optimize}}
+            return devices[key]
+        return handle
+
+    registry = DeviceRegistry()
+
+    def handle(key, ip, data, inject, optimize):
+        registry.update(key, ip, "LUBRICATION_BOT", data, inject_count=inject, optimize_count=optimize)
+        data['action'] = 'MONITOR'
+        record = registry.update(key, ip, "LUBRICATION_BOT", data, inject_count=inject, optimize_count=optimize)
+        return record.to_dict
+    return handle
+
+
+def run(name, n_devices, messages):
+    keys = [(f"10.{i // 65536}.{i // 256 % 256}.{i % 256}_LUBRICATION_BOT", f"10.{i // 65536}.{i // 256 % 256}.{i % 256}")
+            for i in range(n_devices)]
+    fill = payloads(n_devices)
+    msgs = payloads(messages)
+
+    # Fleet size: memory held once every device is registered (RSS measured without tracemalloc)
+    rss0 = rss_bytes()
+    handle = make_variant(name, None)
+    for (key, ip), data in zip(keys, fill):
+        handle(key, ip, data, 0, 0)
+    rss = rss_bytes() - rss0
+    fill = payloads(n_devices)
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    handle = make_variant(name, None)
+    for (key, ip), data in zip(keys, fill):
+        handle(key, ip, data, 0, 0)
+    retained = tracemalloc.get_traced_memory()[0] - base
+
+    # Steady state: known devices, new payloads; keep everything a message creates
+    dead = [None] * (messages * 3)
+    dead.clear()
+    handle = make_variant(name, dead)
+    for (key, ip), data in zip(keys, fill):
+        handle(key, ip, data, 0, 0)
+    del dead[:]
+    gc_objects = len(gc.get_objects())
+    before = tracemalloc.get_traced_memory()[0]
+    for i, data in enumerate(msgs):
+        key, ip = keys[i % n_devices]
+        dead.append(handle(key, ip, data, i, 0))
+    per_msg = (tracemalloc.get_traced_memory()[0] - before) / messages
+    objects = (len(gc.get_objects()) - gc_objects) / messages
+    tracemalloc.stop()
+    del dead[:]
+
+    handle = make_variant(name, None)
+    msgs = payloads(messages)
+    t0 = time.perf_counter()
+    for i, data in enumerate(msgs):
+        key, ip = keys[i % n_devices]
+        handle(key, ip, data, i, 0)
+    us = (time.perf_counter() - t0) / messages * 1e6
+    return {"bytes_per_msg": per_msg, "objects_per_msg": objects, "us_per_msg": us,
+            "retained": retained, "rss": rss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=5000)
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--variant', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run(args.variant, args.devices, args.messages)))
+        return
+
+    print(f"{args.devices} devices, {args.messages} messages")
+    print(f"{'variant':<10}{'GC objs/msg':>13}{'B alloc/msg':>13}{'us/msg':>9}{'fleet KiB':>11}{'fleet RSS KiB':>15}")
+    for name in ("dicts", "registry"):
+        out = subprocess.run([sys.executable, __file__, '--variant', name, '--devices', str(args.devices),
+                              '--messages', str(args.messages)], capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout)
+        print(f"{name:<10}{r['objects_per_msg']:>13.1f}{r['bytes_per_msg']:>13.0f}{r['us_per_msg']:>9.2f}"
+              f"{r['retained'] / 1024:>11.0f}{r['rss'] / 1024:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+JSON vs binary device encoding: bytes per reading and CPU time per 100k decodes.
+
+Decoding goes through energy_model.protocol.FrameDecoder, fed in recv()-sized
+chunks, which is what the ingestion servers do. Reply encoding goes through
+encode_message() with the connection's encoding.
+
+Usage:
+    python benchmarks/bench_encoding.py --count 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.protocol import ENCODING_BINARY, ENCODING_JSON, FrameDecoder, encode_message
+
+SAMPLES = {
+    "LUBRICATION_BOT": lambda rng: {
+        "device_type": "LUBRICATION_BOT",
+        "timestamp": "%02d:%02d:%02d" % (rng.randrange(24), rng.randrange(60), rng.randrange(60)),
+        "current_a": round(rng.uniform(9.5, 14.0), 2),
+        "temperature_c": round(rng.uniform(25.0, 60.0), 2),
+    },
+    "TENSION_BOT": lambda rng: {
+        "device_type": "TENSION_BOT",
+        "tension": round(rng.uniform(2.5, 12.0), 2),
+        "yarn_pct": round(rng.uniform(0, 100), 1),
+        "power": round(rng.uniform(3.0, 5.0), 2),
+    },
+}
+
+REPLY = {"action": "MONITOR", "msg": "Running"}
+
+
+def chunked(frames, per_chunk=32):
+    return [b''.join(frames[i:i + per_chunk]) for i in range(0, len(frames), per_chunk)]
+
+
+def bench_decode(chunks):
+    decoder = FrameDecoder()
+    t0 = time.process_time()
+    n = 0
+    for chunk in chunks:
+        n += len(decoder.feed(chunk))
+    return n, time.process_time() - t0
+
+
+def bench_encode(count, encoding):
+    t0 = time.process_time()
+    for _ in range(count):
+        encode_message(REPLY, encoding)
+    return time.process_time() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    scale = 100000 / args.count
+
+    print(f"{'device':<17}{'encoding':<9}{'bytes/reading':>14}{'decode ms/100k':>16}")
+    for device_type, make in SAMPLES.items():
+        readings = [make(rng) for _ in range(args.count)]
+        for encoding in (ENCODING_JSON, ENCODING_BINARY):
+            frames = [encode_message(r, encoding) for r in readings]
+            size = sum(len(f) for f in frames) / len(frames)
+            n, cpu = bench_decode(chunked(frames))
+            assert n == args.count, (n, args.count)
+            print(f"{device_type:<17}{encoding:<9}{size:>14.1f}{cpu * scale * 1000:>16.1f}")
+
+    print()
+    print(f"{'reply':<17}{'encoding':<9}{'bytes/reply':>14}{'encode ms/100k':>16}")
+    for encoding in (ENCODING_JSON, ENCODING_BINARY):
+        size = len(encode_message(REPLY, encoding))
+        cpu = bench_encode(args.count, encoding)
+        print(f"{'MONITOR':<17}{encoding:<9}{size:>14}{cpu * scale * 1000:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
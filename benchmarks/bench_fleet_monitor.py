@@ -0,0 +1,122 @@
+"""
+Monitoring cycle time vs number of gateways: sequential loop vs FleetMonitor.
+
+The /api/v2/query stand-in from bench_rolling_window runs in a child process
+(so it does not compete with the monitor for the GIL) and adds --latency-ms to
+every answer, standing in for the round trip to the remote monitor database.
+Each gateway has its own RollingWindow over --minutes of readings, one every
+--interval-s seconds.
+
+For every gateway count, both variants run a first cycle (full window fetch)
+and then --cycles steady cycles, the simulated clock advancing one minute
+between cycles:
+
+- sequential: refresh + analyze one gateway after another (the old loop)
+- fleet:      FleetMonitor with --query-workers concurrent queries and
+              --analysis-workers analysis threads
+
+Usage:
+    python benchmarks/bench_fleet_monitor.py --gateways 50,100,200,300 --latency-ms 100
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_rolling_window import StandIn, analyze
+from energy_model.fleet_monitor import FleetMonitor
+from energy_model.influx_connector import InfluxConnector
+from energy_model.rolling_window import RollingWindow
+
+
+class SharedClockStandIn(StandIn):
+    clock = None
+
+    @property
+    def now(self):
+        return self.clock.value
+
+    @now.setter
+    def now(self, value):
+        pass
+
+
+def serve(clock, interval_s, latency, port_queue):
+    SharedClockStandIn.clock = clock
+    stand_in = SharedClockStandIn(interval_s, 0, latency)
+    port_queue.put(stand_in.url)
+    while True:
+        time.sleep(3600)
+
+
+def run(url, clock, t0, gateways, args, concurrent):
+    connector = InfluxConnector(url, "t", "bench", "bench", connection_pool_maxsize=args.query_workers)
+    windows = {g: RollingWindow(connector, g, minutes=args.minutes) for g in gateways}
+
+    def fetch(device_id):
+        return windows[device_id].refresh(now=pd.Timestamp(clock.value, unit='s', tz='UTC'))
+
+    def analyze_device(device_id, df):
+        return analyze(df)
+
+    monitor = FleetMonitor(fetch, analyze_device, query_workers=args.query_workers,
+                           analysis_workers=args.analysis_workers, device_timeout=args.device_timeout,
+                           cycle_budget=3600)
+    times, analyzed = [], []
+    for cycle in range(args.cycles + 1):
+        clock.value = t0 + cycle * 60
+        c0 = time.perf_counter()
+        if concurrent:
+            results = monitor.run_cycle(gateways)
+        else:
+            results = {}
+            for g in gateways:
+                df = fetch(g)
+                if df is not None:
+                    results[g] = analyze_device(g, df)
+        times.append(time.perf_counter() - c0)
+        analyzed.append(len(results))
+    monitor.close()
+    connector.close()
+    return times[0], sum(times[1:]) / max(1, len(times) - 1), min(analyzed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gateways', default="50,100,200,300")
+    parser.add_argument('--latency-ms', type=float, default=100)
+    parser.add_argument('--interval-s', type=int, default=60)
+    parser.add_argument('--minutes', type=int, default=1440)
+    parser.add_argument('--cycles', type=int, default=2)
+    parser.add_argument('--query-workers', type=int, default=8)
+    parser.add_argument('--analysis-workers', type=int, default=None)
+    parser.add_argument('--device-timeout', type=float, default=20)
+    args = parser.parse_args()
+
+    t0 = int(time.time()) // 60 * 60
+    clock = multiprocessing.Value('d', t0)
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(clock, args.interval_s, args.latency_ms / 1000.0, ports),
+                                     daemon=True)
+    server.start()
+    url = ports.get(timeout=30)
+
+    print(f"{args.latency_ms:.0f} ms query latency, {args.minutes} min window, one reading every {args.interval_s} s, "
+          f"{args.query_workers} query workers, {args.analysis_workers or os.cpu_count()} analysis workers "
+          f"({os.cpu_count()} CPUs)")
+    print(f"{'gateways':>9}{'seq first s':>13}{'seq cycle s':>13}{'fleet first s':>15}{'fleet cycle s':>15}{'analyzed':>10}")
+    for n in [int(x) for x in args.gateways.split(',')]:
+        gateways = [f"energy*{i // 50 + 1}*{i % 50 + 1}" for i in range(n)]
+        seq_first, seq_cycle, _ = run(url, clock, t0, gateways, args, concurrent=False)
+        fleet_first, fleet_cycle, analyzed = run(url, clock, t0, gateways, args, concurrent=True)
+        print(f"{n:>9}{seq_first:>13.1f}{seq_cycle:>13.1f}{fleet_first:>15.1f}{fleet_cycle:>15.1f}{analyzed:>10}")
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Decoding a long raw pull: query_data_frame() vs the streaming FluxCSVDecoder.
+
+The parent process builds one annotated-CSV response (pivoted NUMERIC_FIELDS,
+one row per --interval-s seconds over --days days) and serves it over HTTP.
+Each variant runs in a fresh child process; after a small warm-up query it
+reports wall time and peak RSS growth (Linux /proc) for the full pull:
+
+- dataframe: the previous InfluxConnector path (query_data_frame, to_datetime,
+             set_index, apply(pd.to_numeric))
+- stream:    InfluxConnector._fetch_fields() on the streaming decoder (whole frame)
+- chunks:    InfluxConnector.iter_frames(), consuming --chunk-rows rows at a time
+
+The children also report a checksum of the decoded values so the variants can
+be compared.
+
+Usage:
+    python benchmarks/bench_flux_decode.py --days 7 --interval-s 1
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.influx_connector import InfluxConnector, NUMERIC_FIELDS
+
+DEVICE = "energy*1*1"
+START = pd.Timestamp("2026-01-01", tz="UTC")
+
+
+def build_payload(days, interval_s):
+    stamps = np.datetime64(START.tz_localize(None), 's') + np.arange(0, int(days * 86400), interval_s)
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({f: np.round(100 + rng.standard_normal(len(stamps)).cumsum() * 0.1, 3)
+                          for f in NUMERIC_FIELDS})
+    frame.insert(0, "_time", np.char.add(np.datetime_as_string(stamps, unit='s'), 'Z'))
+    frame.insert(0, "table", 0)
+    frame.insert(0, "result", "")
+    frame.insert(0, "", "")
+    header = "\r\n".join([
+        "#datatype,string,long,dateTime:RFC3339," + ",".join(["double"] * len(NUMERIC_FIELDS)),
+        "#group,false,false,false," + ",".join(["false"] * len(NUMERIC_FIELDS)),
+        "#default,_result,,," + "," * (len(NUMERIC_FIELDS) - 1),
+        ",result,table,_time," + ",".join(NUMERIC_FIELDS),
+    ]) + "\r\n"
+    return (header + frame.to_csv(header=False, index=False, lineterminator="\r\n") + "\r\n").encode()
+
+
+def serve(payload, warmup):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            # Queries with a range stop are the children's warm-up runs: answer with a few rows
+            data = warmup if b'stop:' in body else payload
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def proc_status_kib(key):
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(key + ':'))
+
+
+def run(connector, mode, chunk_rows, stop=None):
+    range_stop = None if stop is None else connector._range_start(stop)
+    if mode == "dataframe":
+        df = connector.query_api.query_data_frame(
+            connector._flux(connector._range_start(START), DEVICE, range_stop=range_stop))
+        df['_time'] = pd.to_datetime(df['_time'])
+        df = df.set_index('_time')
+        df = df[[c for c in NUMERIC_FIELDS if c in df.columns]].apply(pd.to_numeric, errors='coerce').sort_index()
+        return len(df), float(np.nansum(df.values))
+    if mode == "stream":
+        df = connector._fetch_fields(connector._range_start(START), DEVICE) if stop is None else \
+            pd.concat(connector.iter_frames(START, stop, DEVICE))
+        return len(df), float(np.nansum(df.values))
+    rows, checksum = 0, 0.0
+    for frame in connector.iter_frames(START, stop, DEVICE, chunk_rows=chunk_rows):
+        rows += len(frame)
+        checksum += float(np.nansum(frame.values))
+    return rows, checksum
+
+
+def child(mode, url, chunk_rows):
+    connector = InfluxConnector(url, "t", "bench", "bench")
+    run(connector, mode, chunk_rows, stop=START + pd.Timedelta(hours=1))  # warm up (lazy imports, connection)
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')  # reset the peak (VmHWM) to the current RSS
+    baseline = proc_status_kib('VmRSS')
+    t0 = time.perf_counter()
+    rows, checksum = run(connector, mode, chunk_rows)
+    seconds = time.perf_counter() - t0
+    peak = proc_status_kib('VmHWM') - baseline
+    print(f"{rows} {checksum:.3f} {seconds:.3f} {peak / 1024:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--interval-s', type=int, default=1)
+    parser.add_argument('--chunk-rows', type=int, default=65536)
+    parser.add_argument('--modes', default="dataframe,stream,chunks")
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'URL'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], args.child[1], args.chunk_rows)
+        return
+
+    payload = build_payload(args.days, args.interval_s)
+    url = serve(payload, build_payload(1 / 24.0, args.interval_s))
+    rows = int(args.days * 86400) // args.interval_s
+    print(f"{args.days:g} days at {args.interval_s} s: {rows} rows, {len(payload) / 2**20:.0f} MiB of CSV")
+    print(f"{'mode':<11}{'rows':>10}{'seconds':>10}{'peak MiB':>11}{'checksum':>18}")
+    for mode in args.modes.split(','):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--chunk-rows', str(args.chunk_rows),
+                              '--child', mode, url], capture_output=True, text=True)
+        if out.returncode:
+            print(f"{mode:<11} failed: {out.stderr.strip().splitlines()[-1]}")
+            continue
+        rows, checksum, seconds, peak = out.stdout.split()[-4:]
+        print(f"{mode:<11}{rows:>10}{float(seconds):>10.2f}{float(peak):>11.0f}{checksum:>18}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Burst test for the device socket framing.
+
+Replays a burst of readings as recv() chunks: each chunk carries 1..k whole
+readings coalesced together, and with some probability the last one is cut and
+finishes in the next chunk. Counts how many readings each parser recovers:
+
+- legacy: the old handle_client path, json.loads() on each recv(1024) chunk
+- framed: energy_model.protocol.FrameDecoder on the newline-delimited stream
+
+Usage:
+    python benchmarks/bench_framing.py --readings 200000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.protocol import FrameDecoder, encode_frame
+
+
+def make_readings(n, rng):
+    readings = []
+    for i in range(n):
+        if i % 2:
+            readings.append({
+                "device_type": "TENSION_BOT",
+                "tension": round(rng.uniform(2.5, 12.0), 2),
+                "yarn_pct": round(rng.uniform(0, 100), 1),
+                "power": round(rng.uniform(3.0, 5.0), 2),
+            })
+        else:
+            readings.append({
+                "device_type": "LUBRICATION_BOT",
+                "timestamp": "12:00:%02d" % (i % 60),
+                "current_a": round(rng.uniform(9.5, 14.0), 2),
+                "temperature_c": round(rng.uniform(25.0, 60.0), 2),
+            })
+    return readings
+
+
+def segment(frames, rng, max_coalesce, split_prob):
+    """Group encoded readings into recv() chunks the way a busy socket delivers them."""
+    chunks = []
+    carry = b''
+    i = 0
+    while i < len(frames):
+        n = rng.randint(1, max_coalesce)
+        chunk = carry + b''.join(frames[i:i + n])
+        i += n
+        carry = b''
+        if i < len(frames) and rng.random() < split_prob:
+            cut = rng.randint(1, len(frames[i]) - 1)
+            chunk += frames[i][:cut]
+            carry = frames[i][cut:]
+            i += 1
+        chunks.append(chunk)
+    if carry:
+        chunks.append(carry)
+    return chunks
+
+
+def legacy_parse(chunks):
+    recovered = 0
+    for data in chunks:
+        try:
+            json.loads(data.decode('utf-8'))
+            recovered += 1
+        except:
+            continue
+    return recovered
+
+
+def framed_parse(chunks):
+    decoder = FrameDecoder()
+    recovered = 0
+    for data in chunks:
+        recovered += len(decoder.feed(data))
+    return recovered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readings', type=int, default=200000)
+    parser.add_argument('--max-coalesce', type=int, default=3, help="max readings merged into one recv()")
+    parser.add_argument('--split-prob', type=float, default=0.1, help="chance a reading is split across two recv()s")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    readings = make_readings(args.readings, rng)
+
+    legacy_frames = [json.dumps(r).encode('utf-8') for r in readings]
+    framed_frames = [encode_frame(r) for r in readings]
+    legacy_chunks = segment(legacy_frames, random.Random(args.seed), args.max_coalesce, args.split_prob)
+    framed_chunks = segment(framed_frames, random.Random(args.seed), args.max_coalesce, args.split_prob)
+
+    print(f"{args.readings} readings, 1..{args.max_coalesce} per recv(), split probability {args.split_prob}")
+    print(f"{'parser':<8}{'recovered':>12}{'lost %':>9}{'wall s':>9}{'readings/s':>14}")
+    for name, fn, chunks in (("legacy", legacy_parse, legacy_chunks), ("framed", framed_parse, framed_chunks)):
+        t0 = time.perf_counter()
+        recovered = fn(chunks)
+        elapsed = time.perf_counter() - t0
+        lost = 100.0 * (args.readings - recovered) / args.readings
+        print(f"{name:<8}{recovered:>12}{lost:>9.1f}{elapsed:>9.3f}{recovered / elapsed:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
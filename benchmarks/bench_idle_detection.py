@@ -0,0 +1,118 @@
+"""
+Idle detection: the previous groupby + per-block loop vs the NumPy run-length version.
+
+Synthetic power (kW) at 1-minute resolution for --days days: shifts of
+production with idle stretches of random length, noise, and a few missing
+samples (NaN). Variants:
+
+- loop:     the previous EnergyOptimizer.detect_idle_state (cumsum groups, one
+            Python iteration per block), device by device
+- frame:    EnergyOptimizer.detect_idle_state (run-length), device by device
+- many:     EnergyOptimizer.detect_idle_state_many on the (devices, samples) array
+
+Each variant is timed for 1 and --devices devices; idle hours, wasted energy and
+event counts are checked against the loop.
+
+Usage:
+    python benchmarks/bench_idle_detection.py --days 30 --devices 300
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.optimization import EnergyOptimizer
+
+
+def legacy_detect_idle_state(df, threshold_power=None, duration_minutes=30, resample_interval_minutes=5):
+    """detect_idle_state before the run-length rewrite (power column 'pt')."""
+    power = df['pt']
+    if threshold_power is None:
+        active_power = power[power > 0.1]
+        if active_power.empty:
+            return {"idle_hours": 0, "wasted_energy": 0}
+        threshold_power = active_power.quantile(0.15)
+    is_idle = power < threshold_power
+    groups = is_idle.ne(is_idle.shift()).cumsum()
+    idle_events = []
+    total_wasted_energy = 0
+    total_idle_time = 0
+    for _, block in df[is_idle].groupby(groups):
+        duration = len(block) * resample_interval_minutes
+        if duration >= duration_minutes:
+            avg_power = block['pt'].mean()
+            energy = (avg_power * duration) / 60.0
+            idle_events.append({"start_time": block.index.min(), "end_time": block.index.max(),
+                                "duration_minutes": duration, "avg_power": avg_power, "wasted_energy_kwh": energy})
+            total_wasted_energy += energy
+            total_idle_time += duration
+    return {"threshold_used": threshold_power, "total_idle_hours": total_idle_time / 60.0,
+            "total_wasted_energy_kwh": total_wasted_energy, "idle_events_count": len(idle_events),
+            "events": pd.DataFrame(idle_events)}
+
+
+def synthetic_power(devices, samples, seed=0, idle_minutes=(5, 120)):
+    rng = np.random.default_rng(seed)
+    power = np.empty((devices, samples))
+    for d in range(devices):
+        # Alternating busy (30 min - 8 h) and idle (default 5 min - 2 h) stretches, each at its own level
+        stretches = samples // 60 + 2
+        busy = np.arange(stretches) % 2 == 0
+        lengths = np.where(busy, rng.integers(30, 480, stretches), rng.integers(*idle_minutes, stretches))
+        levels = np.where(busy, rng.uniform(40, 80, stretches), rng.uniform(3, 10, stretches))
+        noise = np.where(busy, 1.5, 0.2)
+        series = np.repeat(levels, lengths)[:samples]
+        power[d] = series + rng.normal(0, 1, samples) * np.repeat(noise, lengths)[:samples]
+    power[rng.random(power.shape) < 0.001] = np.nan
+    return power
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--devices', type=int, default=300)
+    parser.add_argument('--duration-minutes', type=int, default=15)
+    args = parser.parse_args()
+
+    samples = args.days * 1440
+    index = pd.date_range("2026-01-01", periods=samples, freq="1min", tz="UTC")
+    power = synthetic_power(args.devices, samples)
+    frames = [pd.DataFrame({"pt": row}, index=index) for row in power]
+    kwargs = dict(duration_minutes=args.duration_minutes, resample_interval_minutes=1)
+
+    print(f"{args.days} days at 1 minute ({samples} samples per device), idle runs >= {args.duration_minutes} min")
+    print(f"{'devices':>8}{'variant':>8}{'ms':>11}{'per device ms':>15}{'events':>9}{'matches loop':>14}")
+    for n in (1, args.devices):
+        legacy, loop_s = timed(lambda: [legacy_detect_idle_state(f, **kwargs) for f in frames[:n]])
+        frame, frame_s = timed(lambda: [EnergyOptimizer(f).detect_idle_state(**kwargs) for f in frames[:n]])
+        many, many_s = timed(lambda: EnergyOptimizer.detect_idle_state_many(power[:n], index, **kwargs))
+
+        hours = np.array([r["total_idle_hours"] for r in legacy])
+        energy = np.array([r["total_wasted_energy_kwh"] for r in legacy])
+        counts = np.array([r["idle_events_count"] for r in legacy])
+        frame_ok = all(
+            a["idle_events_count"] == b["idle_events_count"]
+            and np.isclose(a["total_wasted_energy_kwh"], b["total_wasted_energy_kwh"])
+            and a["total_idle_hours"] == b["total_idle_hours"]
+            and (not len(a["events"]) or (a["events"]["start_time"].equals(b["events"]["start_time"])
+                                          and a["events"]["end_time"].equals(b["events"]["end_time"])))
+            for a, b in zip(legacy, frame))
+        many_ok = (np.array_equal(many["idle_events_count"], counts) and np.allclose(many["total_idle_hours"], hours)
+                   and np.allclose(many["total_wasted_energy_kwh"], energy))
+        for name, seconds, ok in (("loop", loop_s, True), ("frame", frame_s, frame_ok), ("many", many_s, many_ok)):
+            print(f"{n:>8}{name:>8}{seconds * 1000:>11.1f}{seconds * 1000 / n:>15.2f}{counts.sum():>9}{str(ok):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Per-request InfluxDB clients vs the shared InfluxClientPool.
+
+get_device_list / switch_device used to build an InfluxDBClient per HTTP
+request and close it afterwards, so every dashboard click opened a new
+connection to the remote database. This replays --requests such queries
+(InfluxConnector.query_recent_data over 10 minutes, what switch_device runs)
+against the /api/v2/query stand-in from bench_rolling_window, which adds
+--connect-ms to every new connection and --latency-ms to every answer, from
+--threads concurrent callers:
+
+- per-request: InfluxConnector(...) + query + close() per call
+- pooled:      InfluxClientPool.connector(...) (shared keep-alive client)
+
+Reports ms per request, connections opened and the pool's own stats.
+
+Usage:
+    python benchmarks/bench_influx_pool.py --requests 200 --threads 4 --connect-ms 30 --latency-ms 20
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_rolling_window import StandIn
+from energy_model.influx_connector import InfluxConnector
+from energy_model.influx_pool import InfluxClientPool
+
+DEVICE = "energy*1*1"
+
+
+def run(stand_in, requests, threads, make_connector, release):
+    c0 = stand_in.connections
+    per_thread = requests // threads
+    errors = []
+
+    def worker():
+        for _ in range(per_thread):
+            connector = make_connector()
+            try:
+                if connector.query_recent_data(minutes=10, device_id=DEVICE) is None:
+                    errors.append("empty")
+            finally:
+                release(connector)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - t0
+    done = per_thread * threads
+    return elapsed / done * threads * 1000, stand_in.connections - c0, done / elapsed, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--connect-ms', type=float, default=30)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    stand_in = StandIn(60, int(time.time()) // 60 * 60, args.latency_ms / 1000.0, args.connect_ms / 1000.0)
+    pool = InfluxClientPool()
+
+    print(f"{args.requests} queries from {args.threads} threads, {args.connect_ms:.0f} ms connection setup, "
+          f"{args.latency_ms:.0f} ms per answer")
+    print(f"{'clients':<13}{'ms/request':>12}{'requests/s':>12}{'connections':>13}{'errors':>8}")
+    rows = (
+        ("per-request", lambda: InfluxConnector(stand_in.url, "t", "bench", "bench"), lambda c: c.close()),
+        ("pooled", lambda: pool.connector(stand_in.url, "t", "bench", "bench"), lambda c: c.close()),
+    )
+    for name, make, release in rows:
+        ms, connections, rate, errors = run(stand_in, args.requests, args.threads, make, release)
+        print(f"{name:<13}{ms:>12.1f}{rate:>12.1f}{connections:>13}{errors:>8}")
+    print("pool stats:")
+    print(json.dumps(pool.stats(), indent=2))
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+InfluxDB write path: per-point writes vs InfluxWritePipeline, and an outage.
+
+Runs a local HTTP stand-in for InfluxDB's /api/v2/write endpoint (counts the
+line-protocol points it accepts, or answers 503 while "down") and drives it
+with the real influxdb_client.
+
+1. Throughput: points/sec delivered by
+   - legacy:   Point per reading through write_api(WriteOptions(batch_size=1)),
+               i.e. what the server did before
+   - pipeline: InfluxWritePipeline.submit() + a SYNCHRONOUS write_api
+2. Outage: --devices readings/sec for --outage-min simulated minutes while the
+   stand-in is down (time is compressed: points are submitted back to back with
+   synthetic timestamps), then the stand-in comes back. Reports the Python heap
+   peak during the outage (tracemalloc), spool size, replay time, points lost
+   and whether replay preserved timestamp order.
+
+Usage:
+    python benchmarks/bench_influx_writer.py --points 20000 --devices 500 --outage-min 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from influxdb_client import InfluxDBClient, Point, WriteOptions, WritePrecision
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+from energy_model.influx_writer import InfluxWritePipeline
+
+BUCKET = "bench"
+ORG = "bench"
+
+
+class StandIn:
+    """Minimal /api/v2/write endpoint."""
+
+    def __init__(self):
+        self.up = True
+        self.points = 0
+        self.requests = 0
+        self.timestamps = []
+        self.keep_timestamps = False
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not stand_in.up:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                lines = [l for l in body.split(b'\n') if l]
+                stand_in.points += len(lines)
+                stand_in.requests += 1
+                if stand_in.keep_timestamps:
+                    stand_in.timestamps.extend(int(l.rsplit(b' ', 1)[1]) for l in lines)
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def wait_for(self, n, timeout=120):
+        deadline = time.time() + timeout
+        while self.points < n and time.time() < deadline:
+            time.sleep(0.005)
+        return self.points >= n
+
+
+def reading(i):
+    return {"device_ip": f"10.0.{i // 250 % 250}.{i % 250}", "device_type": "LUBRICATION_BOT"}, \
+           {"current_a": 10.0 + (i % 40) / 10.0, "temperature_c": 35.0 + (i % 20) / 2.0}
+
+
+def bench_legacy(stand_in, n):
+    client = InfluxDBClient(url=stand_in.url, token="t", org=ORG)
+    write_api = client.write_api(write_options=WriteOptions(batch_size=1, flush_interval=1000))
+    start = stand_in.points
+    t0 = time.perf_counter()
+    for i in range(n):
+        tags, fields = reading(i)
+        p = Point("sensor_metrics").tag("device_ip", tags["device_ip"]).tag("device_type", tags["device_type"])
+        for k, v in fields.items():
+            p.field(k, v)
+        write_api.write(bucket=BUCKET, org=ORG, record=p)
+    stand_in.wait_for(start + n)
+    elapsed = time.perf_counter() - t0
+    write_api.close()
+    client.close()
+    return (stand_in.points - start) / elapsed, stand_in.requests
+
+
+def make_pipeline(stand_in, spool_path, **kwargs):
+    client = InfluxDBClient(url=stand_in.url, token="t", org=ORG)
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+
+    def write_lines(body):
+        write_api.write(bucket=BUCKET, org=ORG, record=body, write_precision=WritePrecision.NS)
+
+    return InfluxWritePipeline(write_lines, spool_path=spool_path, **kwargs), client
+
+
+def bench_pipeline(stand_in, n, spool_path):
+    pipeline, client = make_pipeline(stand_in, spool_path, flush_interval=0.05)
+    pipeline.start()
+    start, req0 = stand_in.points, stand_in.requests
+    t0 = time.perf_counter()
+    for i in range(n):
+        tags, fields = reading(i)
+        pipeline.submit("sensor_metrics", tags, fields)
+    stand_in.wait_for(start + n)
+    elapsed = time.perf_counter() - t0
+    pipeline.close()
+    client.close()
+    return (stand_in.points - start) / elapsed, stand_in.requests - req0
+
+
+def bench_outage(stand_in, devices, minutes, spool_path, max_queue):
+    total = devices * minutes * 60
+    pipeline, client = make_pipeline(stand_in, spool_path, flush_interval=0.05, retry_interval=0.2,
+                                     max_queue=max_queue)
+    stand_in.up = False
+    stand_in.keep_timestamps = True
+    start = stand_in.points
+    pipeline.start()
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t0_ns = time.time_ns() - minutes * 60 * 10**9
+    for i in range(total):
+        tags, fields = reading(i % devices)
+        # One reading per device per second of simulated outage
+        pipeline.submit("sensor_metrics", tags, fields, t0_ns + (i // devices) * 10**9 + i % devices)
+    time.sleep(0.5)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    spool_bytes = len(pipeline.spool)
+
+    t0 = time.perf_counter()
+    stand_in.up = True
+    stand_in.wait_for(start + total, timeout=600)
+    replay = time.perf_counter() - t0
+    pipeline.close()
+    client.close()
+
+    received = stand_in.points - start
+    ts = stand_in.timestamps
+    in_order = all(a < b for a, b in zip(ts, ts[1:]))
+    return total, peak, spool_bytes, replay, total - received, in_order, pipeline.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=20000)
+    parser.add_argument('--legacy-points', type=int, default=2000)
+    parser.add_argument('--devices', type=int, default=500)
+    parser.add_argument('--outage-min', type=float, default=10)
+    parser.add_argument('--max-queue', type=int, default=10000)
+    args = parser.parse_args()
+
+    stand_in = StandIn()
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'writer':<10}{'points/s':>12}{'HTTP requests':>16}")
+        rate, reqs = bench_legacy(stand_in, args.legacy_points)
+        print(f"{'legacy':<10}{rate:>12.0f}{reqs:>16}")
+        rate, reqs = bench_pipeline(stand_in, args.points, os.path.join(tmp, "tp.lp"))
+        print(f"{'pipeline':<10}{rate:>12.0f}{reqs:>16}")
+
+        total, peak, spool_bytes, replay, lost, in_order, stats = bench_outage(
+            stand_in, args.devices, int(args.outage_min), os.path.join(tmp, "outage.lp"), args.max_queue)
+        print()
+        print(f"outage: {args.devices} devices x {args.outage_min:.0f} min = {total} points, queue cap {args.max_queue}")
+        print(f"  heap peak during outage : {peak / 1024 / 1024:.1f} MiB")
+        print(f"  spool on disk           : {spool_bytes / 1024 / 1024:.1f} MiB")
+        print(f"  replay after reconnect  : {replay:.1f} s ({total / replay:.0f} points/s)")
+        print(f"  points lost             : {lost}")
+        print(f"  timestamp order kept    : {in_order}")
+        print(f"  stats                   : {stats}")
+
+
+if __name__ == "__main__":
+    main()
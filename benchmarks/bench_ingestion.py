@@ -0,0 +1,199 @@
+"""
+Ingestion benchmark: threaded vs asyncio device servers.
+
+Starts the ingestion server in a child process with a lightweight handler that
+runs the same bucket + Q-table decision as LubricationAI_RL, then drives it with
+N concurrent simulated devices (closed loop: send reading, wait for reply).
+
+With --sink-ms, every --log-every-th reading also writes an event log to a
+sink that takes that long (a stand-in for add_system_log's MySQL insert), either
+inline in the handler or through a SideEffectQueue worker (--sinks).
+
+Usage:
+    python benchmarks/bench_ingestion.py                      # 100 / 1000 / 5000 conns, both modes
+    python benchmarks/bench_ingestion.py --conns 100 --duration 5 --modes asyncio
+    python benchmarks/bench_ingestion.py --conns 100 --modes asyncio --sink-ms 20 --sinks inline,queued
+
+5,000 connections need `ulimit -n` above ~10,000 (the script raises the soft
+limit up to the hard limit on its own).
+"""
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.ingestion import IngestHandler, SideEffectQueue, create_ingest_server
+from energy_model.protocol import encode_frame
+
+
+def raise_fd_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+class BenchHandler(IngestHandler):
+    """Decision path equivalent to LubricationAI_RL.analyze without DB side effects."""
+
+    def __init__(self, sink_ms=0.0, log_every=100, sink="inline"):
+        import numpy as np
+        self.np = np
+        self.q_table = np.zeros((10, 10, 2))
+        self.q_table[:, 6:, 1] = 10.0
+        self.sink_s = sink_ms / 1000.0
+        self.log_every = log_every
+        self.side_effects = SideEffectQueue() if sink == "queued" else None
+        self.readings = 0
+
+    def log_event(self):
+        """Slow sink (MySQL insert stand-in)."""
+        time.sleep(self.sink_s)
+
+    def open_session(self, addr):
+        return {"cooldown": 0}
+
+    def handle_message(self, session, message):
+        self.readings += 1
+        if self.sink_s and self.readings % self.log_every == 0:
+            if self.side_effects is None:
+                self.log_event()
+            else:
+                self.side_effects.submit(self.log_event)
+        if session["cooldown"] > 0:
+            session["cooldown"] -= 1
+            return {"action": "MONITOR", "msg": "Cooldown"}
+        curr = message.get('current_a', 10.0)
+        temp = message.get('temperature_c', 40.0)
+        curr_idx = int(min(9, max(0, (curr - 9.0) * 2)))
+        temp_idx = int(min(9, max(0, (temp - 25.0) / 5)))
+        if self.np.argmax(self.q_table[curr_idx, temp_idx]) == 1:
+            session["cooldown"] = 5
+            return {"action": "INJECT", "msg": "🧠 RL决策喷油"}
+        return {"action": "MONITOR", "msg": "Running"}
+
+
+def serve(mode, sink_ms=0.0, log_every=100, sink="inline"):
+    raise_fd_limit()
+    server = create_ingest_server(mode, BenchHandler(sink_ms, log_every, sink), '127.0.0.1', 0)
+
+    def announce_port():
+        server.ready.wait()
+        print(server.port, flush=True)
+
+    threading.Thread(target=announce_port, daemon=True).start()
+    server.serve_forever()
+
+
+READING = encode_frame({
+    "device_type": "LUBRICATION_BOT",
+    "timestamp": "12:00:00",
+    "current_a": 10.5,
+    "temperature_c": 42.0,
+})
+
+
+async def _device(port, stop_at, latencies, counter):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        counter["failed"] += 1
+        return
+    try:
+        while time.perf_counter() < stop_at:
+            t0 = time.perf_counter()
+            writer.write(READING)
+            await writer.drain()
+            data = await reader.readline()
+            if not data:
+                break
+            latencies.append(time.perf_counter() - t0)
+    except OSError:
+        counter["failed"] += 1
+    finally:
+        writer.close()
+
+
+def _client_worker(args):
+    port, conns, duration = args
+    raise_fd_limit()
+    latencies = []
+    counter = {"failed": 0}
+
+    async def main():
+        stop_at = time.perf_counter() + duration
+        await asyncio.gather(*[_device(port, stop_at, latencies, counter) for _ in range(conns)])
+
+    asyncio.run(main())
+    return latencies, counter["failed"]
+
+
+def run_case(mode, conns, duration, client_procs, sink_ms=0.0, log_every=100, sink="inline"):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', mode, '--sink-ms', str(sink_ms),
+                             '--log-every', str(log_every), '--sinks', sink],
+                            stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(proc.stdout.readline())
+        per_proc = [conns // client_procs + (1 if i < conns % client_procs else 0) for i in range(client_procs)]
+        with mp.Pool(client_procs) as pool:
+            results = pool.map(_client_worker, [(port, n, duration) for n in per_proc if n])
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    latencies = sorted(l for r in results for l in r[0])
+    failed = sum(r[1] for r in results)
+    if not latencies:
+        return {"mode": mode, "sink": sink, "conns": conns, "msgs_per_sec": 0.0, "p99_ms": None, "failed": failed}
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return {
+        "mode": mode,
+        "sink": sink,
+        "conns": conns,
+        "msgs_per_sec": len(latencies) / duration,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": p99 * 1000,
+        "failed": failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--modes', default='threaded,asyncio')
+    parser.add_argument('--conns', default='100,1000,5000')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--client-procs', type=int, default=max(1, min(4, (os.cpu_count() or 2) - 1)))
+    parser.add_argument('--sink-ms', type=float, default=0.0, help='slow event-log sink per logged reading')
+    parser.add_argument('--log-every', type=int, default=100)
+    parser.add_argument('--sinks', default='inline', help='inline and/or queued (SideEffectQueue)')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.sink_ms, args.log_every, args.sinks)
+        return
+
+    raise_fd_limit()
+    if args.sink_ms:
+        print(f"event log every {args.log_every} readings to a {args.sink_ms:g} ms sink")
+    print(f"{'mode':<10}{'sink':<8}{'conns':>8}{'msgs/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'failed':>8}")
+    for conns in [int(c) for c in args.conns.split(',')]:
+        for mode in args.modes.split(','):
+            for sink in args.sinks.split(','):
+                r = run_case(mode, conns, args.duration, args.client_procs, args.sink_ms, args.log_every, sink)
+                p50 = f"{r['p50_ms']:.2f}" if r.get('p50_ms') is not None else '-'
+                p99 = f"{r['p99_ms']:.2f}" if r.get('p99_ms') is not None else '-'
+                print(f"{r['mode']:<10}{r['sink']:<8}{r['conns']:>8}{r['msgs_per_sec']:>12.0f}{p50:>10}{p99:>10}"
+                      f"{r['failed']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Monitor loop: fixed-interval cycles vs MonitorScheduler (analysis on new data).
+
+--devices simulated gateways each land one reading every --period seconds
+(random phase, +-10% jitter). Both variants run the real FleetMonitor with a
+fetch / analyze pair that costs --cost seconds per device:
+
+- fixed:     the former loop: run_cycle() over every device, then sleep for
+             the rest of --period
+- scheduler: a producer thread calls MonitorScheduler.notify() as each reading
+             lands; the loop analyzes only wait_due() devices
+             (min_interval = --period / 6, deadline = --period)
+
+Time is compressed: with the default --period 1.0, one second stands for the
+production 60 s cycle, and results are reported in production seconds
+(x 60 / --period). Alert latency is the time from a reading landing to the end
+of the first analysis of its device that started after it.
+
+Usage:
+    python benchmarks/bench_monitor_scheduler.py --devices 200 --seconds 20
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.fleet_monitor import FleetMonitor
+from energy_model.monitor_scheduler import OUTCOME_COUNTERS, MonitorScheduler
+
+
+class Fleet:
+    """Readings landing per device and the analyses that covered them."""
+
+    def __init__(self, devices, period, seed=0):
+        self.devices = [f"energy*{i // 50}*{i % 50}" for i in range(devices)]
+        self.period = period
+        self.rng = np.random.default_rng(seed)
+        self.arrivals = {d: [] for d in self.devices}
+        self.latencies = []
+        self.analyses = 0
+        self.lock = threading.Lock()
+
+    def produce(self, seconds, on_arrival=None):
+        """Land readings in real time for `seconds`."""
+        start = time.time()
+        events = []
+        for d in self.devices:
+            t = self.rng.uniform(0, self.period)
+            while t < seconds:
+                events.append((t, d))
+                t += self.period * self.rng.uniform(0.9, 1.1)
+        for t, d in sorted(events):
+            delay = start + t - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.time()
+            with self.lock:
+                self.arrivals[d].append(now)
+            if on_arrival:
+                on_arrival(d, now)
+
+    def fetch(self, device_id):
+        return time.time()
+
+    def analyze(self, device_id, started, cost):
+        time.sleep(cost)
+        return started, time.time()
+
+    def covered(self, device_id, started, finished):
+        with self.lock:
+            self.analyses += 1
+            pending = self.arrivals[device_id]
+            done = [a for a in pending if a <= started]
+            self.latencies.extend(finished - a for a in done)
+            self.arrivals[device_id] = [a for a in pending if a > started]
+
+
+def run_fixed(fleet, args, stop):
+    monitor = FleetMonitor(fleet.fetch, lambda d, s: fleet.analyze(d, s, args.cost),
+                           query_workers=args.workers, analysis_workers=args.workers, cycle_budget=args.period * 0.9)
+    drift = []
+    next_start = time.time()
+    while not stop.is_set():
+        cycle_start = time.time()
+        drift.append(cycle_start - next_start)
+        for d, (started, finished) in monitor.run_cycle(fleet.devices).items():
+            fleet.covered(d, started, finished)
+        time.sleep(max(0.0, args.period - (time.time() - cycle_start)))
+        next_start = cycle_start + args.period
+    monitor.close()
+    return np.array(drift)
+
+
+def run_scheduler(fleet, args, stop, scheduler):
+    monitor = FleetMonitor(fleet.fetch, lambda d, s: fleet.analyze(d, s, args.cost),
+                           query_workers=args.workers, analysis_workers=args.workers, cycle_budget=args.period * 0.9)
+    scheduler.sync(fleet.devices)
+    while not stop.is_set():
+        due = scheduler.wait_due(timeout=args.period / 6)
+        if not due:
+            continue
+        results = monitor.run_cycle(sorted(due))
+        for d, (started, finished) in results.items():
+            fleet.covered(d, started, finished)
+        scheduler.finished(due, outcomes=monitor.last_outcomes)
+    monitor.close()
+
+
+def run(name, args):
+    fleet = Fleet(args.devices, args.period)
+    stop = threading.Event()
+    scheduler = MonitorScheduler(min_interval=args.period / 6, deadline=args.period)
+    if name == "fixed":
+        result = {}
+        loop = threading.Thread(target=lambda: result.setdefault("drift", run_fixed(fleet, args, stop)))
+        on_arrival = None
+    else:
+        loop = threading.Thread(target=run_scheduler, args=(fleet, args, stop, scheduler))
+        on_arrival = scheduler.notify
+    loop.start()
+    fleet.produce(args.seconds, on_arrival)
+    time.sleep(args.period * 1.5)  # let the last readings be analyzed
+    stop.set()
+    loop.join()
+    if name == "fixed":
+        drift_avg, drift_max, stats = float(np.mean(result["drift"])), float(np.max(result["drift"])), None
+    else:
+        stats = scheduler.stats()
+        drift_avg, drift_max = stats["drift"]["avg_s"] or 0.0, stats["drift"]["max_s"] or 0.0
+    return np.array(fleet.latencies), fleet.analyses, drift_avg, drift_max, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=20.0)
+    parser.add_argument('--period', type=float, default=1.0, help='seconds standing for the production 60 s')
+    parser.add_argument('--cost', type=float, default=0.001, help='fetch + analysis seconds per device')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    scale = 60.0 / args.period
+    readings = int(args.devices * args.seconds / args.period)
+    print(f"{args.devices} devices, one reading per {args.period:g}s (= 60 s), ~{readings} readings, "
+          f"{args.cost * 1000:g} ms analysis per device, {args.workers} workers; times in production seconds")
+    print(f"{'variant':<11}{'latency p50':>13}{'p95':>8}{'max':>8}{'analyses':>10}{'per reading':>13}"
+          f"{'drift avg':>11}{'drift max':>11}")
+    for name in ("fixed", "scheduler"):
+        latencies, analyses, drift_avg, drift_max, stats = run(name, args)
+        p50, p95 = np.percentile(latencies, [50, 95]) * scale
+        print(f"{name:<11}{p50:>13.1f}{p95:>8.1f}{latencies.max() * scale:>8.1f}{analyses:>10}"
+              f"{analyses / len(latencies):>13.2f}{drift_avg * scale:>11.2f}{drift_max * scale:>11.2f}")
+        if stats:
+            runs = {k: v for k, v in stats.items() if k.startswith("runs_")}
+            outcomes = {k: stats[k] for k in OUTCOME_COUNTERS.values()}
+            print(f"{'':<11}scheduler runs: {runs}")
+            print(f"{'':<11}outcomes: {outcomes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+DingTalk alerts: synchronous requests.post in the monitor loop vs AlertNotifier.
+
+Runs a local HTTP stand-in for the DingTalk robot webhook that answers after
+--latency seconds and fails a --fail-rate share of the requests (alternating
+HTTP 500 and a 200 with errcode 130101 "send too fast", as DingTalk does when
+a robot exceeds its rate). It records when each message arrived and which
+alerts it carried.
+
+A simulated monitor loop runs --cycles cycles, --interval seconds apart. Each
+cycle --persistent devices keep alerting (the condition persists, so the alert
+is raised every cycle) and --new devices raise a fresh alert. Variants:
+
+- legacy:   send_dingtalk_alert() as before, one requests.post(timeout=2) per
+            alert inside the loop
+- notifier: AlertNotifier.submit() with dingtalk_sender(); time is compressed
+            (--rate-per-min, dedup window of --dedup-s seconds, short backoff)
+
+Reported: time the loop spent in alert sending per cycle, HTTP requests made,
+distinct alerts delivered / lost (a request the client timed out on still
+counts as delivered if the stand-in processed it), the most requests the
+stand-in saw in any burst / rate window (the token bucket allows 2 x burst),
+and the notifier counters.
+
+Usage:
+    python benchmarks/bench_notifier.py --cycles 20 --latency 0.3 --fail-rate 0.3
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.notifier import AlertNotifier, dingtalk_sender
+
+
+class StandIn:
+    """DingTalk robot webhook with latency and failures."""
+
+    def __init__(self, latency, fail_rate, seed=0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.reset()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                time.sleep(stand_in.latency)
+                with stand_in.lock:
+                    stand_in.requests.append(time.monotonic())
+                    failed = stand_in.rng.random() < stand_in.fail_rate
+                    if failed:
+                        stand_in.failures += 1
+                    else:
+                        stand_in.delivered.extend(l for l in body["text"]["content"].split("\n") if "#" in l)
+                if failed and stand_in.failures % 2:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                result = {"errcode": 130101, "errmsg": "send too fast"} if failed else {"errcode": 0, "errmsg": "ok"}
+                data = json.dumps(result).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            def handle_error(self, request, client_address):
+                if not isinstance(sys.exc_info()[1], ConnectionError):  # client gave up (timeout)
+                    super().handle_error(request, client_address)
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/robot/send?access_token=bench"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self):
+        self.requests = []
+        self.delivered = []
+        self.failures = 0
+
+    def max_in_window(self, seconds):
+        t = np.array(sorted(self.requests))
+        if not len(t):
+            return 0
+        return int((np.searchsorted(t, t + seconds, side='left') - np.arange(len(t))).max())
+
+
+def cycle_alerts(args, cycle):
+    """(key, text) raised in one cycle; the '#' marks the alert text for the stand-in."""
+    alerts = [(f"energy*0*{d}/power_critical", f"[energy*0*{d}] 🔥 能耗严重超标 #p{d}")
+              for d in range(args.persistent)]
+    alerts += [(f"energy*1*{cycle}_{d}/unbalance_critical", f"[energy*1*{cycle}_{d}] ⚡ 三相严重不平 #n{cycle}_{d}")
+               for d in range(args.new)]
+    return alerts
+
+
+def legacy_send(url, msg):
+    """send_dingtalk_alert before AlertNotifier."""
+    try:
+        requests.post(url, json={
+            "msgtype": "text",
+            "text": {"content": f"🚨 [得鹿山能源警报] {msg}"}
+        }, timeout=2)
+    except: pass
+
+
+def run_loop(args, send):
+    blocked = []
+    for cycle in range(args.cycles):
+        t0 = time.perf_counter()
+        for key, text in cycle_alerts(args, cycle):
+            send(key, text)
+        spent = time.perf_counter() - t0
+        blocked.append(spent)
+        time.sleep(max(0.0, args.interval - spent))
+    return np.array(blocked)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cycles', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between monitor cycles')
+    parser.add_argument('--persistent', type=int, default=5)
+    parser.add_argument('--new', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--fail-rate', type=float, default=0.3)
+    parser.add_argument('--rate-per-min', type=float, default=240, help='compressed DingTalk limit (20 in production)')
+    parser.add_argument('--burst', type=int, default=3)
+    parser.add_argument('--dedup-s', type=float, default=5.0)
+    args = parser.parse_args()
+
+    stand_in = StandIn(args.latency, args.fail_rate)
+    window = 60.0 * args.burst / args.rate_per_min
+    rows = []
+
+    # Legacy: every raised alert is posted synchronously (2 s timeout), failures are silently lost
+    legacy_blocked = run_loop(args, lambda key, text: legacy_send(stand_in.url, text))
+    raised = {text.split("#")[1] for c in range(args.cycles) for _, text in cycle_alerts(args, c)}
+    rows.append(("legacy", legacy_blocked, len(stand_in.requests), stand_in.failures,
+                 {l.split("#")[1] for l in stand_in.delivered}, stand_in.max_in_window(window), None))
+
+    stand_in.reset()
+    notifier = AlertNotifier(dingtalk_sender(stand_in.url, timeout=2), dedup_s=args.dedup_s,
+                             rate_per_min=args.rate_per_min, burst=args.burst, batch_window=args.interval / 2,
+                             retries=4, backoff=0.1, max_backoff=1.0)
+    notifier_blocked = run_loop(args, notifier.submit)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        stats = notifier.stats()
+        if not stats["queued"] and stats["sent_alerts"] + stats["failed_alerts"] + stats["dropped"] >= \
+                stats["submitted"] - stats["deduplicated"]:
+            break
+        time.sleep(0.05)
+    notifier.close()
+    rows.append(("notifier", notifier_blocked, len(stand_in.requests), stand_in.failures,
+                 {l.split("#")[1] for l in stand_in.delivered}, stand_in.max_in_window(window), notifier.stats()))
+
+    print(f"{args.cycles} cycles every {args.interval}s, {args.persistent} persistent + {args.new} new alerts per cycle; "
+          f"webhook latency {args.latency}s, {args.fail_rate:.0%} failures; {len(raised)} distinct alerts")
+    print(f"{'variant':<10}{'loop ms/cycle':>15}{'max ms':>10}{'requests':>10}{'failed':>8}"
+          f"{'delivered':>11}{'lost':>6}{f'max req/{window:g}s':>15}")
+    for name, blocked, n_requests, failures, delivered, peak, _ in rows:
+        print(f"{name:<10}{blocked.mean() * 1000:>15.2f}{blocked.max() * 1000:>10.2f}{n_requests:>10}{failures:>8}"
+              f"{len(delivered):>11}{len(raised - delivered):>6}{peak:>15}")
+    print(f"(rate limit: {args.rate_per_min:g}/min, burst {args.burst} -> at most "
+          f"{args.burst + args.burst:d} requests per {window:g}s window)")
+    print("notifier:", rows[1][6])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+OnlineEnergyAnalyzer (per-sample updates) vs EnergyOptimizer (whole window per call).
+
+Synthetic 1-minute frames per device: power (kW) with busy / idle stretches
+(from bench_idle_detection), three phase currents with a varying unbalance
+and a PF in the 0-1000 scale. Like the monitor loop, each device's analyzer is
+seeded with the first 24 h window in one update_frame() call, then fed one
+new row per minute for --days more days.
+
+Accuracy: at the end of every hour (where the analyzer's window covers exactly
+the last 24 h) its results are compared with EnergyOptimizer on the same 24 h
+frame; the largest differences are reported.
+
+Speed: one monitor evaluation of --devices devices, i.e. EnergyOptimizer's
+three methods on a 24 h frame per device, vs one update() plus the three
+result methods per device.
+
+Usage:
+    python benchmarks/bench_online_analytics.py --days 3 --devices 300
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_idle_detection import synthetic_power
+from energy_model.online_analytics import OnlineEnergyAnalyzer
+from energy_model.optimization import EnergyOptimizer
+
+WINDOW = 1440
+
+
+def synthetic_frame(power, seed):
+    rng = np.random.default_rng(seed)
+    n = len(power)
+    base = power * 1000 / (np.sqrt(3) * 380 * 0.9)  # A per phase
+    skew = np.repeat(rng.uniform(0.0, 0.3, n // 120 + 1), 120)[:n]
+    ia = base * (1 + skew)
+    ib = base * (1 - skew / 2) + rng.normal(0, 0.2, n)
+    ic = base * (1 - skew / 2) + rng.normal(0, 0.2, n)
+    pft = np.clip(np.repeat(rng.uniform(820, 990, n // 60 + 1), 60)[:n] + rng.normal(0, 5, n), 0, 1000)
+    index = pd.date_range("2026-01-01", periods=n, freq="1min", tz="UTC")
+    return pd.DataFrame({"pt": power, "ia": ia, "ib": ib, "ic": ic, "pft": pft}, index=index)
+
+
+def batch(df, threshold_power=None):
+    optimizer = EnergyOptimizer(df)
+    return (optimizer.detect_idle_state(threshold_power=threshold_power, duration_minutes=15,
+                                        resample_interval_minutes=1),
+            optimizer.analyze_phase_balance(), optimizer.analyze_power_factor())
+
+
+def online(analyzer):
+    return analyzer.detect_idle_state(), analyzer.analyze_phase_balance(), analyzer.analyze_power_factor()
+
+
+def compare(errors, b, o):
+    (bi, bb, bp), (oi, ob, op) = b, o
+    for key in ("total_idle_hours", "total_wasted_energy_kwh", "idle_events_count"):
+        errors.setdefault(key, []).append(abs(oi[key] - bi[key]))
+    for key in ("avg_unbalance_percent", "max_unbalance_percent", "severe_unbalance_hours"):
+        errors.setdefault(key, []).append(abs(ob[key] - bb[key]))
+    for key in ("avg_pf", "min_pf", "low_pf_hours"):
+        errors.setdefault(key, []).append(abs(op[key] - bp[key]))
+
+
+def stream(frames, fixed):
+    """Seed with the first window, add one row per minute, compare with the batch at every hour end."""
+    errors = {}
+    for df in frames:
+        threshold = batch(df.iloc[:WINDOW])[0]["threshold_used"] if fixed else None
+        analyzer = OnlineEnergyAnalyzer(duration_minutes=15, interval_minutes=1, threshold_power=threshold)
+        analyzer.update_frame(df.iloc[:WINDOW])
+        for i in range(WINDOW, len(df)):
+            row = df.iloc[i]
+            analyzer.update(df.index[i], row.pt, row.ia, row.ib, row.ic, row.pft)
+            if (i + 1) % 60:
+                continue
+            b = batch(df.iloc[i + 1 - WINDOW:i + 1], threshold)
+            o = online(analyzer)
+            compare(errors, b, o)
+            if not fixed:
+                errors.setdefault("threshold (rel)", []).append(
+                    abs(o[0]["threshold_used"] / b[0]["threshold_used"] - 1))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--devices', type=int, default=300)
+    parser.add_argument('--accuracy-devices', type=int, default=5)
+    args = parser.parse_args()
+
+    samples = (args.days + 1) * WINDOW
+    power = synthetic_power(max(args.devices, args.accuracy_devices), samples, idle_minutes=(30, 300))
+    frames = [synthetic_frame(row, seed) for seed, row in enumerate(power)]
+
+    # Accuracy
+    fixed = stream(frames[:args.accuracy_devices], fixed=True)
+    estimated = stream(frames[:args.accuracy_devices], fixed=False)
+    checks = len(fixed["avg_pf"])
+    print(f"{args.accuracy_devices} devices x {args.days} days streamed, {checks} hourly comparisons "
+          f"with EnergyOptimizer on the same 24 h")
+    print(f"{'metric':<28}{'fixed threshold':>32}{'estimated threshold':>32}")
+    print(f"{'':<28}{'max |diff|':>16}{'mean |diff|':>16}{'max |diff|':>16}{'mean |diff|':>16}")
+    for name in estimated:
+        cells = "".join(f"{f(errs[name]):>16.2e}" if name in errs else f"{'':>16}"
+                        for errs in (fixed, estimated) for f in (max, np.mean))
+        print(f"{name:<28}{cells}")
+
+    # Cost of one evaluation of every device
+    analyzers = []
+    for df in frames[:args.devices]:
+        analyzer = OnlineEnergyAnalyzer(duration_minutes=15, interval_minutes=1)
+        analyzer.update_frame(df.iloc[:samples - 1])
+        analyzers.append(analyzer)
+    windows = [df.iloc[samples - WINDOW:] for df in frames[:args.devices]]
+    last = [df.iloc[-1] for df in frames[:args.devices]]
+
+    t0 = time.perf_counter()
+    for df in windows:
+        batch(df)
+    batch_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for analyzer, df, row in zip(analyzers, frames, last):
+        analyzer.update(df.index[-1], row.pt, row.ia, row.ib, row.ic, row.pft)
+    update_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for analyzer in analyzers:
+        online(analyzer)
+    result_s = time.perf_counter() - t0
+
+    n = args.devices
+    print(f"\none evaluation of {n} devices (24 h window at 1 minute)")
+    print(f"{'variant':<24}{'ms':>10}{'per device us':>15}")
+    print(f"{'batch':<24}{batch_s * 1000:>10.1f}{batch_s * 1e6 / n:>15.0f}")
+    print(f"{'online update':<24}{update_s * 1000:>10.1f}{update_s * 1e6 / n:>15.0f}")
+    print(f"{'online results':<24}{result_s * 1000:>10.1f}{result_s * 1e6 / n:>15.0f}")
+    print(f"{'online total':<24}{(update_s + result_s) * 1000:>10.1f}{(update_s + result_s) * 1e6 / n:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
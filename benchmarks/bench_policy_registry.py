@@ -0,0 +1,129 @@
+"""
+Per-connection model loading vs the shared PolicyRegistry.
+
+Measures, for the old controllers (each connection unpickles its own Q-table
+and stats the file on every analyze()) and the registry-backed ones:
+
+- connection setup time: building one LubricationAI_RL + TensionAI_RL pair
+- filesystem syscalls per message: os.stat calls made by analyze()
+- analyze() time per message
+
+Run from the repository root so q_brain.pkl / tension_q_brain.pkl resolve.
+
+Usage:
+    python benchmarks/bench_policy_registry.py --messages 100000
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from energy_model.rl_policy import LubricationAI_RL, TensionAI_RL
+
+
+class LegacyLubricationAI:
+    """The controller as it was before the registry: own model, mtime check per message."""
+
+    def __init__(self):
+        self.model_path = "q_brain.pkl"
+        self.last_mtime = 0
+        self.load_model()
+        self.cooldown = 0
+        self.inject_count = 0
+
+    def load_model(self):
+        if os.path.exists(self.model_path):
+            self.last_mtime = os.path.getmtime(self.model_path)
+            with open(self.model_path, "rb") as f:
+                self.q_table = pickle.load(f)
+        else:
+            self.q_table = None
+
+    def check_reload(self):
+        if os.path.exists(self.model_path):
+            if os.path.getmtime(self.model_path) > self.last_mtime:
+                self.load_model()
+
+    def analyze(self, data):
+        self.check_reload()
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            return None
+        curr = data.get('current_a', 10.0)
+        temp = data.get('temperature_c', 40.0)
+        if temp > 55.0 or curr > 13.0:
+            self.cooldown = 5
+            self.inject_count += 1
+            return {"action": "INJECT", "msg": "🔥 强制保护"}
+        if self.q_table is not None:
+            curr_idx = int(min(9, max(0, (curr - 9.0) * 2)))
+            temp_idx = int(min(9, max(0, (temp - 25.0) / 5)))
+            if np.argmax(self.q_table[curr_idx, temp_idx]) == 1:
+                self.cooldown = 5
+                self.inject_count += 1
+                return {"action": "INJECT", "msg": "🧠 RL决策喷油"}
+        return {"action": "MONITOR", "msg": "Running"}
+
+
+class LegacyTensionAI:
+    def __init__(self):
+        self.model_path = "tension_q_brain.pkl"
+        self.last_mtime = os.path.getmtime(self.model_path) if os.path.exists(self.model_path) else 0
+        with open(self.model_path, "rb") as f:
+            self.q_table = pickle.load(f)
+        self.optimize_count = 0
+
+
+class StatCounter:
+    """Counts os.stat calls (os.path.exists/getmtime go through it)."""
+
+    def __init__(self):
+        self.calls = 0
+        self._orig = os.stat
+
+    def __enter__(self):
+        def counting_stat(*args, **kwargs):
+            self.calls += 1
+            return self._orig(*args, **kwargs)
+        os.stat = counting_stat
+        return self
+
+    def __exit__(self, *exc):
+        os.stat = self._orig
+
+
+def bench(name, make_pair, messages, connections):
+    t0 = time.perf_counter()
+    for _ in range(connections):
+        make_pair()
+    setup_us = (time.perf_counter() - t0) / connections * 1e6
+
+    lub, _ = make_pair()
+    reading = {"device_type": "LUBRICATION_BOT", "current_a": 10.4, "temperature_c": 38.0}
+    with StatCounter() as counter:
+        t0 = time.perf_counter()
+        for _ in range(messages):
+            lub.analyze(reading)
+        per_msg_us = (time.perf_counter() - t0) / messages * 1e6
+    print(f"{name:<10}{setup_us:>16.1f}{counter.calls / messages:>16.2f}{per_msg_us:>14.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--connections', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'controller':<10}{'setup us/conn':>16}{'stat()/message':>16}{'us/message':>14}")
+    bench("legacy", lambda: (LegacyLubricationAI(), LegacyTensionAI()), args.messages, args.connections)
+    bench("registry", lambda: (LubricationAI_RL(), TensionAI_RL()), args.messages, args.connections)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Raw points + pandas resample vs aggregateWindow pushdown in InfluxConnector.
+
+Uses the /api/v2/query stand-in from bench_rolling_window (it implements
+aggregateWindow with timeSrc "_start" the way InfluxDB labels bins). For each
+--windows length, with one reading every --interval-s seconds:
+
+- raw:      InfluxConnector(pushdown=False).query_recent_data() (every point is
+            shipped, pivoted, then resampled to 1 minute in pandas)
+- pushdown: InfluxConnector(pushdown=True).query_recent_data() (InfluxDB returns
+            1-minute means; pandas only fills gaps)
+
+Reports response bytes, rows received and end-to-end latency (median of
+--repeat), checks that both frames and the EnergyOptimizer results
+(idle hours / max unbalance / avg PF) are numerically equivalent, and shows the
+payload of an extra min/max pushdown.
+
+Usage:
+    python benchmarks/bench_pushdown.py --windows 60,1440 --interval-s 1
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_rolling_window import StandIn, analyze
+from energy_model.influx_connector import InfluxConnector
+
+DEVICE = "energy*1*1"
+
+
+def timed(stand_in, fn, repeat):
+    times = []
+    for _ in range(repeat):
+        b0 = stand_in.bytes_sent
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return result, stand_in.bytes_sent - b0, sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--windows', default="60,1440")
+    parser.add_argument('--interval-s', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    now = int(time.time()) // 60 * 60
+    stand_in = StandIn(args.interval_s, now)
+    raw = InfluxConnector(stand_in.url, "t", "bench", "bench")
+    pushdown = InfluxConnector(stand_in.url, "t", "bench", "bench", pushdown=True)
+    ts = pd.Timestamp(now, unit='s', tz='UTC')
+
+    print(f"one reading every {args.interval_s} s, 1-minute resolution")
+    print(f"{'window':>8}{'mode':>10}{'rows in':>10}{'KiB':>10}{'ms':>9}{'equivalent':>12}")
+    for minutes in [int(m) for m in args.windows.split(',')]:
+        df_raw, raw_bytes, raw_s = timed(stand_in, lambda: raw.query_recent_data(minutes, DEVICE, now=ts), args.repeat)
+        raw_rows = minutes * 60 // args.interval_s + 1
+        df_push, push_bytes, push_s = timed(
+            stand_in, lambda: pushdown.query_recent_data(minutes, DEVICE, now=ts), args.repeat)
+        same = (df_raw.index.equals(df_push.index) and np.allclose(df_raw, df_push, rtol=1e-9, atol=1e-9)
+                and np.allclose(analyze(df_raw), analyze(df_push), rtol=1e-9))
+        print(f"{minutes:>7}m{'raw':>10}{raw_rows:>10}{raw_bytes / 1024:>10.0f}{raw_s * 1000:>9.0f}")
+        print(f"{'':>8}{'pushdown':>10}{minutes + 1:>10}{push_bytes / 1024:>10.0f}{push_s * 1000:>9.0f}{str(same):>12}")
+
+    minutes = int(args.windows.split(',')[-1])
+    (frame, nbytes, seconds) = timed(
+        stand_in, lambda: pushdown.query_aggregated(ts - pd.Timedelta(minutes=minutes), DEVICE, extra=("min", "max")), 1)
+    print(f"pushdown mean+min+max over {minutes}m: {len(frame)} rows x {frame.shape[1]} columns, "
+          f"{nbytes / 1024:.0f} KiB, {seconds * 1000:.0f} ms")
+    raw.close()
+    pushdown.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+InfluxConnector with and without the shared QueryCache.
+
+Uses the /api/v2/query stand-in from bench_rolling_window (--latency-ms per
+answer, one reading per --interval-s) and a simulated clock. Per simulated
+minute:
+
+- the monitor refreshes a 24 h RollingWindow for each of --devices gateways
+- --switches dashboard device switches each run query_recent_data(10 min)
+  for a random gateway (what push_device_snapshot does)
+
+Then --burst dashboards switch to the same gateway at the same moment
+(concurrent identical queries).
+
+Reported with and without the cache: queries sent to InfluxDB, bytes
+received, switch latency, and the cache's hit ratio and saved query time.
+Every cached result is compared with the uncached one.
+
+Usage:
+    python benchmarks/bench_query_cache.py --devices 20 --minutes 10 --switches 10 --burst 20
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_rolling_window import StandIn
+from energy_model.influx_connector import InfluxConnector
+from energy_model.query_cache import QueryCache
+from energy_model.rolling_window import RollingWindow
+
+
+def run(stand_in, t0, args, cache):
+    connector = InfluxConnector(stand_in.url, "t", "bench", "bench", cache=cache,
+                                connection_pool_maxsize=args.burst)
+    gateways = [f"energy*1*{i + 1}" for i in range(args.devices)]
+    windows = [RollingWindow(connector, g) for g in gateways]
+    rng = random.Random(1)
+    q0, b0 = stand_in.requests, stand_in.bytes_sent
+    switch_times, frames = [], []
+
+    for minute in range(args.minutes):
+        stand_in.now = t0 + minute * 60
+        now = pd.Timestamp(stand_in.now, unit='s', tz='UTC')
+        for w in windows:
+            w.refresh(now=now)
+        for _ in range(args.switches):
+            c0 = time.perf_counter()
+            frames.append(connector.query_recent_data(minutes=10, device_id=rng.choice(gateways), now=now))
+            switch_times.append(time.perf_counter() - c0)
+
+    # Burst: many dashboards switch to a gateway nobody has queried yet
+    stand_in.now += 30
+    now = pd.Timestamp(stand_in.now, unit='s', tz='UTC')
+    burst_q0 = stand_in.requests
+    barrier = threading.Barrier(args.burst)
+
+    def dashboard():
+        barrier.wait()
+        connector.query_recent_data(minutes=10, device_id="energy*9*9", now=now)
+
+    threads = [threading.Thread(target=dashboard) for _ in range(args.burst)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    connector.close()
+    switch_times.sort()
+    return {
+        "queries": stand_in.requests - q0,
+        "kib": (stand_in.bytes_sent - b0) / 1024,
+        "switch_p50_ms": switch_times[len(switch_times) // 2] * 1000,
+        "switch_max_ms": switch_times[-1] * 1000,
+        "burst_queries": stand_in.requests - burst_q0,
+        "frames": frames,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--minutes', type=int, default=10)
+    parser.add_argument('--switches', type=int, default=10)
+    parser.add_argument('--burst', type=int, default=20)
+    parser.add_argument('--interval-s', type=int, default=60)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    t0 = int(time.time()) // 60 * 60
+    stand_in = StandIn(args.interval_s, t0, args.latency_ms / 1000.0)
+    plain = run(stand_in, t0, args, None)
+    cache = QueryCache()
+    cached = run(stand_in, t0, args, cache)
+
+    same = all(a is None and b is None or np.allclose(a, b) and a.index.equals(b.index)
+               for a, b in zip(plain["frames"], cached["frames"]))
+    print(f"{args.devices} gateways x {args.minutes} minutes, {args.switches} switches/minute, "
+          f"{args.latency_ms:.0f} ms per query, burst of {args.burst}")
+    print(f"{'connector':<10}{'queries':>9}{'KiB':>9}{'switch p50 ms':>15}{'switch max ms':>15}{'burst queries':>15}")
+    for name, r in (("no cache", plain), ("cache", cached)):
+        print(f"{name:<10}{r['queries']:>9}{r['kib']:>9.0f}{r['switch_p50_ms']:>15.1f}{r['switch_max_ms']:>15.1f}"
+              f"{r['burst_queries']:>15}")
+    print(f"cache stats: {cache.stats()}")
+    print(f"switch results identical: {same}")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Long-range pulls: one monolithic Flux query vs InfluxConnector.query_range() slices.
+
+The /api/v2/query stand-in from bench_rolling_window runs in a child process.
+Before answering, it sleeps --scan-us microseconds per row in the requested
+range, which stands in for the server scanning storage. With --fail-rate it
+also answers that fraction of requests with 503. The connector keeps
+InfluxConnector's 10 s client timeout.
+
+For a --days range with one reading every --interval-s seconds:
+
+- monolithic: slice_hours larger than the range, so a single query
+- sliced:     --slice-hours slices, with 1 / 4 / 8 slice workers
+- failures:   sliced with 4 workers while --fail-rate of the requests fail
+              (each slice is retried on its own)
+- 1min:       sliced, 4 workers, resolution='1min' (aggregateWindow per slice)
+
+Rows and checksums are compared with a reference pull made with scanning and
+failures switched off.
+
+Usage:
+    python benchmarks/bench_range_query.py --days 7 --interval-s 10 --scan-us 200
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_rolling_window import StandIn
+from energy_model.influx_connector import InfluxConnector
+
+DEVICE = "energy*1*1"
+
+
+class ScanStandIn(StandIn):
+    shared = None  # (scan seconds per row, fail rate, requests, rejected)
+
+    def reject(self, flux):
+        scan, fail_rate, requests, rejected = self.shared
+        with requests.get_lock():
+            requests.value += 1
+        rows = (self.last_of(flux) - self.start_of(flux)) / self.interval_s
+        time.sleep(max(0.0, rows) * scan.value)
+        if random.random() < fail_rate.value:
+            with rejected.get_lock():
+                rejected.value += 1
+            return True
+        return False
+
+
+def serve(shared, interval_s, now, port_queue):
+    ScanStandIn.shared = shared
+    stand_in = ScanStandIn(interval_s, now)
+    port_queue.put(stand_in.url)
+    while True:
+        time.sleep(3600)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--interval-s', type=int, default=10)
+    parser.add_argument('--scan-us', type=float, default=200)
+    parser.add_argument('--slice-hours', type=float, default=6)
+    parser.add_argument('--fail-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    now = int(time.time()) // 60 * 60
+    scan = multiprocessing.Value('d', 0.0)
+    fail_rate = multiprocessing.Value('d', 0.0)
+    requests = multiprocessing.Value('i', 0)
+    rejected = multiprocessing.Value('i', 0)
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=((scan, fail_rate, requests, rejected), args.interval_s, now,
+                                                         ports), daemon=True)
+    server.start()
+    url = ports.get(timeout=30)
+
+    stop = pd.Timestamp(now, unit='s', tz='UTC')
+    start = stop - pd.Timedelta(days=args.days)
+
+    def connector(slice_hours, workers):
+        return InfluxConnector(url, "t", "bench", "bench", slice_hours=slice_hours, slice_workers=workers,
+                               connection_pool_maxsize=max(workers, 1))
+
+    reference = {
+        None: connector(args.slice_hours, 4).query_range(start, stop, DEVICE),
+        '1min': connector(args.days * 24 + 1, 1).query_range(start, stop, DEVICE, resolution='1min'),
+    }
+    rows = int(args.days * 86400 / args.interval_s)
+    print(f"{args.days:g} days, one reading every {args.interval_s} s ({rows} rows), "
+          f"{args.scan_us:g} us scan per row, 10 s client timeout")
+    print(f"{'variant':<14}{'workers':>8}{'seconds':>9}{'requests':>9}{'503s':>6}{'rows':>8}{'matches':>9}")
+
+    variants = [
+        ("monolithic", args.days * 24 + 1, 1, 0.0, None),
+        ("sliced", args.slice_hours, 1, 0.0, None),
+        ("sliced", args.slice_hours, 4, 0.0, None),
+        ("sliced", args.slice_hours, 8, 0.0, None),
+        ("failures", args.slice_hours, 4, args.fail_rate, None),
+        ("1min", args.slice_hours, 4, 0.0, '1min'),
+    ]
+    scan.value = args.scan_us / 1e6
+    for name, slice_hours, workers, rate, resolution in variants:
+        fail_rate.value = rate
+        r0, j0 = requests.value, rejected.value
+        t0 = time.perf_counter()
+        df = connector(slice_hours, workers).query_range(start, stop, DEVICE, resolution=resolution)
+        seconds = time.perf_counter() - t0
+        ref = reference[resolution]
+        same = df is not None and df.index.equals(ref.index) and np.allclose(df.values, ref.values, equal_nan=True)
+        print(f"{name:<14}{workers:>8}{seconds:>9.2f}{requests.value - r0:>9}{rejected.value - j0:>6}"
+              f"{0 if df is None else len(df):>8}{str(same):>9}")
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
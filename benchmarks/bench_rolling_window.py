@@ -0,0 +1,228 @@
+"""
+Monitoring loop: full 24 h re-query every minute vs the incremental RollingWindow.
+
+Runs a local HTTP stand-in for InfluxDB's /api/v2/query endpoint. It answers
+the monitor's Flux query with annotated CSV (the pivoted shape the real server
+returns) for a synthetic meter reading every --interval-s seconds, honouring
+the range(start: ...) of the query, and counts response bytes. Time is
+simulated: each loop iteration advances the stand-in's clock by one minute.
+
+For both variants, every iteration fetches the device's data and runs the
+EnergyOptimizer part of analyze_monitor_device (idle / phase balance / power
+factor; the LSTM forecaster is left out). Reported per variant:
+
+- bytes received from InfluxDB per iteration (after the first)
+- wall time per iteration (fetch + decode + analysis)
+
+The incremental frames are also checked against the full re-query each iteration.
+
+Usage:
+    python benchmarks/bench_rolling_window.py --iterations 10 --interval-s 10
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.influx_connector import InfluxConnector, NUMERIC_FIELDS
+from energy_model.optimization import EnergyOptimizer
+from energy_model.rolling_window import RollingWindow
+
+DEVICE = "energy*1*1"
+
+
+def reading(ts, shift=0):
+    """Deterministic meter values for a unix timestamp (working day with idle stretches)."""
+    minute = ts // 60 + shift
+    busy = (minute // 37) % 4 != 0
+    p = (55000.0 if busy else 8000.0) + (ts * 7919 % 1000)
+    i = p / 660.0
+    return [380.0 + ts % 5, 381.0, 379.5, i, i * 1.08, i * 0.95, p, p * 1.02, 920.0 + ts % 40, ts / 100.0]
+
+
+class StandIn:
+    """Minimal /api/v2/query endpoint returning pivoted annotated CSV."""
+
+    def __init__(self, interval_s, now, latency=0.0, connect_latency=0.0):
+        self.interval_s = interval_s
+        self.now = now  # simulated unix time
+        self.latency = latency  # seconds added to every answer (remote round trip + query time)
+        self.connect_latency = connect_latency  # seconds added to every new connection (TCP setup)
+        self.bytes_sent = 0
+        self.requests = 0
+        self.connections = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like InfluxDB
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def setup(self):
+                super().setup()
+                stand_in.connections += 1
+                time.sleep(stand_in.connect_latency)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+                time.sleep(stand_in.latency)
+                if stand_in.reject(body):
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                payload = stand_in.answer(body).encode()
+                stand_in.bytes_sent += len(payload)
+                stand_in.requests += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 128  # bursts of concurrent clients
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                if not isinstance(sys.exc_info()[1], ConnectionError):  # client gave up (timeout)
+                    super().handle_error(request, client_address)
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reject(self, flux):
+        """True to answer 503 (subclasses inject failures)."""
+        return False
+
+    def start_of(self, flux):
+        m = re.search(r'range\(start: -(\d+)m\)', flux)
+        if m:
+            return self.now - int(m.group(1)) * 60
+        m = re.search(r'range\(start: time\(v: \\?"([^"\\]+)\\?"\)', flux)
+        return pd.Timestamp(m.group(1)).value / 1e9
+
+    def last_of(self, flux):
+        # range(..., stop: ...) is exclusive; without it the range ends at now (inclusive here)
+        m = re.search(r'stop: time\(v: \\?"([^"\\]+)\\?"\)', flux)
+        return min(int(self.now), int(np.ceil(pd.Timestamp(m.group(1)).value / 1e9)) - 1) if m else int(self.now)
+
+    def answer(self, body):
+        start = self.start_of(body)
+        gateway = re.search(r'r\[\\?"gateWayId\\?"\] == \\?"([^"\\]+)\\?"', body)
+        shift = zlib.crc32(gateway.group(1).encode()) % 1440 if gateway else 0
+        first = int(np.ceil(start / self.interval_s)) * self.interval_s
+        stamps = np.arange(first, self.last_of(body) + 1, self.interval_s)
+        values = np.array([[round(v, 3) for v in reading(int(ts), shift)] for ts in stamps]).reshape(-1, len(NUMERIC_FIELDS))
+        columns = list(NUMERIC_FIELDS)
+
+        every = re.search(r'aggregateWindow\(every: (\d+)s', body)
+        if every:
+            # aggregateWindow(timeSrc: "_start", createEmpty: false): bins labelled by their
+            # start, truncated to the range start
+            step = int(every.group(1))
+            aggs = ["mean"] + re.findall(r'set\(key: \\?"agg\\?", value: \\?"(min|max)\\?"\)', body)
+            bins = stamps // step * step
+            labels, first_idx = np.unique(bins, return_index=True)
+            blocks = []
+            for agg in aggs:
+                fn = {"mean": np.add.reduceat, "min": np.minimum.reduceat, "max": np.maximum.reduceat}[agg]
+                block = fn(values, first_idx, axis=0) if len(values) else values
+                if agg == "mean":
+                    block = block / np.diff(np.append(first_idx, len(values)))[:, None]
+                blocks.append(block)
+            if len(aggs) > 1:
+                columns = [f"{f}_{a}" for a in aggs for f in NUMERIC_FIELDS]
+            values = np.hstack(blocks) if blocks else values
+            stamps = np.maximum(labels, int(np.ceil(start)))
+
+        lines = [
+            "#datatype,string,long,dateTime:RFC3339," + ",".join(["double"] * len(columns)),
+            "#group,false,false,false," + ",".join(["false"] * len(columns)),
+            "#default,_result,,," + "," * (len(columns) - 1),
+            ",result,table,_time," + ",".join(columns),
+        ]
+        for ts, row in zip(stamps, values):
+            stamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(int(ts)))
+            lines.append(f",,0,{stamp}," + ",".join(repr(float(v)) for v in row))
+        return "\r\n".join(lines) + "\r\n\r\n"
+
+
+def analyze(df):
+    df_kw = df.copy()
+    df_kw['pt'] = df_kw['pt'] / 1000.0
+    df_kw['demand'] = df_kw['demand'] / 1000.0
+    optimizer = EnergyOptimizer(df_kw)
+    return (optimizer.detect_idle_state(duration_minutes=15, resample_interval_minutes=1)['total_idle_hours'],
+            optimizer.analyze_phase_balance().get('max_unbalance_percent'),
+            optimizer.analyze_power_factor().get('avg_pf'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--interval-s', type=int, default=10)
+    parser.add_argument('--minutes', type=int, default=1440)
+    args = parser.parse_args()
+
+    t0 = int(time.time()) // 60 * 60
+    stand_in = StandIn(args.interval_s, t0)
+    connector = InfluxConnector(stand_in.url, "t", "bench", "bench")
+    window = RollingWindow(connector, DEVICE, minutes=args.minutes)
+
+    full = {"bytes": [], "time": []}
+    incr = {"bytes": [], "time": []}
+    mismatches = 0
+    for it in range(args.iterations):
+        stand_in.now = t0 + it * 60
+        now = pd.Timestamp(stand_in.now, unit='s', tz='UTC')
+
+        b0, c0 = stand_in.bytes_sent, time.perf_counter()
+        df_full = connector.query_recent_data(minutes=args.minutes, device_id=DEVICE)
+        res_full = analyze(df_full)
+        full["time"].append(time.perf_counter() - c0)
+        full["bytes"].append(stand_in.bytes_sent - b0)
+
+        b0, c0 = stand_in.bytes_sent, time.perf_counter()
+        df_incr = window.refresh(now=now)
+        res_incr = analyze(df_incr)
+        incr["time"].append(time.perf_counter() - c0)
+        incr["bytes"].append(stand_in.bytes_sent - b0)
+
+        # Full re-query resamples from the first row in range; compare the overlapping minutes
+        common = df_full.index.intersection(df_incr.index)
+        if not (len(common) >= len(df_full) - 1 and np.allclose(df_full.loc[common], df_incr.loc[common])
+                and np.allclose(res_full, res_incr)):
+            mismatches += 1
+
+    connector.close()
+    rows = args.minutes * 60 // args.interval_s
+    print(f"{args.minutes} min window, one reading every {args.interval_s} s (~{rows} rows), "
+          f"{args.iterations} iterations of 1 simulated minute")
+    print(f"{'variant':<13}{'first KiB':>11}{'KiB/iter':>10}{'first ms':>10}{'ms/iter':>9}")
+    for name, r in (("full", full), ("incremental", incr)):
+        steady_b = sum(r["bytes"][1:]) / max(1, len(r["bytes"]) - 1)
+        steady_t = sum(r["time"][1:]) / max(1, len(r["time"]) - 1)
+        print(f"{name:<13}{r['bytes'][0] / 1024:>11.0f}{steady_b / 1024:>10.1f}"
+              f"{r['time'][0] * 1000:>10.0f}{steady_t * 1000:>9.1f}")
+    print(f"window stats: full={window.full_fetches} incremental={window.incremental_fetches} "
+          f"rows fetched={window.rows_fetched} held={len(window)}")
+    print(f"iterations where incremental != full re-query: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
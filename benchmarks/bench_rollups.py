@@ -0,0 +1,91 @@
+"""
+History charts: scanning raw readings vs RollupStore (1m/15m/1h/1d rollups).
+
+Synthetic readings (--fields fields, one every --every seconds) for --devices
+devices over --days days are fed to RollupStore.add() one by one, as the
+ingestion path does, and flushed to a temporary directory. Reported:
+
+- ingest: readings/sec folded into all four resolutions, bytes on disk
+- charts: time per /api/history-style series (mean per bucket, all devices)
+  for 1h / 24h / 7d / 30d ranges at the automatic resolution, from the
+  rollups vs a pandas resample of the raw readings held in memory (a lower
+  bound for scanning raw points in InfluxDB, which adds the query and the
+  transfer). The largest difference between the two results is checked.
+
+Usage:
+    python benchmarks/bench_rollups.py --devices 20 --days 30 --every 60
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.rollups import RollupStore
+
+FIELDS = ["power_kw", "current_a", "tension_g"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--every', type=int, default=60, help='seconds between readings')
+    parser.add_argument('--max-points', type=int, default=720)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    now = pd.Timestamp.now(tz='UTC').floor('1min')
+    index = pd.date_range(now - pd.Timedelta(days=args.days), now, freq=f"{args.every}s", inclusive='left')
+    devices = [f"10.0.{i // 250}.{i % 250}_TENSION_BOT" for i in range(args.devices)]
+    raw = {d: pd.DataFrame({f: rng.gamma(2.0, 5.0, len(index)) for f in FIELDS}, index=index) for d in devices}
+
+    with tempfile.TemporaryDirectory() as root:
+        store = RollupStore(root, FIELDS)
+        stamps = index.as_unit("ns").asi8.tolist()
+        t0 = time.perf_counter()
+        for d, df in raw.items():
+            for ts, row in zip(stamps, zip(*(df[f].tolist() for f in FIELDS))):
+                store.add(d, dict(zip(FIELDS, row)), ts)
+        ingest_s = time.perf_counter() - t0
+        store.flush()
+        readings = len(index) * len(devices)
+        stats = store.stats()
+        print(f"{len(devices)} devices x {args.days} days, a reading every {args.every}s: {readings} readings")
+        print(f"ingest: {readings / ingest_s:,.0f} readings/s ({ingest_s * 1e6 / readings:.1f} us each), "
+              f"{stats['bytes_on_disk'] / 1e6:.1f} MB on disk")
+
+        print(f"{'range':<7}{'rollup':>8}{'points':>8}{'raw scan ms':>13}{'rollups ms':>12}{'speed-up':>10}"
+              f"{'max |diff|':>12}")
+        for label in ("1h", "24h", "7D", "30D"):
+            span = min(pd.Timedelta(label), pd.Timedelta(days=args.days))
+            step = store.auto_step(span, args.max_points)
+            start = now - span
+            start = start.floor(step) if step < pd.Timedelta(days=1) else start.floor('1D')  # whole first bucket
+
+            t0 = time.perf_counter()
+            expected = {d: df.loc[start:].resample(step, origin='epoch').mean() for d, df in raw.items()}
+            raw_s = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            got = {d: store.series(d, start, now, step) for d in devices}
+            rollup_s = time.perf_counter() - t0
+
+            diff, points, rollup = 0.0, 0, None
+            for d in devices:
+                t, series, rollup = got[d]
+                ref = expected[d].dropna(how='all')
+                points += len(t)
+                for f in FIELDS:
+                    diff = max(diff, float(np.nanmax(np.abs(series[f] - ref[f].to_numpy()))))
+            print(f"{label:<7}{rollup:>8}{points // len(devices):>8}{raw_s * 1000:>13.1f}{rollup_s * 1000:>12.1f}"
+                  f"{raw_s / rollup_s:>9.0f}x{diff:>12.1e}")
+
+
+if __name__ == "__main__":
+    main()
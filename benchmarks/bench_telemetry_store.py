@@ -0,0 +1,80 @@
+"""
+30-day history pulls with and without the local TelemetryStore.
+
+Uses the /api/v2/query stand-in from bench_rolling_window (in-process, with
+--latency-ms per answer) and a temporary store directory. For raw rows (one
+reading every --interval-s seconds) and for 1-minute pushdown aggregates:
+
+- influx:  query_range() without a store (every day from InfluxDB)
+- cold:    query_range() with an empty store (pulls, then writes finished days)
+- restart: a new connector and store on the same directory, same query (only
+           the unfinished current day goes to InfluxDB)
+- read:    TelemetryStore.read() of the finished days alone (no network at all)
+
+Reports time, bytes received from the stand-in, and whether the frames equal
+the no-store pull.
+
+Usage:
+    python benchmarks/bench_telemetry_store.py --days 30 --interval-s 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_rolling_window import StandIn
+from energy_model.influx_connector import InfluxConnector, NUMERIC_FIELDS
+from energy_model.telemetry_store import TelemetryStore
+
+DEVICE = "energy*1*1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--interval-s', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    now = int(time.time()) // 60 * 60
+    stand_in = StandIn(args.interval_s, now, latency=args.latency_ms / 1000.0)
+    stop = pd.Timestamp(now, unit='s', tz='UTC')
+    start = stop - pd.Timedelta(days=args.days)
+    root = tempfile.mkdtemp(prefix="telemetry_")
+
+    def connector(store):
+        return InfluxConnector(stand_in.url, "t", "bench", "bench", store=store)
+
+    def timed(fn):
+        b0, t0 = stand_in.bytes_sent, time.perf_counter()
+        df = fn()
+        return df, time.perf_counter() - t0, stand_in.bytes_sent - b0
+
+    print(f"{args.days} days, one reading every {args.interval_s} s, {args.latency_ms:g} ms per query")
+    print(f"{'rows':<7}{'variant':<10}{'rows':>9}{'ms':>10}{'KiB from influx':>17}{'equal':>7}")
+    for resolution in (None, '1min'):
+        label = resolution or 'raw'
+        reference, seconds, nbytes = timed(lambda: connector(None).query_range(start, stop, DEVICE, resolution))
+        print(f"{label:<7}{'influx':<10}{len(reference):>9}{seconds * 1000:>10.1f}{nbytes / 1024:>17.0f}")
+        for variant in ("cold", "restart"):
+            store = TelemetryStore(root, NUMERIC_FIELDS)
+            df, seconds, nbytes = timed(lambda: connector(store).query_range(start, stop, DEVICE, resolution))
+            same = df.index.equals(reference.index) and np.allclose(
+                df[reference.columns].values, reference.values, equal_nan=True)
+            print(f"{'':<7}{variant:<10}{len(df):>9}{seconds * 1000:>10.1f}{nbytes / 1024:>17.0f}{str(same):>7}")
+        store = TelemetryStore(root, NUMERIC_FIELDS)
+        kind = store.kind(None if resolution is None else pd.Timedelta(resolution))
+        final = store.final_days(start, stop)
+        df, seconds, nbytes = timed(lambda: store.read("bench", kind, DEVICE, start, final[-1] + pd.Timedelta(days=1)))
+        print(f"{'':<7}{'read':<10}{len(df):>9}{seconds * 1000:>10.1f}{nbytes / 1024:>17.0f}")
+    print(f"store: {TelemetryStore(root, NUMERIC_FIELDS).stats()}")
+
+
+if __name__ == "__main__":
+    main()
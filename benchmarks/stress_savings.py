@@ -0,0 +1,144 @@
+"""
+Concurrency stress test for SavingsAccumulator.
+
+N threads each play one device and add --updates savings deltas (the same
+deltas handle_message would add for a lubrication + tension pair), while a
+reader thread keeps calling totals() like the broadcaster does. Afterwards:
+
+- totals and per-device values must equal a sequential reference exactly
+- per-shift values must add up to the totals
+- a checkpoint reloaded into a fresh accumulator must match exactly
+
+The same workload is also run against a plain dict updated with `+=` (the old
+GLOBAL_STATE['energy_stats'] path) to show how many updates it loses.
+
+Usage:
+    python benchmarks/stress_savings.py --devices 1000 --updates 200
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from energy_model.accumulators import DEFAULT_FIELDS, SavingsAccumulator
+
+DAY = 1760774400 + 9 * 3600     # some morning (day shift)
+NIGHT = DAY + 12 * 3600         # same evening (night shift)
+
+
+def deltas_for(device, updates):
+    rng = random.Random(device)
+    out = []
+    for i in range(updates):
+        kwh = rng.uniform(0, 0.002)
+        oil = rng.uniform(-0.002, 0.02)
+        out.append((DAY if i % 2 else NIGHT, {
+            "total_savings_kwh": kwh,
+            "total_savings_elec_cost": kwh * 0.5,
+            "total_savings_oil_liters": oil,
+            "total_savings_cost": kwh * 0.5 + oil * 20.0,
+        }))
+    return out
+
+
+def run_threads(n, target):
+    barrier = threading.Barrier(n)
+    threads = [threading.Thread(target=target, args=(i, barrier)) for i in range(n)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--shards', type=int, default=16)
+    args = parser.parse_args()
+
+    # Force frequent thread switches so races show up quickly
+    sys.setswitchinterval(1e-6)
+    keys = [f"10.0.{i // 250}.{i % 250}_LUBRICATION_BOT" for i in range(args.devices)]
+    work = {k: deltas_for(k, args.updates) for k in keys}
+
+    # Sequential reference: per-device sums in submission order, merged in key order
+    reference_devices = {}
+    for k in keys:
+        row = {f: 0.0 for f in DEFAULT_FIELDS}
+        for _, d in work[k]:
+            for f, v in d.items():
+                row[f] += v
+        reference_devices[k] = row
+    reference = {f: math.fsum(reference_devices[k][f] for k in sorted(keys)) for f in DEFAULT_FIELDS}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        acc = SavingsAccumulator(shards=args.shards, checkpoint_path=os.path.join(tmp, "savings.json"))
+        done = threading.Event()
+
+        def reader():
+            while not done.is_set():
+                acc.totals()
+
+        def device(i, barrier):
+            barrier.wait()
+            key = keys[i]
+            for ts, d in work[key]:
+                acc.add(key, timestamp=ts, **d)
+
+        r = threading.Thread(target=reader)
+        r.start()
+        elapsed = run_threads(args.devices, device)
+        done.set()
+        r.join()
+
+        totals = acc.totals()
+        exact = all(totals[f] == reference[f] for f in DEFAULT_FIELDS)
+        per_device = acc.by_device() == reference_devices
+        shifts = acc.by_shift()
+        shift_sum = all(math.isclose(sum(s[f] for s in shifts.values()), totals[f], rel_tol=1e-12, abs_tol=1e-12)
+                        for f in DEFAULT_FIELDS)
+        acc.checkpoint()
+        restored = SavingsAccumulator(checkpoint_path=os.path.join(tmp, "savings.json"))
+        restore_ok = restored.totals() == totals and restored.by_shift() == shifts
+
+    legacy = {f: 0.0 for f in DEFAULT_FIELDS}
+    price = {"ONE": 1.0}.get  # stands in for settings.get() on the right-hand side
+
+    def legacy_device(i, barrier):
+        barrier.wait()
+        for _, d in work[keys[i]]:
+            for f, v in d.items():
+                # As in the old handler: the current value is loaded before the
+                # right-hand side (with its call) runs, so another thread can
+                # store in between and its update is overwritten.
+                legacy[f] += v * price("ONE")
+
+    legacy_elapsed = run_threads(args.devices, legacy_device)
+
+    total_updates = args.devices * args.updates
+    print(f"{args.devices} devices x {args.updates} updates = {total_updates} updates, {args.shards} shards")
+    print(f"accumulator: {elapsed:.2f} s ({total_updates / elapsed:.0f} updates/s)")
+    print(f"  totals exact        : {exact}")
+    print(f"  per-device exact    : {per_device}")
+    print(f"  shifts sum to totals: {shift_sum} ({', '.join(shifts)})")
+    print(f"  checkpoint restore  : {restore_ok}")
+    print(f"legacy dict +=: {legacy_elapsed:.2f} s")
+    for f in DEFAULT_FIELDS:
+        err = legacy[f] - reference[f]
+        print(f"  {f:<26} expected {reference[f]:>14.6f}  got {legacy[f]:>14.6f}  "
+              f"diff {err:>+12.6f} ({err / reference[f] * 100:+.2f}%)")
+    if not (exact and per_device and shift_sum and restore_ok):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
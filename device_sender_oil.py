@@ -1,12 +1,15 @@
 import socket
-import json
 import time
 import random
 from datetime import datetime
 
+from energy_model.protocol import FrameDecoder, encode_message, negotiate_encoding, recv_message
+
 # 连接配置
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 8012
+# 通信编码: 'binary' (紧凑二进制帧，握手协商) 或 'json'
+ENCODING = 'binary'
 
 
 class DevicePhysics:
@@ -85,14 +88,16 @@ def start_device():
             print(f"🔄 [润滑设备] 正在连接中心 {SERVER_HOST}:{SERVER_PORT}...")
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 s.connect((SERVER_HOST, SERVER_PORT))
-                print(f"✅ [润滑设备] 已连接!")
+                decoder = FrameDecoder()
+                encoding = negotiate_encoding(s, decoder, ENCODING, "LUBRICATION_BOT")
+                print(f"✅ [润滑设备] 已连接! (编码: {encoding})")
 
                 while True:
                     data = device.get_data()
-                    s.sendall(json.dumps(data).encode('utf-8'))
+                    s.sendall(encode_message(data, encoding))
 
-                    # 接收指令
-                    resp = json.loads(s.recv(1024).decode('utf-8'))
+                    # 接收指令 (按帧读取，避免粘包/拆包)
+                    resp = recv_message(s, decoder)
                     action = resp.get("action", "MONITOR")
                     # --- 修改开始: 优化显示逻辑 ---
                     if not device.is_running:
@@ -1,11 +1,14 @@
 import socket
-import json
 import time
 import random
 import numpy as np
 
+from energy_model.protocol import FrameDecoder, encode_message, negotiate_encoding, recv_message
+
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 8012  # 注意：连接同一个端口
+# 通信编码: 'binary' (紧凑二进制帧，握手协商) 或 'json'
+ENCODING = 'binary'
 
 
 class KnittingMachineSim:
@@ -68,13 +71,15 @@ def start_device():
             print(f"🔄 [张力设备] 正在连接中心 {SERVER_HOST}:{SERVER_PORT}...")
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 s.connect((SERVER_HOST, SERVER_PORT))
-                print(f"✅ [张力设备] 已连接!")
+                decoder = FrameDecoder()
+                encoding = negotiate_encoding(s, decoder, ENCODING, "TENSION_BOT")
+                print(f"✅ [张力设备] 已连接! (编码: {encoding})")
 
                 while True:
                     data = machine.get_data()
-                    s.sendall(json.dumps(data).encode('utf-8'))
+                    s.sendall(encode_message(data, encoding))
 
-                    resp = json.loads(s.recv(1024).decode('utf-8'))
+                    resp = recv_message(s, decoder)
                     action = resp.get("action", "MONITOR")
 
                     # --- 修改开始 ---
@@ -0,0 +1,226 @@
+"""
+Sharded, thread-safe energy savings accumulators.
+
+Every device connection adds its savings to the shard that owns the device
+(striped by device key), so concurrent connections only contend when they hash
+to the same shard and no update is ever lost. Reads merge the shards:
+
+- totals():    fleet totals in the shape of GLOBAL_STATE['energy_stats']
+- by_device(): per-device totals
+- by_shift():  fleet totals per production shift (e.g. "2026-10-18_day")
+
+Counters are summed per device and merged with math.fsum in key order, so the
+result does not depend on how threads interleaved. Gauges (latest power per
+device) are reported as the sum over devices. Counters are checkpointed to a
+JSON file (written atomically) and restored on start, so totals survive
+restarts.
+"""
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_FIELDS = ("total_savings_kwh", "total_savings_elec_cost", "total_savings_oil_liters", "total_savings_cost")
+DEFAULT_GAUGES = ("current_total_power", "baseline_total_power")
+# (name, start hour); a shift lasts until the next one starts
+DEFAULT_SHIFTS = (("day", 8), ("night", 20))
+
+
+def shift_key(timestamp, shifts=DEFAULT_SHIFTS):
+    """
+    Shift a timestamp falls into, as "<date the shift started>_<name>".
+
+    Args:
+        timestamp (float): Unix time.
+        shifts (sequence): (name, start_hour) pairs.
+    """
+    dt = datetime.fromtimestamp(timestamp)
+    ordered = sorted(shifts, key=lambda s: s[1])
+    current = None
+    for name, start in ordered:
+        if dt.hour >= start:
+            current = name
+    if current is None:
+        # Before the first start of the day: still in yesterday's last shift
+        current = ordered[-1][0]
+        dt = datetime.fromtimestamp(timestamp - 86400)
+    return f"{dt.strftime('%Y-%m-%d')}_{current}"
+
+
+class _Shard:
+    __slots__ = ("lock", "devices", "shifts", "gauges")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.devices = {}  # device -> [value per field]
+        self.shifts = {}   # (shift, device) -> [value per field]
+        self.gauges = {}   # device -> [value per gauge]
+
+
+class SavingsAccumulator:
+    def __init__(self, fields=DEFAULT_FIELDS, gauges=DEFAULT_GAUGES, shards=16, shifts=DEFAULT_SHIFTS,
+                 checkpoint_path=None, keep_shifts=42):
+        """
+        Args:
+            fields (sequence): Counter names (summed).
+            gauges (sequence): Gauge names (latest value per device, summed over devices on read).
+            shards (int): Number of lock stripes.
+            shifts (sequence): (name, start_hour) pairs for the per-shift breakdown.
+            checkpoint_path (str): JSON checkpoint file; loaded on init if it exists.
+            keep_shifts (int): Number of most recent shifts kept in the breakdown.
+        """
+        self.fields = tuple(fields)
+        self.gauges = tuple(gauges)
+        self.shifts = shifts
+        self.checkpoint_path = checkpoint_path
+        self.keep_shifts = keep_shifts
+        self._index = {f: i for i, f in enumerate(self.fields)}
+        self._gauge_index = {g: i for i, g in enumerate(self.gauges)}
+        self._shards = [_Shard() for _ in range(shards)]
+        self._stop = threading.Event()
+        self._thread = None
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self.load(checkpoint_path)
+
+    def _shard(self, device):
+        return self._shards[hash(device) % len(self._shards)]
+
+    def add(self, device, timestamp=None, **deltas):
+        """Add counter deltas for one device, e.g. add(key, total_savings_kwh=0.01)."""
+        shift = shift_key(timestamp or time.time(), self.shifts)
+        shard = self._shard(device)
+        with shard.lock:
+            totals = shard.devices.get(device)
+            if totals is None:
+                totals = shard.devices[device] = [0.0] * len(self.fields)
+            per_shift = shard.shifts.get((shift, device))
+            if per_shift is None:
+                per_shift = shard.shifts[(shift, device)] = [0.0] * len(self.fields)
+            for name, value in deltas.items():
+                i = self._index[name]
+                totals[i] += value
+                per_shift[i] += value
+
+    def set_gauges(self, device, **values):
+        shard = self._shard(device)
+        with shard.lock:
+            gauges = shard.gauges.get(device)
+            if gauges is None:
+                gauges = shard.gauges[device] = [0.0] * len(self.gauges)
+            for name, value in values.items():
+                gauges[self._gauge_index[name]] = value
+
+    def clear_gauges(self, device):
+        """Forget a device's gauges (e.g. when it disconnects)."""
+        shard = self._shard(device)
+        with shard.lock:
+            shard.gauges.pop(device, None)
+
+    def _collect(self):
+        devices, shifts, gauges = {}, {}, {}
+        for shard in self._shards:
+            with shard.lock:
+                devices.update((k, list(v)) for k, v in shard.devices.items())
+                shifts.update((k, list(v)) for k, v in shard.shifts.items())
+                gauges.update((k, list(v)) for k, v in shard.gauges.items())
+        return devices, shifts, gauges
+
+    def _merge(self, rows):
+        rows = [rows[k] for k in sorted(rows)]
+        return {f: math.fsum(r[i] for r in rows) for i, f in enumerate(self.fields)}
+
+    def totals(self):
+        devices, _, gauges = self._collect()
+        out = self._merge(devices)
+        rows = [gauges[k] for k in sorted(gauges)]
+        out.update({g: math.fsum(r[i] for r in rows) for i, g in enumerate(self.gauges)})
+        return out
+
+    def by_device(self):
+        devices, _, _ = self._collect()
+        return {k: dict(zip(self.fields, v)) for k, v in sorted(devices.items())}
+
+    def by_shift(self):
+        _, shifts, _ = self._collect()
+        grouped = {}
+        for (shift, device), values in shifts.items():
+            grouped.setdefault(shift, {})[device] = values
+        return {shift: self._merge(rows) for shift, rows in sorted(grouped.items())}
+
+    def _prune_shifts(self):
+        keys = set()
+        for shard in self._shards:
+            with shard.lock:
+                keys.update(s for s, _ in shard.shifts)
+        stale = set(sorted(keys)[:-self.keep_shifts]) if len(keys) > self.keep_shifts else set()
+        if not stale:
+            return
+        for shard in self._shards:
+            with shard.lock:
+                for key in [k for k in shard.shifts if k[0] in stale]:
+                    del shard.shifts[key]
+
+    def checkpoint(self, path=None):
+        """Write counters to disk (atomic replace)."""
+        path = path or self.checkpoint_path
+        if not path:
+            return
+        self._prune_shifts()
+        devices, shifts, _ = self._collect()
+        data = {
+            "fields": list(self.fields),
+            "saved_at": time.time(),
+            "devices": devices,
+            "shifts": [[shift, device, values] for (shift, device), values in shifts.items()],
+        }
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """Restore counters from a checkpoint (fields are matched by name)."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"⚠️ [Savings] Failed to load checkpoint {path}: {e}")
+            return
+        columns = [(self._index[f], j) for j, f in enumerate(data.get("fields", [])) if f in self._index]
+
+        def row(values):
+            out = [0.0] * len(self.fields)
+            for i, j in columns:
+                out[i] = float(values[j])
+            return out
+
+        for device, values in data.get("devices", {}).items():
+            shard = self._shard(device)
+            with shard.lock:
+                shard.devices[device] = row(values)
+        for shift, device, values in data.get("shifts", []):
+            shard = self._shard(device)
+            with shard.lock:
+                shard.shifts[(shift, device)] = row(values)
+        print(f"💾 [Savings] Restored {len(data.get('devices', {}))} devices from {path}")
+
+    def start_checkpointer(self, interval=30.0):
+        if not self.checkpoint_path or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="savings-checkpoint", daemon=True)
+        self._thread.start()
+
+    def stop_checkpointer(self):
+        """Stop the background thread and write a final checkpoint."""
+        self._stop.set()
+        self.checkpoint()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.checkpoint()
+            except Exception as e:
+                print(f"⚠️ [Savings] Checkpoint error: {e}")
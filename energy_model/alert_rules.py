@@ -0,0 +1,302 @@
+"""
+Declarative alert rules, evaluated for all devices of a monitoring cycle at once.
+
+A rule compares one metric against a threshold:
+
+    {"id": "unbalance_critical", "metric": "unbalance", "op": ">", "value": 25, "clear": 22,
+     "level": "CRITICAL", "confidence": "高", "msg": "⚡ 三相严重不平: {unbalance:.1f}%",
+     "group": "unbalance"}
+
+- op:       one of > >= < <=
+- clear:    hysteresis; an active rule stays active until the metric no longer
+            satisfies `op clear` (defaults to `value`, i.e. no hysteresis)
+- group:    rules of a group are exclusive, the first active one in list order
+            wins (if / elif)
+- unless:   level (e.g. "CRITICAL"); the rule is suppressed while any rule of
+            that level is active for the device
+- first:    put the alert in front of the others
+- notify:   report the alert for sending (DingTalk) when it becomes active, and
+            again every `renotify_s` seconds while it stays active (0 = once)
+- msg:      str.format template over the device's metrics (compiled once)
+
+AlertRuleEngine compiles the rules once into arrays (metric column, sign,
+strictness, value, clear per rule), and evaluate() compares a (devices, metrics)
+table against all of them in one NumPy pass; group exclusivity is one matrix
+product. Active state (for hysteresis) and notification times are kept per
+device and rule. Missing metrics take their METRIC_DEFAULTS value (NaN if not
+listed), and comparisons with NaN are false.
+"""
+import json
+import os
+import string
+import threading
+import time
+
+import numpy as np
+
+# Metric columns and their value when a device does not report them
+# (same defaults as the former if-chain in analyze_monitor_device)
+METRIC_DEFAULTS = {
+    "power_kw": np.nan,
+    "baseline_kw": np.nan,
+    "power_ratio": np.nan,  # power_kw / baseline_kw
+    "unbalance": 0.0,  # max_unbalance_percent
+    "avg_pf": 1.0,
+    "idle_hours": 0.0,
+    "idle_minutes": 0.0,
+}
+
+DEFAULT_RULES = [
+    # A. Power vs baseline
+    {"id": "power_critical", "metric": "power_ratio", "op": ">", "value": 1.2, "clear": 1.15, "group": "power",
+     "level": "CRITICAL", "confidence": "高", "msg": "🔥 能耗严重超标: {power_kw:.1f}kW (>120%)", "notify": True},
+    {"id": "power_high", "metric": "power_ratio", "op": ">", "value": 1.1, "clear": 1.05, "group": "power",
+     "level": "WARNING", "confidence": "中", "msg": "⚠️ 能耗偏高: {power_kw:.1f}kW (>110%)"},
+    # B. Phase balance
+    {"id": "unbalance_critical", "metric": "unbalance", "op": ">", "value": 25, "clear": 22, "group": "unbalance",
+     "level": "CRITICAL", "confidence": "高", "msg": "⚡ 三相严重不平: {unbalance:.1f}%"},
+    {"id": "unbalance_warning", "metric": "unbalance", "op": ">", "value": 15, "clear": 12, "group": "unbalance",
+     "level": "WARNING", "confidence": "中", "msg": "⚠️ 三相不平衡: {unbalance:.1f}%"},
+    # C. Power factor
+    {"id": "pf_low", "metric": "avg_pf", "op": "<", "value": 0.85, "clear": 0.87, "group": "pf",
+     "level": "WARNING", "confidence": "高", "msg": "📉 功率因数过低: {avg_pf:.2f}"},
+    {"id": "pf_notice", "metric": "avg_pf", "op": "<", "value": 0.90, "clear": 0.92, "group": "pf",
+     "level": "NOTICE", "confidence": "低", "msg": "ℹ️ 功率因数需优化: {avg_pf:.2f}"},
+    # D. Idle
+    {"id": "idle_long", "metric": "idle_hours", "op": ">", "value": 1.0, "clear": 0.8, "group": "idle",
+     "level": "WARNING", "confidence": "高", "msg": "💤 长时间空转: {idle_hours:.1f}h"},
+    {"id": "idle_some", "metric": "idle_hours", "op": ">", "value": 0.2, "clear": 0.15, "group": "idle",
+     "level": "NOTICE", "confidence": "中", "msg": "ℹ️ 识别到间歇空转: {idle_minutes:.0f}min"},
+    # E. Tips (only without critical alerts)
+    {"id": "tip_baseline", "metric": "power_ratio", "op": "<=", "value": 1.05, "unless": "CRITICAL", "first": True,
+     "level": "NOTICE", "confidence": "高", "msg": "✅ 机器能耗未超越基线模型，能耗正常"},
+    {"id": "tip_pf", "metric": "avg_pf", "op": ">", "value": 0.95, "unless": "CRITICAL",
+     "level": "NOTICE", "confidence": "高", "msg": "✅ 功率因数优异，无需补偿"},
+    {"id": "tip_balance", "metric": "unbalance", "op": "<", "value": 5, "unless": "CRITICAL",
+     "level": "NOTICE", "confidence": "高", "msg": "✅ 三相平衡良好"},
+]
+
+# op -> (sign, strict): x op v  <=>  sign*x > sign*v (strict) or sign*x >= sign*v
+_OPS = {">": (1.0, True), ">=": (1.0, False), "<": (-1.0, True), "<=": (-1.0, False)}
+
+
+def load_rules(path):
+    """
+    Rules from a JSON file (a list, or {"rules": [...]}); DEFAULT_RULES if the file does not exist.
+
+    Returns:
+        list: Rule dicts.
+    """
+    if not path or not os.path.exists(path):
+        return [dict(rule) for rule in DEFAULT_RULES]
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data["rules"] if isinstance(data, dict) else data
+
+
+def _compile_template(template, metric_pos):
+    """'{unbalance:.1f}%' -> '{0[3]:.1f}%' (formatted with the device's metric list), None if constant."""
+    parts = []
+    fields = False
+    for literal, name, spec, conversion in string.Formatter().parse(template):
+        parts.append(literal.replace('{', '{{').replace('}', '}}'))
+        if name is not None:
+            if name not in metric_pos:
+                raise ValueError(f"unknown metric {name!r} in alert message {template!r}")
+            fields = True
+            parts.append("{0[%d]%s%s}" % (metric_pos[name], f"!{conversion}" if conversion else "",
+                                          f":{spec}" if spec else ""))
+    return "".join(parts) if fields else None
+
+
+class AlertRuleEngine:
+    def __init__(self, rules=None, metrics=None):
+        """
+        Args:
+            rules (list): Rule dicts (defaults to DEFAULT_RULES).
+            metrics (dict): Metric name -> default value (defaults to METRIC_DEFAULTS; metrics
+                used by rules but not listed default to NaN).
+
+        Raises:
+            ValueError: A rule has no id / metric, an unknown op, a duplicate id, or a message
+                referring to an unknown metric.
+        """
+        self._lock = threading.Lock()
+        self._metric_defaults = dict(METRIC_DEFAULTS if metrics is None else metrics)
+        self._compile(DEFAULT_RULES if rules is None else rules)
+
+    def _compile(self, rules):
+        metrics = self._metric_defaults
+        seen = set()
+        for rule in rules:
+            if not rule.get("id") or not rule.get("metric"):
+                raise ValueError(f"alert rule needs 'id' and 'metric': {rule}")
+            if rule.get("op") not in _OPS:
+                raise ValueError(f"alert rule {rule['id']}: unknown op {rule.get('op')!r}")
+            if rule["id"] in seen:
+                raise ValueError(f"duplicate alert rule id {rule['id']!r}")
+            seen.add(rule["id"])
+        self.rules = [dict(rule) for rule in rules]
+        names = list(metrics)
+        names += sorted({r["metric"] for r in rules} - set(names))
+        self.metrics = names
+        self._metric_pos = {m: i for i, m in enumerate(names)}
+        self._templates = [_compile_template(r.get("msg", r["id"]), self._metric_pos) for r in rules]
+        self._defaults = np.array([metrics.get(m, np.nan) for m in names], dtype=np.float64)
+
+        n = len(rules)
+        self._column = np.array([self._metric_pos[r["metric"]] for r in rules], dtype=np.intp)
+        self._sign = np.array([_OPS[r["op"]][0] for r in rules])
+        self._strict = np.array([_OPS[r["op"]][1] for r in rules])
+        self._value = self._sign * np.array([float(r["value"]) for r in rules])
+        self._clear = self._sign * np.array([float(r.get("clear", r["value"])) for r in rules])
+        # earlier[j, k]: j comes before k in the same group (k is suppressed while j is active)
+        groups = [r.get("group") for r in rules]
+        self._earlier = np.zeros((n, n), dtype=np.int32)
+        for k in range(n):
+            for j in range(k):
+                self._earlier[j, k] = groups[j] is not None and groups[j] == groups[k]
+        self._unless = {}
+        for k, r in enumerate(rules):
+            if r.get("unless"):
+                self._unless.setdefault(r["unless"], []).append(k)
+        self._level_rules = {
+            level: np.array([k for k, r in enumerate(rules) if r.get("level") == level and not r.get("unless")],
+                            dtype=np.intp)
+            for level in self._unless}
+        self._notify = np.array([bool(r.get("notify")) for r in rules])
+        self._renotify = np.array([float(r.get("renotify_s", 0)) for r in rules])
+        # Output order: 'first' rules in front, otherwise list order
+        self._order = sorted(range(n), key=lambda k: not rules[k].get("first"))
+
+        self._rows = {}  # device_id -> row of the state arrays
+        self._free = []
+        self._active = np.zeros((0, n), dtype=bool)
+        self._notified = np.zeros((0, n))
+        self.evaluations = 0
+        self.notifications = 0
+
+    def reload(self, rules):
+        """Replace the rules (state is reset)."""
+        with self._lock:
+            self._compile(rules)
+
+    def _device_rows(self, device_ids):
+        rows = np.empty(len(device_ids), dtype=np.intp)
+        for i, device_id in enumerate(device_ids):
+            row = self._rows.get(device_id)
+            if row is None:
+                if self._free:
+                    row = self._free.pop()
+                else:
+                    row = len(self._rows)
+                    if row >= len(self._active):
+                        grow = max(64, len(self._active))
+                        self._active = np.vstack([self._active, np.zeros((grow, len(self.rules)), dtype=bool)])
+                        self._notified = np.vstack([self._notified, np.zeros((grow, len(self.rules)))])
+                self._rows[device_id] = row
+            rows[i] = row
+        return rows
+
+    def forget(self, device_ids):
+        """Drop the state of devices that are no longer monitored."""
+        with self._lock:
+            for device_id in device_ids:
+                row = self._rows.pop(device_id, None)
+                if row is not None:
+                    self._active[row] = False
+                    self._notified[row] = 0.0
+                    self._free.append(row)
+
+    def table(self, metrics_by_device):
+        """(devices, metrics) float array from {device_id: {metric: value}} (missing = default, None = NaN)."""
+        device_ids = list(metrics_by_device)
+        rows = list(metrics_by_device.values())
+        values = np.empty((len(device_ids), len(self.metrics)))
+        for j, (name, default) in enumerate(zip(self.metrics, self._defaults.tolist())):
+            values[:, j] = np.array([row.get(name, default) for row in rows], dtype=np.float64)
+        return device_ids, values
+
+    def evaluate(self, device_ids, values, now=None):
+        """
+        Evaluate every rule for every device.
+
+        Args:
+            device_ids (list): Row labels of `values`.
+            values (np.ndarray): (devices, metrics) in the order of self.metrics (see table()).
+            now (float): Time for notification intervals (defaults to time.time()).
+
+        Returns:
+            tuple: (active, notify) boolean (devices, rules) arrays; notify marks the active
+                   alerts that should be sent now.
+        """
+        now = time.time() if now is None else now
+        values = np.asarray(values, dtype=np.float64)
+        with self._lock:
+            rows = self._device_rows(device_ids)
+            prev = self._active[rows]
+            x = values[:, self._column] * self._sign
+            fire = np.where(self._strict, x > self._value, x >= self._value)
+            hold = np.where(self._strict, x > self._clear, x >= self._clear)
+            active = np.where(prev, hold, fire)
+            active &= (active.astype(np.int32) @ self._earlier) == 0
+            for level, rules in self._unless.items():
+                blocked = active[:, self._level_rules[level]].any(axis=1)
+                active[:, rules] &= ~blocked[:, None]
+
+            notified = self._notified[rows]
+            # notified is reset while a rule is inactive, so a newly active rule is always due
+            due = (notified == 0) | ((self._renotify > 0) & (now - notified >= self._renotify))
+            notify = active & self._notify & due
+            notified = np.where(notify, now, np.where(active, notified, 0.0))
+            self._active[rows] = active
+            self._notified[rows] = notified
+            self.evaluations += len(device_ids) * len(self.rules)
+            self.notifications += int(notify.sum())
+        return active, notify
+
+    def alerts(self, device_ids, values, active):
+        """
+        Alert dicts per device for an evaluate() result.
+
+        Returns:
+            dict: device_id -> [{"msg", "level", "confidence"}, ...] ('first' rules in front).
+        """
+        result = {device_id: [] for device_id in device_ids}
+        order = np.asarray(self._order, dtype=np.intp)
+        rows, cols = np.nonzero(active[:, order])  # row-major: per device, in output order
+        table = values.tolist()
+        for i, k in zip(rows.tolist(), order[cols].tolist()):
+            rule = self.rules[k]
+            result[device_ids[i]].append({"msg": self._message(k, table[i]), "level": rule.get("level", "NOTICE"),
+                                          "confidence": rule.get("confidence", "中")})
+        return result
+
+    def _message(self, k, row):
+        template = self._templates[k]
+        return self.rules[k].get("msg", self.rules[k]["id"]) if template is None else template.format(row)
+
+    def run(self, metrics_by_device, now=None):
+        """
+        table() + evaluate() + alerts().
+
+        Returns:
+            tuple: ({device_id: [alert, ...]}, [(device_id, rule_id, msg), ...] to send).
+        """
+        device_ids, values = self.table(metrics_by_device)
+        active, notify = self.evaluate(device_ids, values, now)
+        alerts = self.alerts(device_ids, values, active)
+        sends = [(device_ids[i], self.rules[k]["id"], self._message(k, values[i].tolist()))
+                 for i, k in zip(*np.nonzero(notify))]
+        return alerts, sends
+
+    def stats(self):
+        with self._lock:
+            active = self._active[list(self._rows.values())] if self._rows else np.zeros((0, len(self.rules)))
+            return {
+                "rule_count": len(self.rules),
+                "devices": len(self._rows),
+                "active": {r["id"]: int(n) for r, n in zip(self.rules, active.sum(axis=0)) if n},
+                "evaluations": self.evaluations,
+                "notifications": self.notifications,
+            }
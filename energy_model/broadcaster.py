@@ -0,0 +1,180 @@
+"""
+Coalesced Socket.IO broadcasting for the dashboard.
+
+Instead of emitting `device_update` and the full `stats_update` for every
+reading, callers record changes here and a background thread flushes them every
+`interval` seconds as a single `tick_update` event:
+
+    {
+        "devices": {device_key: {only the fields that changed}},
+        "removed": [{"key": ..., "ip": ..., "type": ...}],
+        "stats":   {only the energy_stats fields that changed},
+    }
+
+A device seen for the first time (or after a reconnect) is sent in full.
+Dashboards merge the partial records into what they already hold.
+
+With `rooms_for`, device diffs are routed: each room gets one frame per tick
+holding only its own devices, while stats still go to every client.
+"""
+import threading
+
+_MISSING = object()
+
+
+def snapshot(value):
+    """Copy nested dicts so later in-place updates don't leak into the last-sent state."""
+    if isinstance(value, dict):
+        return {k: snapshot(v) for k, v in value.items()}
+    return value
+
+
+def diff_dict(old, new):
+    """Fields of `new` that differ from `old`, recursing into nested dicts."""
+    if old is None:
+        return snapshot(new)
+    out = {}
+    for key, value in new.items():
+        prev = old.get(key, _MISSING)
+        if isinstance(value, dict) and isinstance(prev, dict):
+            nested = diff_dict(prev, value)
+            if nested:
+                out[key] = nested
+        elif prev is _MISSING or prev != value:
+            out[key] = snapshot(value)
+    return out
+
+
+class TickBroadcaster:
+    def __init__(self, emit, interval=0.25, event='tick_update', rooms_for=None):
+        """
+        Args:
+            emit (callable): emit(event, payload, to=None), e.g. socketio.emit.
+            interval (float): Flush period in seconds.
+            event (str): Socket.IO event name used for flushes.
+            rooms_for (callable): rooms_for(device_key) -> list of rooms the
+                device's updates go to. None broadcasts everything to everyone.
+        """
+        self._emit = emit
+        self.rooms_for = rooms_for
+        self.interval = interval
+        self.event = event
+        self._lock = threading.Lock()       # Guards the pending_* fields (producers)
+        self._sent_lock = threading.Lock()  # Guards the sent_* fields (flush vs full_state)
+        self._pending_devices = {}
+        self._pending_removed = {}
+        self._pending_stats = None
+        self._sent_devices = {}
+        self._sent_stats = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.frames_emitted = 0
+
+    def update_device(self, key, record):
+        """`record` is a dict, or a callable returning one that is evaluated at flush time."""
+        with self._lock:
+            self._pending_devices[key] = record
+            self._pending_removed.pop(key, None)
+
+    def remove_device(self, key, record=None):
+        with self._lock:
+            self._pending_devices.pop(key, None)
+            self._pending_removed[key] = record or {}
+
+    def update_stats(self, stats):
+        """`stats` is a dict, or a callable returning one that is evaluated once at flush time."""
+        with self._lock:
+            self._pending_stats = stats
+
+    def flush(self):
+        """Emit one tick with everything that changed since the previous one."""
+        with self._lock:
+            devices, self._pending_devices = self._pending_devices, {}
+            removed, self._pending_removed = self._pending_removed, {}
+            stats, self._pending_stats = self._pending_stats, None
+
+        with self._sent_lock:
+            payload = self._diff(devices, removed, stats)
+        if not payload:
+            return payload
+        if self.rooms_for is None:
+            self._emit(self.event, payload)
+            self.frames_emitted += 1
+            return payload
+
+        if "stats" in payload:
+            self._emit(self.event, {"stats": payload["stats"]})
+            self.frames_emitted += 1
+        for room, room_payload in self._route(payload).items():
+            self._emit(self.event, room_payload, to=room)
+            self.frames_emitted += 1
+        return payload
+
+    def _route(self, payload):
+        """Split device diffs and removals by room."""
+        by_room = {}
+        for key, changed in payload.get("devices", {}).items():
+            for room in self.rooms_for(key):
+                by_room.setdefault(room, {}).setdefault("devices", {})[key] = changed
+        for gone in payload.get("removed", []):
+            for room in self.rooms_for(gone["key"]):
+                by_room.setdefault(room, {}).setdefault("removed", []).append(gone)
+        return by_room
+
+    def _diff(self, devices, removed, stats):
+        payload = {}
+        device_diffs = {}
+        for key, record in devices.items():
+            record = snapshot(record() if callable(record) else record)
+            changed = diff_dict(self._sent_devices.get(key), record)
+            if changed:
+                device_diffs[key] = changed
+            self._sent_devices[key] = record
+        if device_diffs:
+            payload["devices"] = device_diffs
+
+        if removed:
+            gone = []
+            for key, record in removed.items():
+                last = self._sent_devices.pop(key, None) or record
+                gone.append({"key": key, "ip": last.get("ip"), "type": last.get("type")})
+            payload["removed"] = gone
+
+        if stats is not None:
+            stats = snapshot(stats() if callable(stats) else stats)
+            changed = diff_dict(self._sent_stats, stats)
+            if changed:
+                payload["stats"] = changed
+            self._sent_stats = stats
+        return payload
+
+    def full_state(self, rooms=None):
+        """
+        Everything sent so far, for clients that connect or subscribe mid-stream.
+
+        Args:
+            rooms (iterable): Only include devices routed to one of these rooms.
+        """
+        with self._sent_lock:
+            devices = self._sent_devices
+            if rooms is not None and self.rooms_for is not None:
+                rooms = set(rooms)
+                devices = {k: v for k, v in devices.items() if rooms.intersection(self.rooms_for(k))}
+            return {"devices": snapshot(devices), "stats": snapshot(self._sent_stats)}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tick-broadcaster", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ [Broadcaster] Flush error: {e}")
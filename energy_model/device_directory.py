@@ -0,0 +1,126 @@
+"""
+Cached directory of remote gateways, refreshed in the background.
+
+The gateway list (a schema.tagValues query over the whole bucket) is fetched
+by a daemon thread every `interval` seconds. Readers only ever get the last
+successful result from memory, so they answer immediately even while the
+remote database is slow or down; a failed refresh keeps the previous list and
+records the error. request_refresh() wakes the thread early and optionally
+waits (bounded) for the new list.
+"""
+import threading
+import time
+
+
+class DeviceDirectory:
+    def __init__(self, fetch, interval=60.0, name="Device List"):
+        """
+        Args:
+            fetch (callable): fetch() -> iterable of device ids; raises on failure.
+            interval (float): Seconds between background refreshes.
+            name (str): Log prefix.
+        """
+        self.fetch = fetch
+        self.interval = interval
+        self.name = name
+        self._devices = ()
+        self._updated_at = None
+        self.last_error = None
+        self.last_duration = None
+        self.refreshes = 0
+        self.failures = 0
+        self._wake = threading.Event()
+        self._done = threading.Condition()
+        self._generation = 0  # completed refreshes (successful or not)
+        self._refreshing = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def devices(self):
+        """Last known device ids (sorted tuple)."""
+        return self._devices
+
+    def age(self, now=None):
+        """Seconds since the last successful refresh (None if there was none yet)."""
+        if self._updated_at is None:
+            return None
+        return (time.time() if now is None else now) - self._updated_at
+
+    def refresh(self):
+        """Fetch now (on the calling thread). Returns True on success."""
+        with self._done:
+            self._refreshing = True
+        t0 = time.perf_counter()
+        try:
+            devices = tuple(sorted(set(self.fetch())))
+            self._devices = devices
+            self._updated_at = time.time()
+            self.last_error = None
+            self.refreshes += 1
+            ok = True
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)[:200]
+            ok = False
+        self.last_duration = time.perf_counter() - t0
+        with self._done:
+            self._refreshing = False
+            self._generation += 1
+            self._done.notify_all()
+        if ok:
+            print(f"🌍 [{self.name}] Found {len(devices)} remote devices ({self.last_duration * 1000:.0f} ms).")
+        else:
+            print(f"⚠️ [{self.name}] 远程库查询失败 (沿用缓存): {self.last_error}")
+        return ok
+
+    def request_refresh(self, wait=0.0):
+        """
+        Ask the background thread to refresh now.
+
+        Args:
+            wait (float): Max seconds to wait for that refresh to finish.
+
+        Returns:
+            bool: True if a refresh finished within `wait`.
+        """
+        with self._done:
+            # A refresh already running may have queried before this request
+            target = self._generation + (2 if self._refreshing else 1)
+        self._wake.set()
+        if wait <= 0:
+            return False
+        deadline = time.monotonic() + wait
+        with self._done:
+            while self._generation < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._done.wait(remaining)
+        return True
+
+    def stats(self):
+        return {
+            "devices": len(self._devices),
+            "age_s": self.age(),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_duration_ms": round(self.last_duration * 1000, 1) if self.last_duration is not None else None,
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="device-directory", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            self.refresh()
+            self._wake.wait(self.interval)
@@ -0,0 +1,127 @@
+"""
+Registry of connected devices, keyed by device id ("<ip>_<device_type>").
+
+Each device is one DeviceRecord with __slots__ that is updated in place on
+every reading, instead of a fresh nested dict per message. The sensor payload
+is kept by reference (it is already a new dict per reading). Dict views are
+only built on demand: to_dict() for one device, snapshot() for serialization,
+and query() for fleet-level lookups by type and by staleness.
+"""
+import threading
+import time
+
+
+class DeviceRecord:
+    __slots__ = ("key", "ip", "type", "data", "last_seen", "inject_count", "optimize_count")
+
+    def __init__(self, key, ip, d_type):
+        self.key = key
+        self.ip = ip
+        self.type = d_type
+        self.data = {}
+        self.last_seen = 0.0
+        self.inject_count = 0
+        self.optimize_count = 0
+
+    def to_dict(self):
+        """The dict shape the dashboard and /api/status expect."""
+        return {
+            "ip": self.ip,
+            "type": self.type,
+            "data": dict(self.data),
+            "last_seen": self.last_seen,
+            "stats": {"inject_count": self.inject_count, "optimize_count": self.optimize_count},
+        }
+
+
+class DeviceRegistry:
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()  # Only taken to add/remove records
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def get(self, key):
+        return self._records.get(key)
+
+    def keys(self):
+        return list(self._records)
+
+    def update(self, key, ip, d_type, data, inject_count=None, optimize_count=None, now=None):
+        """
+        Record a reading for one device, creating its record on first sight.
+
+        Args:
+            key (str): Device id.
+            ip (str): Device address.
+            d_type (str): Device type (LUBRICATION_BOT / TENSION_BOT / ...).
+            data (dict): Latest sensor payload (kept by reference).
+            inject_count, optimize_count (int): Controller counters, if known.
+            now (float): Timestamp of the reading (defaults to time.time()).
+
+        Returns:
+            DeviceRecord: The (updated) record.
+        """
+        record = self._records.get(key)
+        if record is None:
+            with self._lock:
+                record = self._records.get(key)
+                if record is None:
+                    record = self._records[key] = DeviceRecord(key, ip, d_type)
+        record.data = data
+        record.last_seen = time.time() if now is None else now
+        if inject_count is not None:
+            record.inject_count = inject_count
+        if optimize_count is not None:
+            record.optimize_count = optimize_count
+        return record
+
+    def remove(self, key):
+        """Drop a device. Returns its record, or None."""
+        with self._lock:
+            return self._records.pop(key, None)
+
+    def records(self):
+        return list(self._records.values())
+
+    def query(self, d_type=None, stale_after=None, seen_within=None, now=None):
+        """
+        Fleet-level lookup.
+
+        Args:
+            d_type (str): Only devices of this type.
+            stale_after (float): Only devices silent for more than this many seconds.
+            seen_within (float): Only devices heard from within this many seconds.
+            now (float): Reference time (defaults to time.time()).
+
+        Returns:
+            list[DeviceRecord]
+        """
+        now = time.time() if now is None else now
+        out = []
+        for record in list(self._records.values()):
+            if d_type is not None and record.type != d_type:
+                continue
+            age = now - record.last_seen
+            if stale_after is not None and age <= stale_after:
+                continue
+            if seen_within is not None and age > seen_within:
+                continue
+            out.append(record)
+        return out
+
+    def snapshot(self, records=None):
+        """{device id: dict} for the given records (default: all), for serialization."""
+        if records is None:
+            records = list(self._records.values())
+        return {r.key: r.to_dict() for r in records}
+
+    def count_by_type(self):
+        counts = {}
+        for record in list(self._records.values()):
+            counts[record.type] = counts.get(record.type, 0) + 1
+        return counts
@@ -0,0 +1,169 @@
+"""
+Fleet-wide monitoring cycles: fetch and analyze many gateways concurrently.
+
+Each cycle runs two stages per device:
+
+- fetch(device_id):         I/O (InfluxDB query), on a bounded query pool so the
+                            remote database sees at most `query_workers` queries
+- analyze(device_id, data): pandas analysis, on a separate worker pool
+
+A device that takes longer than `device_timeout` seconds from the start of its
+fetch is dropped for the cycle (its result is discarded), and the whole cycle
+returns after `cycle_budget` seconds at the latest. A device whose previous job
+is still running is skipped rather than queued twice. `last_outcomes` tells
+what became of each device of the last cycle.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+
+class DeviceTimeout(Exception):
+    pass
+
+
+class FleetMonitor:
+    def __init__(self, fetch, analyze, query_workers=8, analysis_workers=None, device_timeout=20.0,
+                 cycle_budget=55.0, history=60):
+        """
+        Args:
+            fetch (callable): fetch(device_id) -> data, or None if there is nothing to analyze.
+            analyze (callable): analyze(device_id, data) -> payload, or None.
+            query_workers (int): Max concurrent fetches.
+            analysis_workers (int): Analysis threads (defaults to the CPU count).
+            device_timeout (float): Per-device deadline in seconds (fetch + analysis).
+            cycle_budget (float): Max seconds run_cycle() waits for results.
+            history (int): Number of cycle summaries kept for stats().
+        """
+        self.fetch = fetch
+        self.analyze = analyze
+        self.device_timeout = device_timeout
+        self.cycle_budget = cycle_budget
+        self._query_pool = ThreadPoolExecutor(max_workers=query_workers, thread_name_prefix="monitor-query")
+        self._analysis_pool = ThreadPoolExecutor(max_workers=analysis_workers or os.cpu_count() or 1,
+                                                 thread_name_prefix="monitor-analysis")
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history)
+        # device_id -> "analyzed" | "empty" | "error" | "timeout" | "overrun" | "skipped" (last cycle)
+        self.last_outcomes = {}
+
+    def _fetch(self, device_id):
+        started = time.monotonic()
+        return started, self.fetch(device_id)
+
+    def _analyze(self, device_id, data, started):
+        if time.monotonic() - started > self.device_timeout:
+            raise DeviceTimeout(f"fetch exceeded {self.device_timeout:.0f}s")
+        payload = self.analyze(device_id, data)
+        if time.monotonic() - started > self.device_timeout:
+            raise DeviceTimeout(f"analysis finished after {self.device_timeout:.0f}s")
+        return payload
+
+    def _start(self, device_id):
+        result = Future()
+
+        def analyzed(f):
+            try:
+                result.set_result(f.result())
+            except Exception as e:
+                result.set_exception(e)
+
+        def fetched(f):
+            try:
+                started, data = f.result()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            if data is None:
+                result.set_result(None)
+                return
+            try:
+                self._analysis_pool.submit(self._analyze, device_id, data, started).add_done_callback(analyzed)
+            except RuntimeError as e:  # pool shut down
+                result.set_exception(e)
+
+        def finished(_):
+            with self._lock:
+                self._in_flight.discard(device_id)
+
+        result.add_done_callback(finished)
+        self._query_pool.submit(self._fetch, device_id).add_done_callback(fetched)
+        return result
+
+    def run_cycle(self, device_ids):
+        """
+        Fetch and analyze every device once.
+
+        Args:
+            device_ids (iterable): Devices to cover this cycle.
+
+        Returns:
+            dict: {device_id: payload} for the devices that produced a payload in time.
+        """
+        started = time.monotonic()
+        jobs = {}
+        outcomes = {}
+        skipped = 0
+        for device_id in device_ids:
+            with self._lock:
+                if device_id in self._in_flight:
+                    skipped += 1
+                    outcomes[device_id] = "skipped"
+                    continue
+                self._in_flight.add(device_id)
+            jobs[device_id] = self._start(device_id)
+
+        wait(jobs.values(), timeout=self.cycle_budget)
+
+        results = {}
+        empty = errors = timed_out = overrun = 0
+        for device_id, job in jobs.items():
+            if not job.done():
+                overrun += 1
+                outcomes[device_id] = "overrun"
+                continue
+            e = job.exception()
+            if isinstance(e, DeviceTimeout):
+                timed_out += 1
+                outcomes[device_id] = "timeout"
+            elif e is not None:
+                errors += 1
+                outcomes[device_id] = "error"
+                print(f"❌ [Monitor] Error ({device_id}): {e}")
+            elif job.result() is None:
+                empty += 1
+                outcomes[device_id] = "empty"
+            else:
+                results[device_id] = job.result()
+                outcomes[device_id] = "analyzed"
+
+        self._history.append({
+            "started_at": time.time() - (time.monotonic() - started),
+            "seconds": round(time.monotonic() - started, 3),
+            "devices": len(jobs) + skipped,
+            "analyzed": len(results),
+            "empty": empty,
+            "errors": errors,
+            "timed_out": timed_out,
+            "overrun": overrun,
+            "skipped_in_flight": skipped,
+        })
+        self.last_outcomes = outcomes
+        return results
+
+    def stats(self):
+        """Last cycle summary plus the slowest recent cycle."""
+        history = list(self._history)
+        return {
+            "last_cycle": history[-1] if history else None,
+            "max_cycle_seconds": max((c["seconds"] for c in history), default=None),
+            "cycles": len(history),
+            "in_flight": len(self._in_flight),
+        }
+
+    def close(self):
+        self._query_pool.shutdown(wait=False, cancel_futures=True)
+        self._analysis_pool.shutdown(wait=False, cancel_futures=True)
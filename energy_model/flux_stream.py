@@ -0,0 +1,204 @@
+"""
+Streaming decoder for InfluxDB annotated-CSV query responses.
+
+query_data_frame() builds a FluxRecord per row and a DataFrame per table
+before anything reaches our code, which for long raw pulls costs several
+times the size of the data. FluxCSVDecoder instead reads the HTTP response
+(QueryApi.query_raw) block by block and parses batches of rows straight into
+preallocated arrays: one datetime64[ns] array for _time, one float64 row per
+requested field (a single 2-D block that to_frame() wraps without copying)
+and, optionally, string arrays for tag columns. Rows are handed out in chunks
+of at most `chunk_rows`, so a 7-day pull never has to be held as text or as
+Python objects.
+
+Parsing is column-wise: a batch of lines is split once into a 2-D bytes
+array and each requested column is cast to float / datetime by numpy.
+Batches containing quoted values (commas inside strings) fall back to the
+csv module.
+"""
+import csv
+
+import numpy as np
+import pandas as pd
+
+
+class FluxQueryError(RuntimeError):
+    """InfluxDB reported an error inside the response stream."""
+
+
+class FluxChunk:
+    """Up to chunk_rows decoded rows: `time` (datetime64[ns], UTC), `values` {field: float64}, `tags` {tag: str}."""
+
+    __slots__ = ("time", "block", "fields", "tags", "present")
+
+    def __init__(self, time, block, fields, tags, present):
+        self.time = time
+        self.block = block  # (fields, rows) float64
+        self.fields = fields
+        self.tags = tags
+        self.present = present
+
+    def __len__(self):
+        return len(self.time)
+
+    @property
+    def values(self):
+        return dict(zip(self.fields, self.block))
+
+    def to_frame(self):
+        """DataFrame of the fields seen in the response, indexed by _time (UTC); shares the chunk's memory."""
+        index = pd.DatetimeIndex(self.time, name='_time').tz_localize('UTC')
+        keep = [i for i, f in enumerate(self.fields) if f in self.present]
+        block = self.block if len(keep) == len(self.fields) else self.block[keep]
+        return pd.DataFrame(block.T, index=index, columns=[self.fields[i] for i in keep], copy=False)
+
+
+def iter_blocks(response, read_size=1 << 20):
+    """
+    Body of a urllib3 response (query_raw) in blocks; the connection goes back
+    to the pool once it has been read to the end, otherwise it is closed.
+    """
+    done = False
+    try:
+        for block in response.stream(read_size):
+            yield block
+        done = True
+    finally:
+        if done:
+            response.release_conn()
+        else:
+            response.close()
+
+
+class FluxCSVDecoder:
+    def __init__(self, fields, tags=(), chunk_rows=65536, batch_rows=8192):
+        """
+        Args:
+            fields (sequence): Numeric columns to decode (e.g. NUMERIC_FIELDS or '_value').
+            tags (sequence): String columns to keep (e.g. '_field', 'gateWayId').
+            chunk_rows (int): Rows per yielded FluxChunk.
+            batch_rows (int): Lines parsed per numpy pass.
+        """
+        self.fields = list(fields)
+        self.tags = list(tags)
+        self.chunk_rows = chunk_rows
+        self.batch_rows = batch_rows
+
+    def decode(self, blocks):
+        """
+        Decode an annotated-CSV body.
+
+        Args:
+            blocks (iterable): Byte blocks of the response (see iter_blocks()).
+
+        Yields:
+            FluxChunk: Rows in response order; fields absent from a table stay NaN.
+        """
+        self._n = 0
+        self._block = None
+        header = None
+        batch = []
+        tail = b''
+        for block in blocks:
+            lines = (tail + block).split(b'\n')
+            tail = lines.pop()
+            for line in lines:
+                line = line.rstrip(b'\r')
+                if not line or line[0] == 35:  # blank line / '#' annotation: a new table header follows
+                    if batch:
+                        yield from self._flush(header, batch)
+                        batch = []
+                    header = None
+                elif header is None:
+                    header = self._header(line)
+                else:
+                    batch.append(line)
+                    if len(batch) >= self.batch_rows:
+                        yield from self._flush(header, batch)
+                        batch = []
+        tail = tail.rstrip(b'\r')
+        if tail and header is not None:
+            batch.append(tail)
+        if batch:
+            yield from self._flush(header, batch)
+        if self._n:
+            yield self._emit()
+
+    def _header(self, line):
+        names = [c.decode() for c in next(csv.reader([line.decode()]))] if b'"' in line else \
+            [c.decode() for c in line.split(b',')]
+        if 'error' in names and '_time' not in names:
+            return {"error": names}
+        return {
+            "width": len(names),
+            "time": names.index('_time') if '_time' in names else None,
+            "fields": [(i, names.index(f)) for i, f in enumerate(self.fields) if f in names],
+            "tags": [(t, names.index(t)) for t in self.tags if t in names],
+        }
+
+    def _new_chunk(self):
+        # Allocated when the first row of a chunk arrives; the previous chunk belongs to the caller
+        size = self.chunk_rows
+        self._time = np.empty(size, dtype='datetime64[ns]')
+        self._block = np.full((len(self.fields), size), np.nan)
+        self._tags = {t: np.empty(size, dtype=object) for t in self.tags}
+        self._present = set()
+        self._n = 0
+
+    def _emit(self):
+        n = self._n
+        chunk = FluxChunk(self._time[:n], self._block[:, :n], self.fields,
+                          {t: v[:n] for t, v in self._tags.items()}, self._present)
+        self._block = None
+        self._n = 0
+        return chunk
+
+    def _flush(self, header, lines):
+        if header is None:
+            return
+        if "error" in header:
+            row = next(csv.reader([lines[0].decode()]))
+            raise FluxQueryError(row[header["error"].index('error')] if len(row) > 1 else lines[0].decode())
+        grid = self._split(lines, header["width"])
+        pos = 0
+        while pos < len(grid):
+            take = min(len(grid) - pos, self.chunk_rows - self._n)
+            self._fill(header, grid[pos:pos + take])
+            pos += take
+            if self._n == self.chunk_rows:
+                yield self._emit()
+
+    @staticmethod
+    def _split(lines, width):
+        parts = b','.join(lines).split(b',')
+        if len(parts) == len(lines) * width:
+            return np.array(parts).reshape(len(lines), width)
+        # Quoted values containing commas
+        rows = list(csv.reader(line.decode() for line in lines))
+        return np.array([[c.encode() for c in row] for row in rows])
+
+    def _fill(self, header, grid):
+        if self._block is None:
+            self._new_chunk()
+        n, k = self._n, len(grid)
+        if header["time"] is not None:
+            # RFC3339 in UTC ("...Z"); numpy parses it once the zone suffix is stripped
+            self._time[n:n + k] = np.char.rstrip(grid[:, header["time"]], b'Z').astype('datetime64[ns]')
+        else:
+            self._time[n:n + k] = np.datetime64('NaT')
+        for row, col in header["fields"]:
+            values = grid[:, col]
+            empty = values == b''
+            if empty.any():
+                values = np.where(empty, b'nan', values)
+            self._block[row, n:n + k] = values
+            self._present.add(self.fields[row])
+        for tag, col in header["tags"]:
+            self._tags[tag][n:n + k] = np.char.decode(grid[:, col])
+        self._n = n + k
+
+
+def decode_frames(response, fields, tags=(), chunk_rows=65536):
+    """DataFrame per chunk of a query_raw() response (fields only; see FluxCSVDecoder for tags)."""
+    for chunk in FluxCSVDecoder(fields, tags, chunk_rows=chunk_rows).decode(iter_blocks(response)):
+        yield chunk.to_frame()
@@ -1,73 +1,377 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
 from influxdb_client import InfluxDBClient
 import pandas as pd
 import warnings
 
+from .flux_stream import FluxCSVDecoder, iter_blocks
+
 # Suppress FutureWarning from influxdb_client regarding tabular data
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+NUMERIC_FIELDS = ['ua', 'ub', 'uc', 'ia', 'ib', 'ic', 'pt', 'demand', 'pft', 'impep']
+
+
+def resample_minutes(df, resolution='1min'):
+    """
+    Means per `resolution` (1 minute by default) with short gaps (<= 2 bins) linearly filled,
+    as EnergyOptimizer expects. Rows already aggregated to `resolution` only get the gaps filled.
+    """
+    if df is None or df.empty:
+        return df
+    return df.resample(resolution).mean().interpolate(method='linear', limit=2)
+
+
+def flux_duration(resolution):
+    """pandas offset string ('1min', '15min', '1h') -> Flux duration literal ('60s', ...)."""
+    return f"{int(pd.Timedelta(resolution).total_seconds())}s"
+
+
+def plan_slices(start, stop, length, now=None):
+    """
+    Split [start, stop) into slices whose inner boundaries are multiples of `length`
+    (since the epoch), so they line up with aggregateWindow bins of any resolution
+    that divides `length`.
+
+    Args:
+        start (pd.Timestamp): Inclusive lower bound (tz-aware).
+        stop (pd.Timestamp): Exclusive upper bound, or None for "until now".
+        length (pd.Timedelta): Slice length.
+        now (pd.Timestamp): Where an open range ends for planning (defaults to the current UTC time).
+
+    Returns:
+        list: [(slice_start, slice_stop)]; the last slice_stop is None for an open range.
+    """
+    end = stop if stop is not None else (pd.Timestamp.now(tz='UTC') if now is None else now)
+    slices = []
+    a = start
+    b = start.floor(length) + length
+    while b < end:
+        slices.append((a, b))
+        a, b = b, b + length
+    slices.append((a, stop))
+    return slices
+
+
 class InfluxConnector:
-    def __init__(self, url, token, org, bucket):
-        self.client = InfluxDBClient(url=url, token=token, org=org, timeout=10000)
+    def __init__(self, url, token, org, bucket, client=None, cache=None, pushdown=False, slice_hours=6,
+                 slice_workers=4, slice_retries=2, store=None, **client_kwargs):
+        # client: a shared (pooled) client to use instead of creating one; it is not closed by close()
+        # cache: optional QueryCache shared between connectors (see energy_model/query_cache.py)
+        # store: optional TelemetryStore; finished days are read from / written to local disk
+        # pushdown: let InfluxDB aggregate to the requested resolution (aggregateWindow) instead of
+        #           shipping raw points and resampling in pandas
+        # slice_hours / slice_workers / slice_retries: ranges longer than slice_hours are fetched as
+        #           aligned slices, slice_workers at a time, each retried up to slice_retries times
+        # client_kwargs go to InfluxDBClient (e.g. connection_pool_maxsize for concurrent queries)
+        self._owns_client = client is None
+        self.client = client or InfluxDBClient(url=url, token=token, org=org, timeout=10000, **client_kwargs)
+        self.url = url
         self.bucket = bucket
         self.org = org
+        self.cache = cache
+        self.store = store
+        self.pushdown = pushdown
+        self.slice_length = pd.Timedelta(hours=slice_hours)
+        self.slice_workers = slice_workers
+        self.slice_retries = slice_retries
         self.query_api = self.client.query_api()
 
-    def query_recent_data(self, minutes=30, device_id=None):
+    def query_recent_data(self, minutes=30, device_id=None, now=None, resolution='1min'):
         """
         Query recent data from InfluxDB.
-        
+
         Args:
             minutes (int): Lookback period in minutes.
             device_id (str): Optional device ID to filter by gateWayId.
-            
+            now (pd.Timestamp): Reference time for the cache (defaults to the current UTC time).
+            resolution (str): Resample interval (pandas offset).
+
         Returns:
             pd.DataFrame: Pivoted and resampled DataFrame fit for EnergyOptimizer.
                           Returns None if query fails or is empty.
         """
+        if self.cache is not None or self.pushdown:
+            now = pd.Timestamp.now(tz='UTC') if now is None else now
+            df = self.query_since(now - pd.Timedelta(minutes=minutes), device_id, now=now, resolution=resolution)
+        else:
+            df = self._query_fields(f"-{minutes}m", device_id)
+        if df is None:
+            return None
+        # Resample to 1 minute or keep raw?
+        # Optimization logic expects approx 5 mins for rates, but raw is fine if index is datetime.
+        # Let's resample to ensure regularity, matching the offline model's expectation of 'blocks'
+        return resample_minutes(df, resolution)
+
+    def query_since(self, start, device_id=None, now=None, resolution='1min'):
+        """
+        Query data newer than `start`: raw rows, or (in pushdown mode) per-`resolution`
+        means from query_aggregated(). Either way resample_minutes() turns the result into
+        the same frame.
+
+        Args:
+            start (pd.Timestamp): Inclusive lower bound (tz-aware, or naive UTC).
+            device_id (str): Optional device ID to filter by gateWayId.
+            now (pd.Timestamp): Reference time for the cache (defaults to the current UTC time).
+            resolution (str): Bin size in pushdown mode.
+
+        Returns:
+            pd.DataFrame: Pivoted rows indexed by _time, or None if empty / on error.
+        """
+        if self.pushdown:
+            return self.query_aggregated(start, device_id, resolution=resolution, now=now)
+        start = self._utc(start)
+        if self.cache is None:
+            try:
+                return self._fetch_range(start, None, device_id)
+            except Exception as e:
+                print(f"InfluxDB Query Error: {e}")
+                return None
+
+        key = (self.url, self.bucket, device_id, tuple(NUMERIC_FIELDS))
+        return self._cached(key, start, lambda s: self._fetch_range(s, None, device_id), now)
+
+    def query_aggregated(self, start, device_id=None, resolution='1min', extra=(), now=None):
+        """
+        Per-`resolution` aggregates computed by InfluxDB (aggregateWindow), so only the
+        downsampled rows cross the network.
+
+        Bins are aligned to `resolution` and labelled by their start, like pandas
+        resample(); `start` is floored to the bin that contains it. Empty bins are
+        left out (resample_minutes() restores and fills them).
+
+        Args:
+            start (pd.Timestamp): Inclusive lower bound (tz-aware, or naive UTC).
+            device_id (str): Optional device ID to filter by gateWayId.
+            resolution (str): Bin size (pandas offset, e.g. '1min', '15min').
+            extra (sequence): Additional aggregates per field, e.g. ('min', 'max'),
+                returned as '<field>_min' / '<field>_max' columns.
+            now (pd.Timestamp): Reference time for the cache (defaults to the current UTC time).
+
+        Returns:
+            pd.DataFrame: Mean per field (plus extras) per bin, or None if empty / on error.
+        """
+        step = pd.Timedelta(resolution)
+        start = self._utc(start).floor(step)
+        extra = tuple(extra)
+
+        def fetch(s):
+            # Top-ups start inside a bin: re-read it whole so the cached bin is replaced, not truncated
+            return self._fetch_range(s.floor(step), None, device_id, every=step, extra=extra)
+
+        if self.cache is None:
+            try:
+                return fetch(start)
+            except Exception as e:
+                print(f"InfluxDB Query Error: {e}")
+                return None
+        key = (self.url, self.bucket, device_id, tuple(NUMERIC_FIELDS), resolution, extra)
+        return self._cached(key, start, fetch, now)
+
+    def query_range(self, start, stop=None, device_id=None, resolution=None):
+        """
+        Data between `start` and `stop`, for long ranges (days of history, training
+        exports). The range is fetched as aligned slices of `slice_hours`, up to
+        `slice_workers` at a time; a failed slice is retried on its own, and the
+        slices are stitched back in time order. Not cached.
+
+        Args:
+            start (pd.Timestamp): Inclusive lower bound (tz-aware, or naive UTC).
+            stop (pd.Timestamp): Exclusive upper bound (defaults to now).
+            device_id (str): Optional device ID to filter by gateWayId.
+            resolution (str): None for raw rows, else per-resolution means computed
+                by InfluxDB (aggregateWindow) with short gaps filled, like
+                query_recent_data().
+
+        Returns:
+            pd.DataFrame: Rows indexed by _time, or None if empty / on error
+                (a slice still failing after its retries fails the whole range).
+        """
+        start = self._utc(start)
+        stop = None if stop is None else self._utc(stop)
+        step = None if resolution is None else pd.Timedelta(resolution)
+        try:
+            if step is None:
+                return self._fetch_range(start, stop, device_id)
+            return resample_minutes(self._fetch_range(start.floor(step), stop, device_id, every=step), resolution)
+        except Exception as e:
+            print(f"InfluxDB Query Error: {e}")
+            return None
+
+    def iter_frames(self, start, stop=None, device_id=None, chunk_rows=65536):
+        """
+        Raw rows between `start` and `stop`, decoded from the response stream a
+        chunk at a time, so long ranges (days of 1-second data) never sit in
+        memory as a whole. Not cached.
+
+        Args:
+            start (pd.Timestamp): Inclusive lower bound (tz-aware, or naive UTC).
+            stop (pd.Timestamp): Exclusive upper bound (defaults to now).
+            device_id (str): Optional device ID to filter by gateWayId.
+            chunk_rows (int): Rows per yielded frame.
+
+        Yields:
+            pd.DataFrame: Up to chunk_rows pivoted rows indexed by _time, in time order.
+        """
+        range_stop = None if stop is None else self._range_start(self._utc(stop))
+        query = self._flux(self._range_start(self._utc(start)), device_id, range_stop=range_stop)
+        decoder = FluxCSVDecoder(NUMERIC_FIELDS, chunk_rows=chunk_rows)
+        for chunk in decoder.decode(iter_blocks(self.query_api.query_raw(query, org=self.org))):
+            yield chunk.to_frame()
+
+    def _cached(self, key, start, fetch, now):
+        try:
+            df = self.cache.fetch(key, start, fetch, now=now)
+        except Exception as e:
+            print(f"InfluxDB Query Error: {e}")
+            return None
+        return df if len(df) else None
+
+    @staticmethod
+    def _utc(ts):
+        ts = pd.Timestamp(ts)
+        if ts.tzinfo is None:
+            ts = ts.tz_localize('UTC')
+        return ts.tz_convert('UTC')
+
+    @staticmethod
+    def _range_start(start):
+        return f'time(v: "{start.isoformat()}")'
+
+    def _fetch_range(self, start, stop, device_id=None, every=None, extra=()):
+        """
+        Rows in [start, stop): finished days from the TelemetryStore (pulling and storing
+        the ones it lacks), the rest from InfluxDB. Raises on failure.
+        """
+        store = self.store
+        if store is None or extra or (every is not None and pd.Timedelta(days=1) % every):
+            return self._fetch_span(start, stop, device_id, every, extra)
+        days = store.final_days(start, stop)
+        if not days:
+            return self._fetch_span(start, stop, device_id, every)
+
+        kind = store.kind(every)
+        missing = [d for d in days if not store.has(self.bucket, kind, device_id, d)]
+        # Consecutive missing days are pulled (whole days) as one sliced range
+        runs = []
+        for day in missing:
+            if runs and runs[-1][-1] + pd.Timedelta(days=1) == day:
+                runs[-1].append(day)
+            else:
+                runs.append([day])
+        for run in runs:
+            df = self._fetch_span(run[0], run[-1] + pd.Timedelta(days=1), device_id, every)
+            store.write_days(self.bucket, kind, device_id, run, df)
+
+        rest = days[-1] + pd.Timedelta(days=1)
+        frames = [store.read(self.bucket, kind, device_id, start, rest)]
+        if stop is None or stop > rest:
+            frames.append(self._fetch_span(rest, stop, device_id, every))
+        frames = [df for df in frames if df is not None and len(df)]
+        if not frames:
+            return None
+        return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+    def _fetch_span(self, start, stop, device_id=None, every=None, extra=()):
+        """
+        _fetch_fields() over [start, stop), split into slices (see plan_slices()) when
+        longer than slice_length. Raises once a slice has failed slice_retries + 1 times.
+        """
+        length = self.slice_length
+        if every is not None and length % every:
+            # Slice boundaries must fall on bin boundaries
+            length = (length // every + 1) * every
+        slices = plan_slices(start, stop, length)
+        flux_every = None if every is None else flux_duration(every)
+
+        def fetch(piece):
+            a, b = piece
+            range_stop = None if b is None else self._range_start(b)
+            for attempt in range(self.slice_retries + 1):
+                try:
+                    return self._fetch_fields(self._range_start(a), device_id, flux_every, extra, range_stop)
+                except Exception as e:
+                    if attempt == self.slice_retries:
+                        raise
+                    reason = str(e).splitlines()[0] if str(e) else type(e).__name__
+                    print(f"⚠️ [Influx] Slice {a} - {b or 'now'} failed ({reason}), retrying...")
+                    time.sleep(0.5 * 2 ** attempt)
+
+        if len(slices) == 1:
+            return fetch(slices[0])
+        pool = ThreadPoolExecutor(max_workers=min(self.slice_workers, len(slices)))
+        try:
+            frames = [df for df in pool.map(fetch, slices) if df is not None]
+        finally:
+            pool.shutdown(cancel_futures=True)  # a slice gave up: don't start the rest
+        return pd.concat(frames) if frames else None
+
+    def _query_fields(self, range_start, device_id=None):
+        try:
+            return self._fetch_fields(range_start, device_id)
+        except Exception as e:
+            print(f"InfluxDB Query Error: {e}")
+            return None
+
+    def _flux(self, range_start, device_id=None, every=None, extra=(), range_stop=None):
         # Flux query to get data for specific measurements and fields
         # Getting all fields from 'ElectricalEnergy' measurement
         device_filter = f'|> filter(fn: (r) => r["gateWayId"] == "{device_id}")' if device_id else ''
-        
-        query = f"""
-        from(bucket: "{self.bucket}")
-          |> range(start: -{minutes}m)
+        field_filter = " or ".join(f'r["_field"] == "{f}"' for f in NUMERIC_FIELDS)
+        source = f"""
+        data = from(bucket: "{self.bucket}")
+          |> range(start: {range_start}{f", stop: {range_stop}" if range_stop else ""})
           |> filter(fn: (r) => r["_measurement"] == "ElectricalEnergy")
           {device_filter}
-          |> filter(fn: (r) => r["_field"] == "ua" or r["_field"] == "ub" or r["_field"] == "uc" or r["_field"] == "ia" or r["_field"] == "ib" or r["_field"] == "ic" or r["_field"] == "pt" or r["_field"] == "demand" or r["_field"] == "pft" or r["_field"] == "impep")
+          |> filter(fn: (r) => {field_filter})
+        """
+        if every is None:
+            return source + f"""
+        data
           |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
-          |> keep(columns: ["_time", "ua", "ub", "uc", "ia", "ib", "ic", "pt", "demand", "pft", "impep"])
+          |> keep(columns: ["_time", {", ".join(f'"{f}"' for f in NUMERIC_FIELDS)}])
         """
-        
-        try:
-            # Query and return as DataFrame
-            df = self.query_api.query_data_frame(query)
-            
-            if df.empty:
-                return None
-                
-            # Clean up DataFrame
-            # influxdb-client returns '_time', 'result', 'table', etc.
-            if '_time' in df.columns:
-                df['_time'] = pd.to_datetime(df['_time'])
-                df = df.set_index('_time')
-                
-            # Drop non-numeric columns that might have slipped through (like tags) if pivot didn't handle them implicitly
-            numeric_cols = ['ua', 'ub', 'uc', 'ia', 'ib', 'ic', 'pt', 'demand', 'pft', 'impep']
-            available_cols = [c for c in numeric_cols if c in df.columns]
-            
-            df = df[available_cols].apply(pd.to_numeric, errors='coerce')
-            
-            # Resample to 1 minute or keep raw? 
-            # Optimization logic expects approx 5 mins for rates, but raw is fine if index is datetime.
-            # Let's resample to ensure regularity, matching the offline model's expectation of 'blocks'
-            if not df.empty:
-                df = df.resample('1T').mean().interpolate(method='linear', limit=2)
-                
-            return df
-            
-        except Exception as e:
-            print(f"InfluxDB Query Error: {e}")
+
+        def window(fn):
+            return f'data |> aggregateWindow(every: {every}, fn: {fn}, timeSrc: "_start", createEmpty: false)'
+
+        if not extra:
+            return source + f"""
+        {window("mean")}
+          |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> keep(columns: ["_time", {", ".join(f'"{f}"' for f in NUMERIC_FIELDS)}])
+        """
+        # One stream per aggregate, tagged with its name; pivot on (field, agg) -> "<field>_<agg>"
+        aggs = ("mean",) + extra
+        streams = "\n        ".join(f'{a} = {window(a)} |> set(key: "agg", value: "{a}")' for a in aggs)
+        columns = ", ".join(f'"{f}_{a}"' for a in aggs for f in NUMERIC_FIELDS)
+        return source + f"""
+        {streams}
+        union(tables: [{", ".join(aggs)}])
+          |> pivot(rowKey:["_time"], columnKey: ["_field", "agg"], valueColumn: "_value")
+          |> keep(columns: ["_time", {columns}])
+        """
+
+    def _fetch_fields(self, range_start, device_id=None, every=None, extra=(), range_stop=None):
+        """Run the pivoted field query; None if there are no rows, raises on failure."""
+        query = self._flux(range_start, device_id, every, extra, range_stop)
+        if extra:
+            # Means keep the plain field names; extras stay "<field>_<agg>"
+            columns = [f"{f}_mean" for f in NUMERIC_FIELDS] + [f"{f}_{a}" for a in extra for f in NUMERIC_FIELDS]
+        else:
+            columns = NUMERIC_FIELDS
+
+        # Decode the annotated CSV straight into float arrays (no per-record objects)
+        decoder = FluxCSVDecoder(columns)
+        chunks = [c.to_frame() for c in decoder.decode(iter_blocks(self.query_api.query_raw(query, org=self.org)))]
+        if not chunks:
             return None
+        df = chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+        if extra:
+            df = df.rename(columns={f"{f}_mean": f for f in NUMERIC_FIELDS})
+        return df.sort_index()
 
     def close(self):
-        self.client.close()
+        if self._owns_client:
+            self.client.close()
@@ -0,0 +1,201 @@
+"""
+Shared, long-lived InfluxDB clients, one per (url, org).
+
+InfluxDBClient keeps an urllib3 connection pool, so reusing one client keeps
+HTTP connections alive between requests instead of paying a TCP/HTTP setup
+per dashboard click. The clients (and their query/write APIs) are safe to use
+from the Flask, monitor and ingestion threads.
+
+The APIs handed out by the pool record latency and errors per operation
+(query / write / ping), which stats() reports together with a health flag.
+"""
+import threading
+import time
+from collections import deque
+
+from influxdb_client import InfluxDBClient
+
+from .influx_connector import InfluxConnector
+
+
+class _OpStats:
+    __slots__ = ("count", "errors", "latencies", "total")
+
+    def __init__(self, window):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.latencies = deque(maxlen=window)
+
+    def to_dict(self):
+        ordered = sorted(self.latencies)
+
+        def pct(q):
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1) if ordered else None
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total / self.count * 1000, 1) if self.count else None,
+            "p50_ms": pct(0.5),
+            "p95_ms": pct(0.95),
+            "max_ms": round(ordered[-1] * 1000, 1) if ordered else None,
+        }
+
+
+class PooledClient:
+    """A shared client plus its call statistics. close() is a no-op; the pool owns the client."""
+
+    def __init__(self, url, token, org, latency_window=256, **client_kwargs):
+        self.url = url
+        self.org = org
+        self.client = InfluxDBClient(url=url, token=token, org=org, **client_kwargs)
+        self.created_at = time.time()
+        self.last_ok = None
+        self.last_error = None
+        self.last_error_at = None
+        self._window = latency_window
+        self._ops = {}
+        self._lock = threading.Lock()
+        self._query_api = None
+        self._write_apis = {}
+
+    def record(self, op, seconds, error=None):
+        with self._lock:
+            stats = self._ops.get(op)
+            if stats is None:
+                stats = self._ops[op] = _OpStats(self._window)
+            stats.count += 1
+            stats.total += seconds
+            stats.latencies.append(seconds)
+            if error is None:
+                self.last_ok = time.time()
+            else:
+                stats.errors += 1
+                self.last_error = str(error)[:200]
+                self.last_error_at = time.time()
+
+    def call(self, op, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(op, time.perf_counter() - t0, e)
+            raise
+        self.record(op, time.perf_counter() - t0)
+        return result
+
+    def query_api(self):
+        if self._query_api is None:
+            self._query_api = _Tracked(self, self.client.query_api(), "query")
+        return self._query_api
+
+    def write_api(self, write_options):
+        key = id(write_options)
+        api = self._write_apis.get(key)
+        if api is None:
+            api = self._write_apis[key] = _Tracked(self, self.client.write_api(write_options=write_options), "write")
+        return api
+
+    def buckets_api(self):
+        return self.client.buckets_api()
+
+    def ping(self):
+        """True if the server answers /ping."""
+        try:
+            return bool(self.call("ping", self.client.ping))
+        except Exception:
+            return False
+
+    @property
+    def healthy(self):
+        if self.last_error_at is None:
+            return True
+        return self.last_ok is not None and self.last_ok > self.last_error_at
+
+    def stats(self):
+        with self._lock:
+            ops = {op: s.to_dict() for op, s in self._ops.items()}
+        return {
+            "url": self.url,
+            "org": self.org,
+            "healthy": self.healthy,
+            "created_at": self.created_at,
+            "last_ok": self.last_ok,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            "ops": ops,
+        }
+
+    def close(self):
+        pass
+
+
+class _Tracked:
+    """Proxy over a query/write API that times every method call."""
+
+    def __init__(self, owner, api, op):
+        self._owner = owner
+        self._api = api
+        self._op = op
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        def tracked(*args, **kwargs):
+            return self._owner.call(self._op, attr, *args, **kwargs)
+        return tracked
+
+
+class InfluxClientPool:
+    def __init__(self, timeout=10000, connection_pool_maxsize=16, latency_window=256, query_cache=None):
+        """
+        Args:
+            timeout (int): HTTP timeout of every client (ms).
+            connection_pool_maxsize (int): Keep-alive connections per client (concurrent requests).
+            latency_window (int): Latencies kept per operation for the percentiles.
+            query_cache (QueryCache): Result cache shared by every connector() handed out.
+        """
+        self.timeout = timeout
+        self.query_cache = query_cache
+        self.connection_pool_maxsize = connection_pool_maxsize
+        self.latency_window = latency_window
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, url, token, org):
+        """The shared PooledClient for (url, org), created on first use."""
+        key = (url, org)
+        pooled = self._clients.get(key)
+        if pooled is None:
+            with self._lock:
+                pooled = self._clients.get(key)
+                if pooled is None:
+                    pooled = self._clients[key] = PooledClient(
+                        url, token, org, latency_window=self.latency_window, timeout=self.timeout,
+                        connection_pool_maxsize=self.connection_pool_maxsize)
+        return pooled
+
+    def connector(self, url, token, org, bucket, **options):
+        """
+        InfluxConnector on the shared client and query cache (its close() leaves the client open);
+        options (pushdown, slice_hours, ...) go to InfluxConnector.
+        """
+        return InfluxConnector(url, token, org, bucket, client=self.client(url, token, org), cache=self.query_cache,
+                               **options)
+
+    def stats(self, ping=False):
+        """{"org@url": client stats}; ping=True checks each server first."""
+        clients = list(self._clients.values())
+        if ping:
+            for pooled in clients:
+                pooled.ping()
+        return {f"{c.org}@{c.url}": c.stats() for c in clients}
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for pooled in clients:
+            pooled.client.close()
@@ -0,0 +1,288 @@
+"""
+Batched, back-pressured InfluxDB write pipeline with an on-disk spool.
+
+The ingestion path only calls InfluxWritePipeline.submit(), which appends a
+small tuple to a bounded in-memory queue and returns. A dedicated writer thread
+takes up to `batch_size` points (or whatever arrived within `flush_interval`),
+serializes them to line protocol in one pass and hands the body to
+`write_lines`.
+
+When Influx is unreachable, or the queue is full, points overflow to an
+append-only line-protocol spool file instead of being dropped. On reconnect the
+spool is replayed front to back before the writer goes back to the queue.
+Every point is timestamped (nanoseconds) when it is submitted, so Influx stores
+it at the right time whatever order it arrives in, and replaying a chunk twice
+(e.g. after a crash mid-replay) overwrites identical points rather than
+duplicating them.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+
+def _escape_key(value):
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+
+def _escape_measurement(value):
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ')
+
+
+def _field_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def to_line(measurement, tags, fields, timestamp_ns):
+    """Serialize one point to InfluxDB line protocol."""
+    head = _escape_measurement(measurement)
+    if tags:
+        head += ''.join(f",{_escape_key(k)}={_escape_key(v)}" for k, v in sorted(tags.items()) if v not in (None, ''))
+    body = ','.join(f"{_escape_key(k)}={_field_value(v)}" for k, v in fields.items())
+    return f"{head} {body} {timestamp_ns}"
+
+
+def serialize_batch(points):
+    """Line protocol for a list of (measurement, tags, fields, timestamp_ns) tuples."""
+    return '\n'.join([to_line(*p) for p in points])
+
+
+class LineSpool:
+    def __init__(self, path, max_bytes=None):
+        """
+        Args:
+            path (str): Spool file (line protocol, one point per line).
+            max_bytes (int): Stop spooling (and count drops) beyond this size. None = unlimited.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Replay position; restarting from 0 after a crash is safe (idempotent points)
+        self._offset = 0
+        self._size = self._recover()
+
+    def _recover(self):
+        """Size of the existing spool, dropping a partial last line left by a crash mid-append."""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                f.truncate(end)
+        return end
+
+    def __len__(self):
+        return self._size - self._offset
+
+    @property
+    def size(self):
+        return self._size
+
+    def append(self, lines):
+        """Append serialized lines. Returns False if the size limit was hit."""
+        data = (lines + '\n').encode('utf-8')
+        with self._lock:
+            if self.max_bytes is not None and self._size + len(data) > self.max_bytes:
+                return False
+            with open(self.path, 'ab') as f:
+                f.write(data)
+            self._size += len(data)
+            return True
+
+    def read_chunk(self, max_lines):
+        """
+        Read up to `max_lines` lines starting at the replay position.
+
+        Returns:
+            (body, end_offset, n_lines): body is '' when nothing is pending.
+        """
+        with self._lock:
+            if self._offset >= self._size:
+                return '', self._offset, 0
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                lines = []
+                end = self._offset
+                for raw in f:
+                    end += len(raw)
+                    if raw.strip():
+                        lines.append(raw.decode('utf-8').rstrip('\n'))
+                    if len(lines) >= max_lines:
+                        break
+            return '\n'.join(lines), end, len(lines)
+
+    def commit(self, end_offset):
+        """Mark everything before `end_offset` as written; truncate once fully replayed."""
+        with self._lock:
+            self._offset = end_offset
+            if self._offset >= self._size:
+                open(self.path, 'wb').close()
+                self._offset = self._size = 0
+
+
+class InfluxWritePipeline:
+    def __init__(self, write_lines, batch_size=500, flush_interval=1.0, max_queue=10000,
+                 spool_path='influx_spool.lp', spool_max_bytes=None, retry_interval=5.0):
+        """
+        Args:
+            write_lines (callable): write_lines(body) sends a line-protocol body
+                (nanosecond precision); must raise on failure.
+            batch_size (int): Max points per write request.
+            flush_interval (float): Max seconds a point waits before being written.
+            max_queue (int): In-memory queue capacity (points); beyond it points
+                overflow to the spool.
+            spool_path (str): Append-only overflow file.
+            spool_max_bytes (int): Cap on spool size; further points are dropped and counted.
+            retry_interval (float): Seconds between reconnect attempts while Influx is down.
+        """
+        self.write_lines = write_lines
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.retry_interval = retry_interval
+        self.spool = LineSpool(spool_path, spool_max_bytes)
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.connected = True
+        self.counters = {"submitted": 0, "written": 0, "spooled": 0, "replayed": 0,
+                         "dropped": 0, "failed_writes": 0}
+
+    def submit(self, measurement, tags, fields, timestamp_ns=None):
+        """Queue one point. Never blocks on the network."""
+        if not fields:
+            return
+        point = (measurement, tags, fields, timestamp_ns or time.time_ns())
+        spill = None
+        with self._cond:
+            self.counters["submitted"] += 1
+            self._queue.append(point)
+            if len(self._queue) >= self.max_queue:
+                # Queue full: move the whole backlog to disk in one append
+                spill = list(self._queue)
+                self._queue.clear()
+            elif len(self._queue) >= self.batch_size:
+                self._cond.notify()
+        if spill:
+            self._spill(spill)
+
+    def _spill(self, points):
+        key = "spooled" if self.spool.append(serialize_batch(points)) else "dropped"
+        with self._cond:
+            self.counters[key] += len(points)
+
+    def _take_batch(self):
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while not self._stop and len(self._queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(self.batch_size, len(self._queue))
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _replay_spool(self):
+        """Write the spool back in order. Returns False if Influx is still down."""
+        while len(self.spool):
+            body, end, n = self.spool.read_chunk(self.batch_size)
+            if not n:
+                self.spool.commit(end)
+                break
+            try:
+                self.write_lines(body)
+            except Exception as e:
+                self._mark_down(e)
+                return False
+            self.counters["replayed"] += n
+            self.spool.commit(end)
+            self._mark_up()
+        return True
+
+    def _mark_down(self, error):
+        self.counters["failed_writes"] += 1
+        if self.connected:
+            print(f"⚠️ [InfluxWriter] Write failed, spooling to {self.spool.path}: {error}")
+        self.connected = False
+
+    def _mark_up(self):
+        if not self.connected:
+            print("✅ [InfluxWriter] Influx reachable again")
+        self.connected = True
+
+    def _step(self):
+        batch = self._take_batch()
+        # Spooled (older) points are replayed before anything from the queue
+        if len(self.spool) and not self._replay_spool():
+            if batch:
+                self._spill(batch)
+            return False
+        if not batch:
+            return True
+        try:
+            self.write_lines(serialize_batch(batch))
+        except Exception as e:
+            self._mark_down(e)
+            self._spill(batch)
+            return False
+        self.counters["written"] += len(batch)
+        self._mark_up()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stop and not self._queue:
+                    break
+            try:
+                ok = self._step()
+            except Exception as e:
+                print(f"⚠️ [InfluxWriter] Error: {e}")
+                ok = False
+            if not ok:
+                # While down, keep moving the queue to disk so memory stays bounded
+                with self._cond:
+                    deadline = time.monotonic() + self.retry_interval
+                    while not self._stop and time.monotonic() < deadline:
+                        self._cond.wait(deadline - time.monotonic())
+                    if self._stop:
+                        break
+                    spill = list(self._queue)
+                    self._queue.clear()
+                if spill:
+                    self._spill(spill)
+        # Shutdown: whatever is still queued goes to the spool for the next run
+        with self._cond:
+            rest = list(self._queue)
+            self._queue.clear()
+        if rest:
+            self._spill(rest)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout=10.0):
+        """Flush what can be flushed and stop the writer thread."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._queue)
+        return dict(self.counters, queued=queued, spool_bytes=len(self.spool), connected=self.connected)
@@ -0,0 +1,344 @@
+"""
+TCP ingestion front-ends for the device socket protocol.
+
+Two interchangeable servers share the same IngestHandler callbacks:
+
+- ThreadedIngestServer: one OS thread per device connection (original behaviour).
+- AsyncIngestServer: every device socket is served from a single asyncio event loop.
+
+Messages are newline-delimited JSON frames, or binary frames once a device has
+negotiated them (see energy_model.protocol). Every wakeup drains all complete
+frames from the receive buffer and hands them to the handler as one batch; the
+replies go back in a single write, in order.
+
+In asyncio mode the server can additionally micro-batch across connections:
+readings that arrive within `batch_window` seconds of each other are handed to
+IngestHandler.handle_multi() together, so the handler can make all decisions
+in one vectorized pass.
+
+Side effects that may block (database inserts, Socket.IO emits) go through a
+SideEffectQueue: the handler enqueues a call and replies at once, a worker
+thread runs the calls in order.
+"""
+import asyncio
+import socket
+import threading
+from collections import deque
+
+from energy_model.protocol import (
+    ENCODING_JSON, RECV_SIZE, FrameDecoder, accept_hello, encode_frame, encode_message, is_hello,
+)
+
+
+class IngestHandler:
+    """
+    Callbacks invoked by the ingestion servers.
+
+    open_session() is called once per connection and may return any object used
+    to keep per-connection state; handle_message() returns the reply dict for one
+    reading. handle_batch() receives every frame drained in one wakeup of one
+    connection, handle_multi() a list of (session, message) pairs that may span
+    connections; both must return one reply per message, in order. They run on the
+    connection thread (threaded mode) or on the event loop (asyncio mode), so they
+    must not block for long: hand blocking work to a SideEffectQueue.
+    """
+
+    def open_session(self, addr):
+        return {"addr": addr}
+
+    def handle_message(self, session, message):
+        raise NotImplementedError
+
+    def handle_batch(self, session, messages):
+        return self.handle_multi([(session, m) for m in messages])
+
+    def handle_multi(self, items):
+        return [self.handle_message(session, m) for session, m in items]
+
+    def close_session(self, session):
+        pass
+
+
+class SideEffectQueue:
+    """
+    Runs blocking side effects of the ingestion handler on a worker thread.
+
+    submit() appends the call to a bounded queue and returns; calls run one at a
+    time in submission order. When the queue is full the oldest call is dropped
+    (and counted) so a stalled sink cannot grow memory without bound.
+    """
+
+    def __init__(self, max_queue=10000, name="ingest-side-effects"):
+        self.max_queue = max_queue
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stop = False
+        self.counters = {"submitted": 0, "done": 0, "errors": 0, "dropped": 0}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._cond:
+            self.counters["submitted"] += 1
+            if len(self._queue) >= self.max_queue:
+                self._queue.popleft()
+                self.counters["dropped"] += 1
+            self._queue.append((fn, args, kwargs))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stop:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                fn, args, kwargs = self._queue.popleft()
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                with self._cond:
+                    self.counters["errors"] += 1
+                print(f"⚠️ [Ingest] Side effect {getattr(fn, '__name__', fn)} failed: {e}")
+            with self._cond:
+                self.counters["done"] += 1
+
+    def close(self, timeout=5.0):
+        """Run what is queued (up to `timeout` seconds), then stop the worker."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            return {**self.counters, "queued": len(self._queue)}
+
+
+def split_frames(messages):
+    """
+    Group drained frames into runs of readings separated by HELLO handshakes.
+    Yields (hello, None) or (None, readings) in arrival order.
+    """
+    batch = []
+    for message in messages:
+        if is_hello(message):
+            if batch:
+                yield None, batch
+                batch = []
+            yield message, None
+        else:
+            batch.append(message)
+    if batch:
+        yield None, batch
+
+
+def process_frames(handler, session, messages, encoding):
+    """
+    Answer the HELLO handshake and run readings through the handler in batches.
+
+    Returns (reply bytes, encoding) where encoding is the one in effect after
+    this batch. Replies to readings that arrived before a HELLO keep the old encoding.
+    """
+    out = []
+    for hello, batch in split_frames(messages):
+        if hello:
+            encoding, ack = accept_hello(hello)
+            out.append(encode_frame(ack))
+        else:
+            out.extend(encode_message(r, encoding) for r in handler.handle_batch(session, batch))
+    return b''.join(out), encoding
+
+
+class MicroBatcher:
+    """
+    Collects readings from many connections for up to `window` seconds and
+    runs them through handler.handle_multi() in one call. Lives on the event loop.
+    """
+
+    def __init__(self, handler, window):
+        self.handler = handler
+        self.window = window
+        self._items = []
+        self._waiters = []  # (future, start, count)
+        self._timer = None
+
+    async def submit(self, session, messages):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.append((future, len(self._items), len(messages)))
+        self._items.extend((session, m) for m in messages)
+        if self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        items, waiters = self._items, self._waiters
+        self._items, self._waiters, self._timer = [], [], None
+        try:
+            replies = self.handler.handle_multi(items)
+        except Exception as e:
+            for future, _, _ in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, start, count in waiters:
+            if not future.done():
+                future.set_result(replies[start:start + count])
+
+
+class ThreadedIngestServer:
+    """Accept loop that spawns one daemon thread per device connection."""
+
+    def __init__(self, handler, host, port, backlog=socket.SOMAXCONN):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.ready = threading.Event()
+        self._running = False
+
+    def serve_forever(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, self.port))
+        server.listen(self.backlog)
+        server.settimeout(1.0)
+        self.port = server.getsockname()[1]
+        self._running = True
+        self.ready.set()
+        try:
+            while self._running:
+                try:
+                    conn, addr = server.accept()
+                except socket.timeout:
+                    continue
+                thread = threading.Thread(target=self._serve_connection, args=(conn, addr))
+                thread.daemon = True
+                thread.start()
+        finally:
+            server.close()
+
+    def stop(self):
+        self._running = False
+
+    def _serve_connection(self, conn, addr):
+        session = self.handler.open_session(addr)
+        decoder = FrameDecoder()
+        encoding = ENCODING_JSON
+        try:
+            with conn:
+                while True:
+                    data = conn.recv(RECV_SIZE)
+                    if not data:
+                        break
+                    messages = decoder.feed(data)
+                    if not messages:
+                        continue
+                    out, encoding = process_frames(self.handler, session, messages, encoding)
+                    conn.sendall(out)
+        except Exception as e:
+            print(f"❌ 连接断开 {addr}: {e}")
+        finally:
+            self.handler.close_session(session)
+
+
+class AsyncIngestServer:
+    """
+    Serves all device connections as coroutines on one event loop.
+
+    Each connection is a lightweight task instead of an OS thread, so several
+    thousand idle machines cost a few KB each rather than a thread stack.
+    With batch_window > 0, readings from all connections are micro-batched.
+    """
+
+    def __init__(self, handler, host, port, backlog=socket.SOMAXCONN, batch_window=0.0):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.batch_window = batch_window
+        self.ready = threading.Event()
+        self._loop = None
+        self._server = None
+        self._batcher = None
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        if self.batch_window > 0:
+            self._batcher = MicroBatcher(self.handler, self.batch_window)
+        self._server = await asyncio.start_server(
+            self._serve_connection, self.host, self.port,
+            backlog=self.backlog, reuse_address=True)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.ready.set()
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    def stop(self):
+        if self._loop and self._server:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+    async def _serve_connection(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        session = self.handler.open_session(addr)
+        decoder = FrameDecoder()
+        encoding = ENCODING_JSON
+        try:
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    break
+                messages = decoder.feed(data)
+                if not messages:
+                    continue
+                out, encoding = await self._process_frames(session, messages, encoding)
+                writer.write(out)
+                await writer.drain()
+        except Exception as e:
+            print(f"❌ 连接断开 {addr}: {e}")
+        finally:
+            self.handler.close_session(session)
+            writer.close()
+
+
+    async def _process_frames(self, session, messages, encoding):
+        if self._batcher is None:
+            return process_frames(self.handler, session, messages, encoding)
+        out = []
+        for hello, batch in split_frames(messages):
+            if hello:
+                encoding, ack = accept_hello(hello)
+                out.append(encode_frame(ack))
+            else:
+                replies = await self._batcher.submit(session, batch)
+                out.extend(encode_message(r, encoding) for r in replies)
+        return b''.join(out), encoding
+
+
+INGEST_MODES = {
+    "threaded": ThreadedIngestServer,
+    "asyncio": AsyncIngestServer,
+}
+
+
+def create_ingest_server(mode, handler, host, port, batch_window=0.0):
+    """
+    Build the ingestion server for `mode` ('threaded' or 'asyncio').
+    batch_window (seconds) enables cross-connection micro-batching; asyncio mode only.
+    """
+    try:
+        server_cls = INGEST_MODES[mode]
+    except KeyError:
+        raise ValueError(f"Unknown ingest mode '{mode}', expected one of {sorted(INGEST_MODES)}")
+    if server_cls is AsyncIngestServer:
+        return server_cls(handler, host, port, batch_window=batch_window)
+    if batch_window:
+        print(f"⚠️ [Ingest] batch_window is only supported in asyncio mode, ignored for '{mode}'")
+    return server_cls(handler, host, port)
@@ -0,0 +1,238 @@
+"""
+Event-driven scheduling of the monitor analysis.
+
+Instead of analyzing every device on a fixed tick, the monitor loop asks
+MonitorScheduler.wait_due() which devices are due and analyzes just those:
+
+- notify(device_id) marks new telemetry for a device (e.g. from a probe of the
+  latest data time in InfluxDB). The device becomes due at once, but never sooner
+  than `min_interval` seconds after its previous analysis start
+- without new telemetry a device is still analyzed every `deadline` seconds
+- a device that has never been analyzed is due immediately
+
+Each device may have its own min_interval / deadline (`intervals`). Two
+histograms are kept: drift (how late an analysis started relative to when the
+device became due) and latency (from the moment its telemetry landed to the
+end of the analysis, i.e. when its alerts are out). finished() must be called
+for every device wait_due() returned, failed ones included, so slow devices
+show up in the latency; outcomes (analyzed, empty, errors, timeouts, ...) are
+counted separately.
+"""
+import bisect
+import heapq
+import threading
+import time
+
+LATENCY_BOUNDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+# FleetMonitor.last_outcomes value -> stats counter
+OUTCOME_COUNTERS = {"analyzed": "analyzed", "empty": "empty", "error": "errors", "timeout": "timeouts",
+                    "overrun": "overruns", "skipped": "skipped"}
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds (cumulative `le` buckets like Prometheus)."""
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        seconds = max(0.0, seconds)
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the overflow bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        cumulative, seen = [], 0
+        for bound, n in zip(self.bounds + ("+Inf",), self.counts):
+            seen += n
+            cumulative.append([bound, seen])
+        return {
+            "count": self.count,
+            "avg_s": round(self.total / self.count, 3) if self.count else None,
+            "p50_s": self.quantile(0.5),
+            "p95_s": self.quantile(0.95),
+            "max_s": round(self.max, 3) if self.count else None,
+            "buckets": cumulative,
+        }
+
+
+class _Device:
+    __slots__ = ("min_interval", "deadline", "last_start", "pending", "running", "due")
+
+    def __init__(self, min_interval, deadline, due):
+        self.min_interval = min_interval
+        self.deadline = deadline
+        self.last_start = None  # monotonic start of the last analysis
+        self.pending = None  # wall time the oldest unanalyzed telemetry landed
+        self.running = None  # `pending` of the analysis in progress
+        self.due = due
+
+
+class MonitorScheduler:
+    def __init__(self, min_interval=10.0, deadline=60.0, intervals=None):
+        """
+        Args:
+            min_interval (float): Least seconds between two analyses of a device.
+            deadline (float): Most seconds between two analyses of a device.
+            intervals (dict): {device_id: {"min_interval": s, "deadline": s}} overrides.
+        """
+        self.min_interval = min_interval
+        self.deadline = deadline
+        self.intervals = intervals or {}
+        self._devices = {}
+        self._heap = []  # (due, device_id); stale entries are skipped
+        self._cond = threading.Condition()
+        self.drift = LatencyHistogram()
+        self.latency = LatencyHistogram()
+        self.counters = {"events": 0, "ignored_events": 0, "runs_event": 0, "runs_deadline": 0, "runs_new": 0,
+                         **{name: 0 for name in OUTCOME_COUNTERS.values()}}
+
+    def _schedule(self, device_id, entry, due):
+        entry.due = due
+        heapq.heappush(self._heap, (due, device_id))
+
+    def sync(self, device_ids):
+        """Follow the given device set: new devices are due now, missing ones are dropped."""
+        keep = set(device_ids)
+        now = time.monotonic()
+        with self._cond:
+            for device_id in [d for d in self._devices if d not in keep]:
+                del self._devices[device_id]
+            added = False
+            for device_id in keep:
+                if device_id not in self._devices:
+                    override = self.intervals.get(device_id, {})
+                    entry = _Device(override.get("min_interval", self.min_interval),
+                                    override.get("deadline", self.deadline), now)
+                    self._devices[device_id] = entry
+                    self._schedule(device_id, entry, now)
+                    added = True
+            if added:
+                self._cond.notify()
+
+    def notify(self, device_id, arrived=None):
+        """
+        New telemetry landed for a device; cheap enough for the ingestion path.
+
+        Args:
+            device_id (str): Device (gateWayId); unknown devices are ignored.
+            arrived (float): Wall time (epoch seconds) the data was produced / landed; defaults to now.
+
+        Returns:
+            bool: False if the device is not scheduled.
+        """
+        with self._cond:
+            entry = self._devices.get(device_id)
+            if entry is None:
+                self.counters["ignored_events"] += 1
+                return False
+            self.counters["events"] += 1
+            arrived = time.time() if arrived is None else arrived
+            if entry.pending is not None:
+                entry.pending = min(entry.pending, arrived)
+                return True
+            entry.pending = arrived
+            now = time.monotonic()
+            due = now if entry.last_start is None else max(now, entry.last_start + entry.min_interval)
+            if due < entry.due:
+                self._schedule(device_id, entry, due)
+                self._cond.notify()
+        return True
+
+    def _pop_stale(self):
+        while self._heap:
+            due, device_id = self._heap[0]
+            entry = self._devices.get(device_id)
+            if entry is not None and entry.due == due:
+                return
+            heapq.heappop(self._heap)
+
+    def wait_due(self, timeout=None):
+        """
+        Block until at least one device is due (or `timeout` passes) and mark them started.
+
+        Returns:
+            list: Due device ids (empty on timeout).
+        """
+        give_up = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._pop_stale()
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                wake = self._heap[0][0] if self._heap else None
+                if give_up is not None:
+                    if give_up <= now:
+                        return []
+                    wake = give_up if wake is None else min(wake, give_up)
+                self._cond.wait(None if wake is None else wake - now)
+
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                at, device_id = heapq.heappop(self._heap)
+                entry = self._devices.get(device_id)
+                if entry is None or entry.due != at:
+                    continue
+                reason = "new" if entry.last_start is None else "event" if entry.pending is not None else "deadline"
+                self.counters[f"runs_{reason}"] += 1
+                self.drift.observe(now - at)
+                entry.last_start = now
+                entry.running, entry.pending = entry.pending, None
+                self._schedule(device_id, entry, now + entry.deadline)
+                due.append(device_id)
+            return due
+
+    def finished(self, device_ids, at=None, outcomes=None):
+        """
+        Record the end of the analyses started by wait_due(), whatever their outcome.
+
+        Args:
+            device_ids (iterable): Devices returned by wait_due().
+            at (float): Wall time the analyses ended (alerts out / given up); defaults to now.
+            outcomes (dict): {device_id: outcome} as in FleetMonitor.last_outcomes;
+                devices missing from it count as "analyzed".
+        """
+        at = time.time() if at is None else at
+        outcomes = outcomes or {}
+        with self._cond:
+            for device_id in device_ids:
+                outcome = outcomes.get(device_id, "analyzed")
+                self.counters[OUTCOME_COUNTERS.get(outcome, "errors")] += 1
+                entry = self._devices.get(device_id)
+                if entry is not None and entry.running is not None:
+                    self.latency.observe(at - entry.running)
+                    entry.running = None
+
+    def stats(self):
+        with self._cond:
+            self._pop_stale()
+            next_due = self._heap[0][0] - time.monotonic() if self._heap else None
+            return {
+                **self.counters,
+                "devices": len(self._devices),
+                "pending": sum(e.pending is not None for e in self._devices.values()),
+                "next_due_in_s": round(max(0.0, next_due), 3) if next_due is not None else None,
+                "min_interval_s": self.min_interval,
+                "deadline_s": self.deadline,
+                "drift": self.drift.to_dict(),
+                "latency": self.latency.to_dict(),
+            }
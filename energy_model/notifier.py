@@ -0,0 +1,210 @@
+"""
+Background dispatcher for DingTalk (or any webhook) alert messages.
+
+The monitor loop only calls AlertNotifier.submit(), which checks the per-key
+dedup window and appends to a bounded queue. A worker thread does the rest:
+
+- batching: waits up to `batch_window` seconds after the first pending alert
+  so that alerts of the same cycle go out as one message (at most `max_batch`
+  alerts per message)
+- rate limiting: a token bucket (`rate_per_min`, `burst`) paces the requests;
+  DingTalk robots reject more than 20 messages a minute. Alerts that arrive
+  while it waits for a token join the next message
+- retries: a failed request is retried `retries` times with exponential backoff
+  (`backoff`, doubling, capped at `max_backoff`); after that the batch is dropped
+  and counted
+
+A full queue drops its oldest alert. dingtalk_sender() builds the `send`
+callable for a robot webhook; it treats a non-zero errcode in the 200 response
+(e.g. 130101 "send too fast") as a failure.
+"""
+import threading
+import time
+from collections import deque
+
+import requests
+
+
+def dingtalk_sender(webhook, timeout=5.0, session=None):
+    """send(text) for a DingTalk robot webhook; raises on HTTP or DingTalk errors."""
+    http = session or requests.Session()
+
+    def send(text):
+        response = http.post(webhook, json={"msgtype": "text", "text": {"content": text}}, timeout=timeout)
+        response.raise_for_status()
+        try:
+            result = response.json()
+        except ValueError:
+            return
+        if result.get("errcode", 0) != 0:
+            raise RuntimeError(f"DingTalk errcode {result.get('errcode')}: {result.get('errmsg')}")
+
+    return send
+
+
+class TokenBucket:
+    def __init__(self, rate_per_s, burst):
+        self.rate = rate_per_s
+        self.burst = burst
+        self.tokens = float(burst)
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class AlertNotifier:
+    def __init__(self, send, prefix="🚨 [得鹿山能源警报]", dedup_s=600.0, rate_per_min=20, burst=5,
+                 batch_window=5.0, max_batch=20, max_queue=1000, retries=3, backoff=2.0, max_backoff=60.0):
+        """
+        Args:
+            send (callable): send(text) posts one message; must raise on failure.
+            prefix (str): First line of every message.
+            dedup_s (float): An alert key is sent at most once per this many seconds.
+            rate_per_min (float): Sustained messages per minute (token bucket rate).
+            burst (int): Messages that may go out back to back (bucket size).
+            batch_window (float): Seconds to collect alerts before sending.
+            max_batch (int): Alerts per message.
+            max_queue (int): Pending alerts kept; beyond it the oldest is dropped.
+            retries (int): Attempts after the first failed one.
+            backoff (float): First retry delay in seconds (doubles per attempt).
+            max_backoff (float): Cap on the retry delay.
+        """
+        self.send = send
+        self.prefix = prefix
+        self.dedup_s = dedup_s
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst)
+
+        self._queue = deque()  # (enqueued monotonic time, text)
+        self._last_sent = {}  # key -> monotonic time of its last submit
+        self._cond = threading.Condition()
+        self._stop = False
+        self.counters = {"submitted": 0, "deduplicated": 0, "dropped": 0, "sent_alerts": 0,
+                         "messages": 0, "retries": 0, "failed_alerts": 0}
+        self._thread = threading.Thread(target=self._run, name="alert-notifier", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, text):
+        """
+        Queue an alert; never blocks on the network.
+
+        Returns:
+            bool: False if it was suppressed by the key's dedup window.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self.counters["submitted"] += 1
+            last = self._last_sent.get(key)
+            if last is not None and now - last < self.dedup_s:
+                self.counters["deduplicated"] += 1
+                return False
+            self._last_sent[key] = now
+            if len(self._last_sent) > 4 * self.max_queue:
+                self._last_sent = {k: t for k, t in self._last_sent.items() if now - t < self.dedup_s}
+            if len(self._queue) >= self.max_queue:
+                self._queue.popleft()
+                self.counters["dropped"] += 1
+            self._queue.append((now, text))
+            self._cond.notify()
+        return True
+
+    def _wait(self, seconds):
+        """Sleep unless close() is called; returns False when stopping."""
+        deadline = time.monotonic() + seconds
+        with self._cond:
+            while not self._stop:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self._cond.wait(remaining)
+        return False
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._queue and not self._stop:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            # Let the rest of the cycle's alerts arrive
+            deadline = self._queue[0][0] + self.batch_window
+            while not self._stop and len(self._queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        # Pace the request; alerts arriving meanwhile join this message
+        wait = self.bucket.wait_time()
+        if wait > 0:
+            self._wait(wait)  # returns at once after close(): flush without waiting for tokens
+        with self._cond:
+            n = min(self.max_batch, len(self._queue))
+            return [self._queue.popleft()[1] for _ in range(n)]
+
+    def _format(self, texts):
+        if len(texts) == 1:
+            return f"{self.prefix} {texts[0]}"
+        return f"{self.prefix} {len(texts)} 条告警\n" + "\n".join(texts)
+
+    def _deliver(self, texts):
+        body = self._format(texts)
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            self.bucket.take()
+            try:
+                self.send(body)
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"⚠️ [Notifier] Dropping {len(texts)} alert(s) after {attempt + 1} attempts: {e}")
+                    break
+                with self._cond:
+                    self.counters["retries"] += 1
+                if not self._wait(delay):
+                    break
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            with self._cond:
+                self.counters["messages"] += 1
+                self.counters["sent_alerts"] += len(texts)
+            return True
+        with self._cond:
+            self.counters["failed_alerts"] += len(texts)
+        return False
+
+    def _run(self):
+        while True:
+            texts = self._take_batch()
+            if texts is None:
+                break
+            if texts:
+                try:
+                    self._deliver(texts)
+                except Exception as e:
+                    print(f"⚠️ [Notifier] Error: {e}")
+
+    def close(self, timeout=10.0):
+        """Stop the worker after one attempt at whatever is still queued."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            return {**self.counters, "queued": len(self._queue), "tokens": round(self.bucket.tokens, 2)}
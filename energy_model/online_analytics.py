@@ -0,0 +1,389 @@
+"""
+Incremental (per-sample) counterpart of EnergyOptimizer's idle, phase balance
+and power factor analysis.
+
+EnergyOptimizer recomputes everything over the whole window on every call.
+OnlineEnergyAnalyzer keeps running state instead, and each new 1-minute sample
+costs O(1) (amortized):
+
+- idle threshold: 15th percentile of active (> 0.1 kW) power over the window,
+  from a log-binned histogram (1 % bins) with a pointer kept on the quantile's
+  bin (WindowQuantile)
+- idle runs: the open run (start, length, power sum); once it is at least
+  `duration_minutes` long its samples count as idle
+- unbalance / PF: count, sum, max / min and threshold counts per time bucket
+
+The window is a ring of `buckets` time buckets (24 one-hour buckets for the
+default 24 h); it slides in bucket steps, and a bucket leaving the window takes
+its counts (and its histogram counts) with it. Results read a few dozen numbers
+instead of a DataFrame and have the same shape as the batch methods (same
+formulas, including the 5-minute-per-sample hours).
+
+Two decisions are made when a sample arrives instead of afterwards with the
+whole window: whether it is below the idle threshold and whether the device is
+running for PF (power above 5 % of the window maximum). With a stable load they
+are the same; after a change of operating level the batch re-classifies the
+whole window, while the online results keep the earlier decisions. The error
+this causes is not bounded, so the monitor loop only uses this class when
+MONITOR_ONLINE_ANALYTICS=1 (off by default).
+
+Measured tolerance (benchmarks/bench_online_analytics.py, 5 devices x 3 days of
+1-minute busy / idle samples, 360 hourly comparisons with EnergyOptimizer on the
+same 24 h; largest |online - batch|, mean in parentheses):
+
+- unbalance (avg / max / severe hours): float rounding
+- avg_pf <= 0.008, min_pf <= 0.002
+- low_pf_hours <= 8.0 h (mean 0.3 h), fixed or estimated threshold
+- fixed threshold_power: total_idle_hours <= 0.23 h (mean 0.002 h),
+  total_wasted_energy_kwh <= 1.4 kWh, idle_events_count <= 1
+- estimated threshold: within 1.1 % (mean 0.5 %) of the batch one, but
+  total_idle_hours <= 9.0 h (mean 1.7 h), total_wasted_energy_kwh <= 39.5 kWh
+  (mean 9.1 kWh), idle_events_count <= 6 (mean 1.3)
+
+With a fixed threshold the idle error comes only from runs cut by the window
+start (<= duration_minutes per window). With the estimated threshold, samples
+near the threshold are classified against the estimate at arrival, not against
+the final window percentile, and whole runs can flip. These gaps are large
+enough to change the idle_long / idle_some and PF alert rules.
+"""
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+NAN = float('nan')
+
+
+class WindowQuantile:
+    """
+    One quantile of the values in a sliding window of buckets, to within half a
+    log-spaced bin (`relative_error`). add() and drop() are O(1) per value: the
+    quantile's bin and the count below it are kept and moved a few bins at a time.
+    """
+
+    def __init__(self, q, relative_error=0.01, min_value=0.1):
+        """
+        Args:
+            q (float): Quantile in [0, 1], e.g. 0.15.
+            relative_error (float): Bin width (relative); the estimate is the bin's geometric middle.
+            min_value (float): Smallest value expected (values below share the first bin).
+        """
+        self.q = q
+        self.min_value = min_value
+        self._log_gamma = math.log1p(2 * relative_error)
+        self._counts = []
+        self.count = 0
+        self._pos = 0  # bin holding the quantile
+        self._below = 0  # values in bins < _pos
+
+    def _bin(self, x):
+        return max(0, int(math.log(x / self.min_value) / self._log_gamma)) if x > self.min_value else 0
+
+    def add(self, x, bins=None):
+        """Add a value; `bins` ({bin: count}, e.g. the bucket's) records it so drop() can take it out."""
+        i = self._bin(x)
+        counts = self._counts
+        if i >= len(counts):
+            counts.extend([0] * (i + 1 - len(counts)))
+        counts[i] += 1
+        self.count += 1
+        if i < self._pos:
+            self._below += 1
+        if bins is not None:
+            bins[i] = bins.get(i, 0) + 1
+        self._settle()
+
+    def drop(self, bins):
+        """Remove the values recorded in `bins`."""
+        for i, n in bins.items():
+            self._counts[i] -= n
+            self.count -= n
+            if i < self._pos:
+                self._below -= n
+        self._settle()
+
+    def _settle(self):
+        if not self.count:
+            self._pos, self._below = 0, 0
+            return
+        rank = int(self.q * (self.count - 1))  # 0-based rank of the lower sample np.quantile interpolates from
+        counts = self._counts
+        while self._below > rank:
+            self._pos -= 1
+            self._below -= counts[self._pos]
+        while self._below + counts[self._pos] <= rank:
+            self._below += counts[self._pos]
+            self._pos += 1
+
+    def value(self):
+        """Current estimate, NaN while the window is empty."""
+        if not self.count:
+            return NAN
+        return self.min_value * math.exp((self._pos + 0.5) * self._log_gamma)
+
+
+class _Bucket:
+    __slots__ = ("key", "unbal_n", "unbal_sum", "unbal_max", "severe", "pf_n", "pf_sum", "pf_min", "low_pf",
+                 "p_max", "idle_minutes", "wasted_kwh", "events", "power_bins")
+
+    def __init__(self, key):
+        self.key = key
+        self.unbal_n = 0
+        self.unbal_sum = 0.0
+        self.unbal_max = -math.inf
+        self.severe = 0
+        self.pf_n = 0
+        self.pf_sum = 0.0
+        self.pf_min = math.inf
+        self.low_pf = 0
+        self.p_max = -math.inf
+        self.idle_minutes = 0
+        self.wasted_kwh = 0.0
+        self.events = []
+        self.power_bins = {}  # this bucket's active power in the threshold histogram
+
+
+class OnlineEnergyAnalyzer:
+    def __init__(self, duration_minutes=15, interval_minutes=1, window_minutes=1440, buckets=24, quantile=0.15,
+                 threshold_power=None):
+        """
+        Args:
+            duration_minutes (int): Minimum duration of an idle event.
+            interval_minutes (int): Minutes per sample (1 for the monitor's 1-minute frames).
+            window_minutes (int): Window the results cover.
+            buckets (int): Time buckets per window (the window slides by window_minutes / buckets).
+            quantile (float): Active-power quantile used as idle threshold.
+            threshold_power (float): Fixed idle threshold (kW) instead of the estimate.
+        """
+        self.duration_minutes = duration_minutes
+        self.interval_minutes = interval_minutes
+        self.quantile = quantile
+        self.threshold_power = threshold_power
+        self.window_ns = int(window_minutes * 60e9)
+        self.bucket_ns = max(1, self.window_ns // buckets)
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self):
+        self._ring = deque()
+        self._bucket = None
+        self._power_quantile = WindowQuantile(self.quantile)
+        self._seeded_bins = {}  # bucket key -> histogram counts added before the bucket exists
+        self._p_max = -math.inf
+        self._run_len = 0
+        self._run_sum = 0.0
+        self._run_start = None
+        self._run_end = None
+        self._run_parts = {}  # bucket key -> [samples, power sum] until the open run is long enough
+        self._has_currents = False
+        self._has_pf = False
+        self.last_timestamp = None  # ns since epoch (UTC) of the last accepted sample
+        self.samples = 0
+
+    # --- updates ---
+
+    def update(self, ts, power=NAN, ia=NAN, ib=NAN, ic=NAN, pft=NAN):
+        """
+        Add one sample (power in kW). Samples not newer than the last one are ignored.
+
+        Args:
+            ts (pd.Timestamp or int): Sample time (int: ns since epoch, UTC).
+
+        Returns:
+            bool: Whether the sample was used.
+        """
+        t = ts if isinstance(ts, (int, np.integer)) else pd.Timestamp(ts).value
+        if self.last_timestamp is not None and t <= self.last_timestamp:
+            return False
+        self._step(t, power, ia, ib, ic, pft, learn=True)
+        return True
+
+    def update_frame(self, df):
+        """
+        Add the rows of a frame newer than last_timestamp (columns as for EnergyOptimizer:
+        'pt' or 'demand' in kW, ia / ib / ic, pft).
+
+        Returns:
+            int: Rows used.
+        """
+        if df is None or df.empty:
+            return 0
+        times = df.index.as_unit('ns').asi8
+        if self.last_timestamp is not None:
+            times = times[np.searchsorted(times, self.last_timestamp, side='right'):]
+        if not len(times):
+            return 0
+        df = df.iloc[len(df) - len(times):]
+        power_col = 'pt' if 'pt' in df.columns and df['pt'].sum() > 0 else 'demand'
+
+        def column(name):
+            if name in df.columns:
+                return df[name].to_numpy(dtype=np.float64).tolist()
+            return [NAN] * len(df)
+
+        power = column(power_col)
+        seed = self._bucket is None
+        if seed:
+            # First batch (usually the whole window): the threshold is taken from all of it
+            # before its samples are classified, as the batch method does
+            for t, p in zip(times.tolist(), power):
+                if p > 0.1:
+                    self._p_max = max(self._p_max, p)
+                    self._power_quantile.add(p, self._seeded_bins.setdefault(t // self.bucket_ns, {}))
+        for t, p, a, b, c, f in zip(times.tolist(), power, column('ia'), column('ib'), column('ic'),
+                                    column('pft')):
+            self._step(t, p, a, b, c, f, learn=not seed)
+        return len(times)
+
+    def _roll(self, t):
+        key = t // self.bucket_ns
+        if self._bucket is not None and key == self._bucket.key:
+            return self._bucket
+        self._bucket = _Bucket(key)
+        self._bucket.power_bins = self._seeded_bins.pop(key, {})
+        self._ring.append(self._bucket)
+        expired = False
+        while self._ring[0].key <= key - self.buckets:
+            self._power_quantile.drop(self._ring.popleft().power_bins)
+            expired = True
+        if expired:
+            self._p_max = max(b.p_max for b in self._ring)
+        return self._bucket
+
+    def _step(self, t, p, ia, ib, ic, pf, learn=True):
+        bucket = self._roll(t)
+        self.last_timestamp = t
+        self.samples += 1
+        if learn and p > 0.1:
+            self._power_quantile.add(p, bucket.power_bins)
+
+        # Idle run (NaN power is never idle). Its samples count towards their own buckets
+        # once the run is long enough, so runs leave the window sample by sample as in the batch.
+        if p < self._threshold():
+            if not self._run_len:
+                self._run_start = t
+                self._run_sum = 0.0
+                self._run_parts = {}
+            self._run_len += 1
+            self._run_sum += p
+            self._run_end = t
+            if self._run_len * self.interval_minutes < self.duration_minutes:
+                part = self._run_parts.setdefault(bucket.key, [0, 0.0])
+                part[0] += 1
+                part[1] += p
+            else:
+                if self._run_parts:
+                    for b in self._ring:
+                        if b.key in self._run_parts:
+                            self._credit(b, *self._run_parts[b.key])
+                    self._run_parts = {}
+                self._credit(bucket, 1, p)
+        elif self._run_len:
+            self._close_run(bucket)
+
+        # Phase balance
+        currents = [x for x in (ia, ib, ic) if x == x]
+        if currents:
+            self._has_currents = True
+            i_avg = sum(currents) / len(currents)
+            if i_avg > 1.0:
+                unbalance = max(abs(x - i_avg) for x in currents) / i_avg * 100.0
+                bucket.unbal_n += 1
+                bucket.unbal_sum += unbalance
+                if unbalance > bucket.unbal_max:
+                    bucket.unbal_max = unbalance
+                if unbalance > 15:
+                    bucket.severe += 1
+
+        # Power factor while running (power above 5 % of the window maximum so far)
+        if p > bucket.p_max:
+            bucket.p_max = p
+            if p > self._p_max:
+                self._p_max = p
+        if pf == pf:
+            self._has_pf = True
+            if pf > 1.5:
+                pf = pf / 1000.0
+            if p > self._p_max * 0.05:
+                bucket.pf_n += 1
+                bucket.pf_sum += pf
+                if pf < bucket.pf_min:
+                    bucket.pf_min = pf
+                if pf < 0.9:
+                    bucket.low_pf += 1
+
+    def _run_event(self):
+        duration = self._run_len * self.interval_minutes
+        if duration < self.duration_minutes:
+            return None
+        avg_power = self._run_sum / self._run_len
+        return {
+            "start_time": self._run_start,
+            "end_time": self._run_end,
+            "duration_minutes": duration,
+            "avg_power": avg_power,
+            "wasted_energy_kwh": avg_power * duration / 60.0,
+        }
+
+    def _credit(self, bucket, samples, power_sum):
+        bucket.idle_minutes += samples * self.interval_minutes
+        bucket.wasted_kwh += power_sum * self.interval_minutes / 60.0
+
+    def _close_run(self, bucket):
+        event = self._run_event()
+        if event is not None:
+            bucket.events.append(event)
+        self._run_len = 0
+        self._run_parts = {}
+
+    # --- results (same shape as EnergyOptimizer) ---
+
+    def _threshold(self):
+        return self.threshold_power if self.threshold_power is not None else self._power_quantile.value()
+
+    def detect_idle_state(self):
+        if self.threshold_power is None and not self._power_quantile.count:
+            return {"idle_hours": 0, "wasted_energy": 0}
+        events = [e for b in self._ring for e in b.events]
+        idle_minutes = sum(b.idle_minutes for b in self._ring)
+        wasted = sum(b.wasted_kwh for b in self._ring)
+        open_run = self._run_event() if self._run_len else None
+        if open_run is not None:
+            events.append(open_run)
+        frame = pd.DataFrame({
+            key: pd.DatetimeIndex(np.array([e[key] for e in events], dtype='datetime64[ns]')).tz_localize('UTC')
+            if key.endswith('_time') else np.array([e[key] for e in events])
+            for key in ("start_time", "end_time", "duration_minutes", "avg_power", "wasted_energy_kwh")
+        }) if events else pd.DataFrame()
+        return {
+            "threshold_used": self._threshold(),
+            "total_idle_hours": idle_minutes / 60.0,
+            "total_wasted_energy_kwh": wasted,
+            "idle_events_count": len(events),
+            "events": frame,
+        }
+
+    def analyze_phase_balance(self):
+        if not self._has_currents:
+            return {"error": "Missing current columns"}
+        n = sum(b.unbal_n for b in self._ring)
+        if not n:
+            return {"status": "Current too low for balance analysis"}
+        return {
+            "avg_unbalance_percent": sum(b.unbal_sum for b in self._ring) / n,
+            "max_unbalance_percent": max(b.unbal_max for b in self._ring),
+            "severe_unbalance_hours": (sum(b.severe for b in self._ring) * 5) / 60.0,
+        }
+
+    def analyze_power_factor(self):
+        if not self._has_pf:
+            return {"error": "Missing 'pft' column"}
+        n = sum(b.pf_n for b in self._ring)
+        low = sum(b.low_pf for b in self._ring)
+        return {
+            "avg_pf": sum(b.pf_sum for b in self._ring) / n if n else NAN,
+            "min_pf": min(b.pf_min for b in self._ring) if n else NAN,
+            "low_pf_hours": (low * 5) / 60.0,
+            "recommendation": "Install capacitor bank" if low > 0 else "Good PF",
+        }
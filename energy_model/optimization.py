@@ -1,6 +1,78 @@
+import warnings
+
 import pandas as pd
 import numpy as np
 
+
+def idle_thresholds(power, quantile=0.15):
+    """
+    Default idle threshold: the 15th percentile of active (> 0.1 kW) power.
+
+    Args:
+        power (np.ndarray): (samples,) or (devices, samples) power in kW; NaN is ignored.
+
+    Returns:
+        float or np.ndarray: Threshold per device (NaN where a device has no active power).
+    """
+    active = np.where(power > 0.1, power, np.nan)
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN rows
+        return np.nanquantile(active, quantile, axis=-1)
+
+
+def find_idle_runs(power, threshold, duration_minutes=30, interval_minutes=5):
+    """
+    Run-length encoding of `power < threshold`, keeping runs of at least duration_minutes.
+
+    Args:
+        power (np.ndarray): (samples,) or (devices, samples); NaN samples are not idle.
+        threshold (float or np.ndarray): Broadcast against `power` (e.g. (devices, 1)).
+        duration_minutes (int): Minimum run duration.
+        interval_minutes (int): Minutes per sample.
+
+    Returns:
+        dict: Arrays per run, in order: device (row), start / end (sample positions, end
+              exclusive), duration_minutes, avg_power, wasted_energy_kwh.
+    """
+    power = np.atleast_2d(power)
+    with np.errstate(invalid='ignore'):
+        idle = power < threshold
+    devices, samples = idle.shape
+    # A non-idle sample on both sides of every row, so runs never cross rows
+    edges = np.zeros((devices, samples + 2), dtype=np.int8)
+    edges[:, 1:-1] = idle
+    steps = np.diff(edges, axis=1).ravel()
+    width = samples + 1
+    starts = np.flatnonzero(steps == 1)
+    ends = np.flatnonzero(steps == -1)
+    lengths = ends - starts
+    keep = lengths * interval_minutes >= duration_minutes
+    starts, ends, lengths = starts[keep], ends[keep], lengths[keep]
+    device, start = np.divmod(starts, width)
+    end = ends - device * width
+
+    # Sum of each run: reduceat over [start, end) pairs of the flattened power (padded so end can equal len)
+    flat = np.zeros(devices * width + 1)
+    flat[:-1].reshape(devices, width)[:, :samples] = np.nan_to_num(power)
+    if len(starts):
+        bounds = np.empty(2 * len(starts), dtype=np.intp)
+        bounds[0::2] = device * width + start
+        bounds[1::2] = device * width + end
+        sums = np.add.reduceat(flat, bounds)[0::2]
+    else:
+        sums = np.empty(0)
+    duration = lengths * interval_minutes
+    avg_power = sums / np.maximum(lengths, 1)
+    return {
+        "device": device,
+        "start": start,
+        "end": end,
+        "duration_minutes": duration,
+        "avg_power": avg_power,
+        "wasted_energy_kwh": avg_power * duration / 60.0,  # kWh
+    }
+
+
 class EnergyOptimizer:
     def __init__(self, df):
         """
@@ -16,7 +88,7 @@ class EnergyOptimizer:
         
         Args:
             threshold_power (float): Power (kW) below which is considered idle. 
-                                     If None, estimated as 20th percentile of non-zero power.
+                                     If None, estimated as 15th percentile of non-zero power.
             duration_minutes (int): Minimum duration to classify as idle event.
             resample_interval_minutes (int): Time interval between data points in minutes.
                                              Default 5 for offline CSV, use 1 for real-time.
@@ -32,57 +104,70 @@ class EnergyOptimizer:
         elif 'demand' not in self.df.columns:
              return {"error": "Missing power column ('pt' or 'demand')"}
              
-        power = self.df[power_col]
+        power = self.df[power_col].to_numpy(dtype=np.float64)
         
         # Estimate threshold if not provided
         if threshold_power is None:
-            # Assume idle is low power but not zero
-            active_power = power[power > 0.1]
-            if active_power.empty:
+            threshold_power = idle_thresholds(power)
+            if np.isnan(threshold_power):
+                # No active power at all
                 return {"idle_hours": 0, "wasted_energy": 0}
-            # Use 15th percentile
-            threshold_power = active_power.quantile(0.15)
-        
-        # Identify idle periods
-        is_idle = power < threshold_power
-        
-        # We want continuous blocks. 
-        # Calculate duration of each block.
-        # Since data is resampled to interval (e.g. 5min or 1min), each row is X min.
-        
-        # Group consecutive True values
-        # Logic: (is_idle != is_idle.shift()).cumsum() creates a group ID that changes every time state changes
-        groups = is_idle.ne(is_idle.shift()).cumsum()
-        idle_blocks = self.df[is_idle].groupby(groups)
-        
-        idle_events = []
-        total_wasted_energy = 0
-        total_idle_time = 0
-        
-        for _, block in idle_blocks:
-            duration = len(block) * resample_interval_minutes
-            if duration >= duration_minutes:
-                start_time = block.index.min()
-                end_time = block.index.max()
-                avg_power = block[power_col].mean()
-                energy = (avg_power * duration) / 60.0 # kWh
-                
-                idle_events.append({
-                    "start_time": start_time,
-                    "end_time": end_time,
-                    "duration_minutes": duration,
-                    "avg_power": avg_power,
-                    "wasted_energy_kwh": energy
-                })
-                total_wasted_energy += energy
-                total_idle_time += duration
+        
+        runs = find_idle_runs(power, threshold_power, duration_minutes, resample_interval_minutes)
+        events = pd.DataFrame({
+            "start_time": self.df.index[runs["start"]],
+            "end_time": self.df.index[runs["end"] - 1],
+            "duration_minutes": runs["duration_minutes"],
+            "avg_power": runs["avg_power"],
+            "wasted_energy_kwh": runs["wasted_energy_kwh"],
+        }) if len(runs["start"]) else pd.DataFrame()
                 
         return {
             "threshold_used": threshold_power,
-            "total_idle_hours": total_idle_time / 60.0,
-            "total_wasted_energy_kwh": total_wasted_energy,
-            "idle_events_count": len(idle_events),
-            "events": pd.DataFrame(idle_events)
+            "total_idle_hours": runs["duration_minutes"].sum() / 60.0,
+            "total_wasted_energy_kwh": runs["wasted_energy_kwh"].sum(),
+            "idle_events_count": len(events),
+            "events": events
+        }
+
+    @staticmethod
+    def detect_idle_state_many(power, index=None, threshold_power=None, duration_minutes=30,
+                               resample_interval_minutes=5):
+        """
+        detect_idle_state() for many devices at once.
+
+        Args:
+            power (np.ndarray): (devices, samples) power in kW on a shared time grid (NaN = no data).
+            index (pd.DatetimeIndex): Timestamps of the samples (for start/end times), optional.
+            threshold_power (float or np.ndarray): Per-device idle threshold; None estimates
+                                                   each device's 15th percentile of non-zero power.
+            duration_minutes (int): Minimum duration to classify as idle event.
+            resample_interval_minutes (int): Time interval between data points in minutes.
+
+        Returns:
+            dict: Per-device arrays (threshold_used, total_idle_hours, total_wasted_energy_kwh,
+                  idle_events_count) and one DataFrame of all idle periods with a 'device' column
+                  (row of `power`).
+        """
+        power = np.asarray(power, dtype=np.float64)
+        thresholds = idle_thresholds(power) if threshold_power is None else \
+            np.broadcast_to(np.asarray(threshold_power, dtype=np.float64), power.shape[:1])
+        runs = find_idle_runs(power, thresholds[:, None], duration_minutes, resample_interval_minutes)
+        devices = len(power)
+        events = pd.DataFrame({
+            "device": runs["device"],
+            "start_time": runs["start"] if index is None else index[runs["start"]],
+            "end_time": runs["end"] - 1 if index is None else index[runs["end"] - 1],
+            "duration_minutes": runs["duration_minutes"],
+            "avg_power": runs["avg_power"],
+            "wasted_energy_kwh": runs["wasted_energy_kwh"],
+        })
+        return {
+            "threshold_used": thresholds,
+            "total_idle_hours": np.bincount(runs["device"], runs["duration_minutes"], minlength=devices) / 60.0,
+            "total_wasted_energy_kwh": np.bincount(runs["device"], runs["wasted_energy_kwh"], minlength=devices),
+            "idle_events_count": np.bincount(runs["device"], minlength=devices),
+            "events": events,
         }
 
     def analyze_phase_balance(self):
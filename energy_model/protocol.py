@@ -0,0 +1,280 @@
+"""
+Framing for the device <-> server socket protocol.
+
+Every message is one JSON object terminated by a newline (NDJSON). TCP is a byte
+stream, so a single recv() may hold several readings or only part of one;
+FrameDecoder buffers the stream and returns every complete frame it holds.
+
+Devices still running the old firmware send bare JSON objects without the
+trailing newline. The decoder accepts those too, as long as each object is
+complete, so old and new devices can share the same port.
+
+Devices may also negotiate a compact binary encoding. A connection starts in
+JSON; the device sends a HELLO frame asking for "binary" and, once the server
+acknowledges it, readings and replies travel as fixed-layout struct frames:
+
+    MAGIC (0xB5) | kind (u8) | payload (fixed size per kind)
+
+JSON and binary frames can be interleaved on the same stream. Messages that do
+not fit a binary layout (e.g. manual commands carrying params) are always sent
+as JSON frames.
+"""
+import json
+import struct
+from collections import deque
+
+RECV_SIZE = 65536
+MAX_FRAME_SIZE = 64 * 1024
+
+ENCODING_JSON = "json"
+ENCODING_BINARY = "binary"
+SUPPORTED_ENCODINGS = (ENCODING_JSON, ENCODING_BINARY)
+
+MAGIC = 0xB5
+_NO_TIMESTAMP = 0xFFFFFFFF
+
+_json_decoder = json.JSONDecoder()
+
+
+class BinaryLayout:
+    """Fixed struct layout of one binary frame kind."""
+
+    def __init__(self, kind, fmt, fields, device_type=None):
+        self.kind = kind
+        self.struct = struct.Struct(fmt)
+        self.fields = fields  # [(name, decimals)], decimals=None for the HH:MM:SS timestamp
+        self.device_type = device_type
+        self.header = bytes((MAGIC, kind))
+
+    @property
+    def size(self):
+        return self.struct.size
+
+    def encode(self, message):
+        values = []
+        for name, decimals in self.fields:
+            if decimals is None:
+                values.append(_pack_timestamp(message.get(name)))
+            else:
+                values.append(float(message.get(name, 0.0)))
+        return self.header + self.struct.pack(*values)
+
+    def decode(self, payload):
+        values = self.struct.unpack(payload)
+        message = {"device_type": self.device_type} if self.device_type else {}
+        for (name, decimals), value in zip(self.fields, values):
+            if decimals is None:
+                if value != _NO_TIMESTAMP:
+                    message[name] = "%02d:%02d:%02d" % (value // 3600, value // 60 % 60, value % 60)
+            else:
+                # float32 on the wire; devices report fixed decimals so rounding restores the exact value
+                message[name] = round(value, decimals)
+        return message
+
+
+def _pack_timestamp(value):
+    """'HH:MM:SS' -> seconds since midnight."""
+    if not value:
+        return _NO_TIMESTAMP
+    try:
+        h, m, sec = (int(x) for x in value.split(':'))
+        return h * 3600 + m * 60 + sec
+    except (AttributeError, ValueError):
+        return _NO_TIMESTAMP
+
+
+READING_LAYOUTS = {
+    "LUBRICATION_BOT": BinaryLayout(
+        0x01, "<Iff", [("timestamp", None), ("current_a", 2), ("temperature_c", 2)],
+        device_type="LUBRICATION_BOT"),
+    "TENSION_BOT": BinaryLayout(
+        0x02, "<fff", [("tension", 2), ("yarn_pct", 1), ("power", 2)],
+        device_type="TENSION_BOT"),
+}
+
+# Replies only carry the action; the human-readable "msg" stays on the server.
+REPLY_KIND = 0x81
+REPLY_ACTIONS = ("MONITOR", "INJECT", "OPTIMIZE_TENSION", "STOP", "START", "ALARM_STOP", "ERROR")
+_REPLY_CODES = {action: code for code, action in enumerate(REPLY_ACTIONS)}
+_REPLY_STRUCT = struct.Struct("<B")
+_REPLY_HEADER = bytes((MAGIC, REPLY_KIND))
+
+_LAYOUTS_BY_KIND = {layout.kind: layout for layout in READING_LAYOUTS.values()}
+
+
+def encode_frame(message):
+    """Serialize one message as a newline-terminated JSON frame."""
+    return json.dumps(message).encode('utf-8') + b'\n'
+
+
+def encode_message(message, encoding=ENCODING_JSON):
+    """
+    Serialize a reading or a reply in the connection's negotiated encoding.
+    Falls back to a JSON frame when the message has no binary layout.
+    """
+    if encoding == ENCODING_BINARY:
+        layout = READING_LAYOUTS.get(message.get("device_type"))
+        if layout is not None:
+            return layout.encode(message)
+        code = _REPLY_CODES.get(message.get("action"))
+        if code is not None and message.keys() <= {"action", "msg"}:
+            return _REPLY_HEADER + _REPLY_STRUCT.pack(code)
+    return encode_frame(message)
+
+
+def make_hello(encoding, device_type=None):
+    return {"type": "HELLO", "encoding": encoding, "device_type": device_type}
+
+
+def is_hello(message):
+    return message.get("type") == "HELLO"
+
+
+def accept_hello(message):
+    """Server side of the handshake: returns the agreed encoding and the ack frame."""
+    encoding = message.get("encoding")
+    if encoding not in SUPPORTED_ENCODINGS:
+        encoding = ENCODING_JSON
+    return encoding, {"type": "HELLO_ACK", "encoding": encoding}
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for a stream of JSON and binary frames.
+
+    feed() appends received bytes and returns all complete messages in arrival
+    order, binary frames decoded into the same dicts the JSON path produces.
+    Partial frames stay buffered until the rest arrives. Undecodable lines are
+    dropped and counted in `errors`.
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.errors = 0
+        self.pending = deque()  # Used by recv_message() for frames not yet consumed
+        self._buf = bytearray()
+
+    def feed(self, data):
+        self._buf += data
+        buf = self._buf
+        messages = []
+
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            if buf[pos] == MAGIC:
+                if end - pos < 2:
+                    break
+                kind = buf[pos + 1]
+                if kind == REPLY_KIND:
+                    frame_end = pos + 2 + _REPLY_STRUCT.size
+                    if frame_end > end:
+                        break
+                    code = buf[pos + 2]
+                    if code < len(REPLY_ACTIONS):
+                        messages.append({"action": REPLY_ACTIONS[code]})
+                    else:
+                        self.errors += 1
+                    pos = frame_end
+                    continue
+                layout = _LAYOUTS_BY_KIND.get(kind)
+                if layout is None:
+                    # Unknown kind: drop the marker byte and resync on the next frame
+                    self.errors += 1
+                    pos += 1
+                    continue
+                frame_end = pos + 2 + layout.size
+                if frame_end > end:
+                    break
+                messages.append(layout.decode(buf[pos + 2:frame_end]))
+                pos = frame_end
+            else:
+                nl = buf.find(b'\n', pos)
+                if nl < 0:
+                    break
+                line = bytes(buf[pos:nl])
+                pos = nl + 1
+                if not line.strip():
+                    continue
+                try:
+                    messages.append(json.loads(line))
+                except (UnicodeDecodeError, ValueError):
+                    messages.extend(self._decode_concatenated(line))
+        if pos:
+            del buf[:pos]
+
+        # A legacy object always ends with '}'; a split NDJSON frame rarely does.
+        if buf and buf[0] != MAGIC and buf.rstrip().endswith(b'}'):
+            messages.extend(self._drain_unterminated())
+
+        if len(buf) > self.max_frame_size:
+            # No frame boundary within the limit: the stream is garbage, resync.
+            self.errors += 1
+            buf.clear()
+
+        return messages
+
+    def _decode_concatenated(self, line):
+        """Recover a line holding several legacy objects back to back, e.g. '{..}{..}'."""
+        messages = []
+        try:
+            text = line.decode('utf-8')
+            pos = 0
+            while pos < len(text):
+                obj, pos = _json_decoder.raw_decode(text, pos)
+                messages.append(obj)
+                while pos < len(text) and text[pos].isspace():
+                    pos += 1
+        except (UnicodeDecodeError, ValueError):
+            self.errors += 1
+        return messages
+
+    def _drain_unterminated(self):
+        """Decode complete JSON objects sent without a trailing newline (legacy devices)."""
+        try:
+            text = self._buf.decode('utf-8')
+        except UnicodeDecodeError:
+            return []  # Multi-byte character split across segments, wait for more
+
+        messages = []
+        pos = 0
+        end = len(text)
+        while pos < end:
+            while pos < end and text[pos].isspace():
+                pos += 1
+            if pos == end:
+                break
+            try:
+                obj, pos = _json_decoder.raw_decode(text, pos)
+            except ValueError:
+                break  # Incomplete object, keep it buffered
+            messages.append(obj)
+
+        if pos:
+            del self._buf[:len(text[:pos].encode('utf-8'))]
+        return messages
+
+
+def recv_message(sock, decoder):
+    """Block until one complete message is available on a plain socket."""
+    while not decoder.pending:
+        data = sock.recv(RECV_SIZE)
+        if not data:
+            raise ConnectionError("connection closed by peer")
+        decoder.pending.extend(decoder.feed(data))
+    return decoder.pending.popleft()
+
+
+def negotiate_encoding(sock, decoder, encoding, device_type=None):
+    """
+    Device side of the handshake. Returns the encoding the server agreed to;
+    servers that predate the handshake answer with something else and the
+    connection simply stays on JSON.
+    """
+    if encoding == ENCODING_JSON:
+        return ENCODING_JSON
+    sock.sendall(encode_frame(make_hello(encoding, device_type)))
+    reply = recv_message(sock, decoder)
+    if reply.get("type") == "HELLO_ACK":
+        return reply.get("encoding", ENCODING_JSON)
+    return ENCODING_JSON
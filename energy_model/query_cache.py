@@ -0,0 +1,189 @@
+"""
+Shared result cache for InfluxConnector queries.
+
+One entry per (url, bucket, device_id, field set) holds the raw rows fetched
+for that series and the time range they cover. A request for "rows since
+`start`" is answered by:
+
+- hit:    the entry covers `start` and was fetched less than `max_age` ago ->
+          slice the cached frame, no query
+- top-up: the entry covers `start` but is older -> only query the tail
+          (from the entry's end minus `overlap`) and merge it in
+- miss:   otherwise query from `start` (aligned down to `align`, so requests
+          a few seconds apart share one query) and store the result
+
+Identical fetches already in flight (same key and start) are coalesced: the
+followers wait for the leader's result instead of querying. Entries are kept
+to `max_span` of history and evicted least-recently-used once the cached
+frames exceed `max_bytes`.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import pandas as pd
+
+
+class _Entry:
+    __slots__ = ("frame", "start", "end", "nbytes", "full_seconds")
+
+    def __init__(self, frame, start, end, full_seconds):
+        self.frame = frame
+        self.start = start
+        self.end = end
+        self.full_seconds = full_seconds
+        self.nbytes = int(frame.memory_usage(index=True).sum())
+
+
+class QueryCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_age=10.0, align='1min', overlap_minutes=2,
+                 max_span_hours=25):
+        """
+        Args:
+            max_bytes (int): Size bound for all cached frames (LRU eviction).
+            max_age (float): Seconds a cached range counts as current.
+            align (str): Miss queries start at `start` floored to this frequency.
+            overlap_minutes (int): Top-up queries re-read this much before the cached end (late writes).
+            max_span_hours (float): History kept per entry.
+        """
+        self.max_bytes = max_bytes
+        self.max_age = pd.Timedelta(seconds=max_age)
+        self.align = align
+        self.overlap = pd.Timedelta(minutes=overlap_minutes)
+        self.max_span = pd.Timedelta(hours=max_span_hours)
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.topups = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.evictions = 0
+        self.query_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def fetch(self, key, start, query, now=None):
+        """
+        Rows of `key` with index >= start, querying only what the cache lacks.
+
+        Args:
+            key (tuple): Series identity, e.g. (url, bucket, device_id, fields).
+            start (pd.Timestamp): Inclusive lower bound (tz-aware).
+            query (callable): query(fetch_start) -> DataFrame indexed by time, or None
+                if there are no rows; raises on failure.
+            now (pd.Timestamp): Reference time (defaults to the current UTC time).
+
+        Returns:
+            pd.DataFrame: Possibly empty.
+        """
+        now = pd.Timestamp.now(tz='UTC') if now is None else now
+        waited = False
+        with self._lock:
+            self.requests += 1
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                if entry is not None and entry.start <= start and (waited or now - entry.end <= self.max_age):
+                    if not waited:
+                        self.hits += 1
+                    self.saved_seconds += entry.full_seconds
+                    return entry.frame[entry.frame.index >= start]
+                if entry is not None and entry.start <= start:
+                    fetch_start = max(entry.start, entry.end - self.overlap)
+                else:
+                    fetch_start = start.floor(self.align)
+                flight = self._inflight.get((key, fetch_start))
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[(key, fetch_start)] = Future()
+            if leader:
+                break
+            # Same query already running: wait for it, then read the cache
+            flight.result()
+            with self._lock:
+                self.coalesced += 1
+            waited = True
+
+        t0 = time.perf_counter()
+        try:
+            frame = query(fetch_start)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                del self._inflight[(key, fetch_start)]
+            flight.set_exception(e)
+            raise
+        seconds = time.perf_counter() - t0
+
+        with self._lock:
+            self.query_seconds += seconds
+            result = self._store(key, fetch_start, now, frame, seconds)
+            del self._inflight[(key, fetch_start)]
+        flight.set_result(None)
+        return result[result.index >= start]
+
+    def _store(self, key, fetch_start, now, frame, seconds):
+        entry = self._entries.get(key)
+        topup = entry is not None and entry.start <= fetch_start <= entry.end
+        if frame is None:
+            frame = pd.DataFrame(index=pd.DatetimeIndex([], tz='UTC', name='_time'))
+        if topup:
+            self.topups += 1
+            self.saved_seconds += max(0.0, entry.full_seconds - seconds)
+            # Fetched rows replace cached ones from their first timestamp on (aggregated
+            # queries may start at the bin before fetch_start)
+            first = min(fetch_start, frame.index[0]) if len(frame) else fetch_start
+            old = entry.frame[entry.frame.index < first]
+            merged = pd.concat([old, frame]) if len(frame) else old
+            start, full_seconds = entry.start, entry.full_seconds
+        else:
+            self.misses += 1
+            merged = frame
+            start, full_seconds = fetch_start, seconds
+        cutoff = now - self.max_span
+        if start < cutoff:
+            merged = merged[merged.index >= cutoff]
+            start = cutoff
+        if entry is not None:
+            self._bytes -= self._entries.pop(key).nbytes
+        entry = self._entries[key] = _Entry(merged, start, now, full_seconds)
+        self._bytes += entry.nbytes
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+        return merged
+
+    def invalidate(self, key=None):
+        """Drop one entry (or everything)."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            elif key in self._entries:
+                self._bytes -= self._entries.pop(key).nbytes
+
+    def stats(self):
+        with self._lock:
+            requests = self.requests
+            return {
+                "requests": requests,
+                "hits": self.hits,
+                "topups": self.topups,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "hit_ratio": round(self.hits / requests, 3) if requests else None,
+                "partial_hit_ratio": round(self.topups / requests, 3) if requests else None,
+                "query_seconds": round(self.query_seconds, 3),
+                "saved_query_seconds": round(self.saved_seconds, 3),
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+            }
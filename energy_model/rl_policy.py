@@ -0,0 +1,298 @@
+"""
+Q-table policies for the lubrication and tension controllers.
+
+The policy files (q_brain.pkl / tension_q_brain.pkl) are owned by one
+process-wide PolicyRegistry. It loads each table once, and a background watcher
+thread reloads it when the file's mtime changes. Readers get an immutable
+PolicySnapshot with a plain attribute read, so the per-message path takes no
+lock and makes no syscalls.
+
+The per-device controllers (LubricationAI_RL, TensionAI_RL) only hold the
+mutable state of one machine (cooldown, counters) and look up the current
+snapshot on every decision. analyze_batch() evaluates many controllers in one
+vectorized pass with the same semantics as calling analyze() on each in turn.
+"""
+import os
+import pickle
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+LUBRICATION_POLICY = "lubrication"
+TENSION_POLICY = "tension"
+
+# greedy: argmax of q_table over the action axis, precomputed once per load
+PolicySnapshot = namedtuple("PolicySnapshot", ["name", "path", "q_table", "greedy", "mtime", "version"])
+
+LUB_COOLDOWN_STEPS = 5
+# Below this many readings NumPy call overhead outweighs vectorization; analyze_batch loops instead
+VECTORIZE_MIN_BATCH = 8
+
+
+class PolicyRegistry:
+    def __init__(self, poll_interval=2.0):
+        """
+        Args:
+            poll_interval (float): Seconds between mtime checks of the watcher thread.
+        """
+        self.poll_interval = poll_interval
+        self._paths = {}
+        self._snapshots = {}
+        self._write_lock = threading.Lock()  # Serializes reloads; readers never take it
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def register(self, name, path):
+        """Register a policy file and load it immediately."""
+        self._paths[name] = path
+        self._reload(name, force=True)
+
+    def get(self, name):
+        """Current snapshot for `name`, or None if the policy is not registered."""
+        return self._snapshots.get(name)
+
+    def q_table(self, name):
+        snapshot = self._snapshots.get(name)
+        return snapshot.q_table if snapshot else None
+
+    def greedy(self, name):
+        snapshot = self._snapshots.get(name)
+        return snapshot.greedy if snapshot else None
+
+    def refresh(self):
+        """Reload every policy whose file changed on disk."""
+        for name in list(self._paths):
+            self._reload(name)
+
+    def _reload(self, name, force=False):
+        path = self._paths[name]
+        with self._write_lock:
+            current = self._snapshots.get(name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                mtime = None
+
+            if not force and current is not None and current.mtime == mtime:
+                return
+
+            q_table = None
+            greedy = None
+            if mtime is not None:
+                try:
+                    with open(path, "rb") as f:
+                        q_table = np.asarray(pickle.load(f))
+                    greedy = np.argmax(q_table, axis=-1)
+                    q_table.setflags(write=False)
+                    greedy.setflags(write=False)
+                    print(f"🧠 [PolicyRegistry] {name} Model Loaded/Reloaded ({path})")
+                except Exception as e:
+                    print(f"⚠️ [PolicyRegistry] Failed to load {path}: {e}")
+                    q_table = greedy = None
+
+            version = current.version + 1 if current else 1
+            # Publishing is a single dict item assignment, atomic for readers.
+            self._snapshots[name] = PolicySnapshot(name, path, q_table, greedy, mtime, version)
+
+    def start_watcher(self):
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="policy-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ [PolicyRegistry] Watcher error: {e}")
+
+
+# Action codes returned by the vectorized deciders
+ACT_NONE = 0      # Lubrication cooldown: no decision this step
+ACT_MONITOR = 1
+ACT_INJECT = 2    # Lubrication, RL decision
+ACT_FORCED = 3    # Lubrication, forced protection (temperature/current limit)
+ACT_OPTIMIZE = 4  # Tension
+
+
+def decide_lubrication(greedy, current, temperature, cooldown):
+    """
+    Vectorized LubricationAI_RL.analyze for N devices.
+
+    Args:
+        greedy (np.ndarray): argmax table of the lubrication policy (10x10), or None.
+        current, temperature (array-like): Latest reading per device.
+        cooldown (array-like): Remaining cooldown steps per device.
+
+    Returns:
+        (actions, next_cooldown): int8 action codes and the updated cooldowns.
+    """
+    current = np.asarray(current, dtype=float)
+    temperature = np.asarray(temperature, dtype=float)
+    cooldown = np.asarray(cooldown, dtype=np.int64)
+
+    cooling = cooldown > 0
+    forced = ~cooling & ((temperature > 55.0) | (current > 13.0))
+    actions = np.full(current.shape, ACT_MONITOR, dtype=np.int8)
+    actions[cooling] = ACT_NONE
+    actions[forced] = ACT_FORCED
+
+    if greedy is not None:
+        curr_idx = np.clip(np.nan_to_num((current - 9.0) * 2, nan=0.0), 0, 9).astype(np.intp)
+        temp_idx = np.clip(np.nan_to_num((temperature - 25.0) / 5, nan=0.0), 0, 9).astype(np.intp)
+        rl = ~cooling & ~forced & (greedy[curr_idx, temp_idx] == 1)
+        actions[rl] = ACT_INJECT
+
+    next_cooldown = np.where(cooling, cooldown - 1, cooldown)
+    next_cooldown[(actions == ACT_INJECT) | (actions == ACT_FORCED)] = LUB_COOLDOWN_STEPS
+    return actions, next_cooldown
+
+
+def decide_tension(greedy, tension, yarn_pct):
+    """Vectorized TensionAI_RL.analyze for N devices. Returns int8 action codes."""
+    tension = np.asarray(tension, dtype=float)
+    yarn_pct = np.asarray(yarn_pct, dtype=float)
+    actions = np.full(tension.shape, ACT_MONITOR, dtype=np.int8)
+    if greedy is not None:
+        yarn_idx = np.clip(np.trunc(np.nan_to_num(yarn_pct / 100.0 * 10, nan=0.0)), 0, 9).astype(np.intp)
+        tension_idx = np.clip(np.nan_to_num(tension - 3.0, nan=0.0), 0, 9).astype(np.intp)
+        actions[greedy[yarn_idx, tension_idx] == 1] = ACT_OPTIMIZE
+    return actions
+
+
+def _batch_rounds(controllers):
+    """
+    Split batch positions into rounds in which every controller appears at most
+    once, so state written by one reading is seen by the next reading of the same device.
+    """
+    seen = {}
+    rounds = []
+    for i, controller in enumerate(controllers):
+        k = seen.get(id(controller), 0)
+        seen[id(controller)] = k + 1
+        if k == len(rounds):
+            rounds.append([])
+        rounds[k].append(i)
+    return rounds
+
+
+class LubricationAI_RL:
+    def __init__(self, registry=None):
+        self.registry = registry or policy_registry
+        self.cooldown = 0
+        self.inject_count = 0
+
+    @property
+    def q_table(self):
+        return self.registry.q_table(LUBRICATION_POLICY)
+
+    def analyze(self, data):
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            return None
+        curr = data.get('current_a', 10.0)
+        temp = data.get('temperature_c', 40.0)
+        if temp > 55.0 or curr > 13.0:
+            self.cooldown = 5
+            self.inject_count += 1
+            return {"action": "INJECT", "msg": "🔥 强制保护"}
+        q_table = self.q_table
+        if q_table is not None:
+            curr_idx = int(min(9, max(0, (curr - 9.0) * 2)))
+            temp_idx = int(min(9, max(0, (temp - 25.0) / 5)))
+            if np.argmax(q_table[curr_idx, temp_idx]) == 1:
+                self.cooldown = 5
+                self.inject_count += 1
+                return {"action": "INJECT", "msg": "🧠 RL决策喷油"}
+        return {"action": "MONITOR", "msg": "Running"}
+
+    def force_cooldown(self, steps):
+        self.cooldown = max(self.cooldown, steps)
+
+    @staticmethod
+    def analyze_batch(controllers, readings, registry=None):
+        """
+        Decide for many devices at once.
+
+        Equivalent to [c.analyze(r) for c, r in zip(controllers, readings)],
+        including cooldown and forced-protection handling, but the bucket lookup
+        runs as one NumPy pass per round (see _batch_rounds).
+        """
+        if len(controllers) < VECTORIZE_MIN_BATCH:
+            return [c.analyze(r) for c, r in zip(controllers, readings)]
+        registry = registry or policy_registry
+        greedy = registry.greedy(LUBRICATION_POLICY)
+        results = [None] * len(controllers)
+        for positions in _batch_rounds(controllers):
+            batch = [controllers[i] for i in positions]
+            current = [readings[i].get('current_a', 10.0) for i in positions]
+            temperature = [readings[i].get('temperature_c', 40.0) for i in positions]
+            cooldown = [c.cooldown for c in batch]
+            actions, next_cooldown = decide_lubrication(greedy, current, temperature, cooldown)
+            for i, controller, action, cd in zip(positions, batch, actions.tolist(), next_cooldown.tolist()):
+                controller.cooldown = cd
+                if action == ACT_NONE:
+                    continue
+                if action == ACT_MONITOR:
+                    results[i] = {"action": "MONITOR", "msg": "Running"}
+                    continue
+                controller.inject_count += 1
+                if action == ACT_FORCED:
+                    results[i] = {"action": "INJECT", "msg": "🔥 强制保护"}
+                else:
+                    results[i] = {"action": "INJECT", "msg": "🧠 RL决策喷油"}
+        return results
+
+
+class TensionAI_RL:
+    def __init__(self, registry=None):
+        self.registry = registry or policy_registry
+        self.optimize_count = 0
+
+    @property
+    def q_table(self):
+        return self.registry.q_table(TENSION_POLICY)
+
+    def analyze(self, data):
+        tension = data.get('tension', 3.0)
+        yarn_pct = data.get('yarn_pct', 100.0)
+        yarn_idx = int((yarn_pct / 100.0) * 10)
+        yarn_idx = max(0, min(9, yarn_idx))
+        tension_idx = int(min(9, max(0, tension - 3.0)))
+        q_table = self.q_table
+        if q_table is not None:
+            if np.argmax(q_table[yarn_idx, tension_idx]) == 1:
+                self.optimize_count += 1
+                return {"action": "OPTIMIZE_TENSION", "msg": "⚡ RL优化张力"}
+        return {"action": "MONITOR", "msg": "Optimal"}
+
+    @staticmethod
+    def analyze_batch(controllers, readings, registry=None):
+        """Vectorized [c.analyze(r) for c, r in zip(controllers, readings)]."""
+        if len(controllers) < VECTORIZE_MIN_BATCH:
+            return [c.analyze(r) for c, r in zip(controllers, readings)]
+        registry = registry or policy_registry
+        greedy = registry.greedy(TENSION_POLICY)
+        tension = [r.get('tension', 3.0) for r in readings]
+        yarn_pct = [r.get('yarn_pct', 100.0) for r in readings]
+        actions = decide_tension(greedy, tension, yarn_pct)
+        results = []
+        for controller, action in zip(controllers, actions.tolist()):
+            if action == ACT_OPTIMIZE:
+                controller.optimize_count += 1
+                results.append({"action": "OPTIMIZE_TENSION", "msg": "⚡ RL优化张力"})
+            else:
+                results.append({"action": "MONITOR", "msg": "Optimal"})
+        return results
+
+
+# Global Instance
+policy_registry = PolicyRegistry()
+policy_registry.register(LUBRICATION_POLICY, "q_brain.pkl")
+policy_registry.register(TENSION_POLICY, "tension_q_brain.pkl")
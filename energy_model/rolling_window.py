@@ -0,0 +1,97 @@
+"""
+Per-device rolling window of electrical readings from the monitor InfluxDB.
+
+The first refresh() fetches the whole window once; after that, every refresh
+only asks InfluxDB for rows newer than the last timestamp already held (minus a
+small overlap so late-arriving points are picked up), replaces the overlap,
+and evicts rows that fell out of the window. frame() returns the same
+1-minute resampled DataFrame that InfluxConnector.query_recent_data() would,
+so EnergyOptimizer and the forecaster work on it unchanged. With a pushdown
+connector the window holds the 1-minute means InfluxDB returns instead of raw
+points; the overlap re-reads (and replaces) the last, still-filling bins.
+"""
+import pandas as pd
+
+from .influx_connector import resample_minutes
+
+
+class RollingWindow:
+    def __init__(self, connector, device_id, minutes=1440, overlap_minutes=2):
+        """
+        Args:
+            connector (InfluxConnector): Source of the readings.
+            device_id (str): gateWayId to follow.
+            minutes (int): Window length.
+            overlap_minutes (int): How far before the last held timestamp each
+                incremental fetch starts (re-reads late writes).
+        """
+        self.connector = connector
+        self.device_id = device_id
+        self.window = pd.Timedelta(minutes=minutes)
+        self.overlap = pd.Timedelta(minutes=overlap_minutes)
+        self._raw = None
+        self._frame = None
+        self.full_fetches = 0
+        self.incremental_fetches = 0
+        self.rows_fetched = 0
+
+    def __len__(self):
+        return 0 if self._raw is None else len(self._raw)
+
+    @property
+    def last_timestamp(self):
+        return None if self._raw is None or self._raw.empty else self._raw.index[-1]
+
+    def refresh(self, now=None):
+        """
+        Pull new readings and evict expired ones.
+
+        Args:
+            now (pd.Timestamp): Reference time (defaults to the current UTC time).
+
+        Returns:
+            pd.DataFrame: The resampled window, or None if it holds no data.
+        """
+        now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now)
+        if now.tzinfo is None:
+            now = now.tz_localize('UTC')
+        last = self.last_timestamp
+
+        if last is None:
+            new = self.connector.query_since(now - self.window, self.device_id, now=now)
+            self.full_fetches += 1
+            if new is not None:
+                self._raw = new
+        else:
+            start = last - self.overlap
+            new = self.connector.query_since(start, self.device_id, now=now)
+            self.incremental_fetches += 1
+            if new is not None:
+                # The overlap is re-read: keep the fresh copy of those rows
+                kept = self._raw[self._raw.index < new.index[0]]
+                raw = pd.concat([kept, new])
+                self._raw = raw[~raw.index.duplicated(keep='last')].sort_index()
+
+        if new is not None:
+            self.rows_fetched += len(new)
+            self._frame = None
+
+        if self._raw is not None:
+            cutoff = now - self.window
+            if len(self._raw) and self._raw.index[0] < cutoff:
+                self._raw = self._raw[self._raw.index >= cutoff]
+                self._frame = None
+        return self.frame()
+
+    def frame(self):
+        """1-minute resampled copy of the window (cached until the window changes)."""
+        if self._raw is None or self._raw.empty:
+            return None
+        if self._frame is None:
+            self._frame = resample_minutes(self._raw)
+        return self._frame
+
+    def reset(self):
+        """Drop the buffer; the next refresh() fetches the whole window again."""
+        self._raw = None
+        self._frame = None
@@ -0,0 +1,434 @@
+"""
+Materialized per-device rollups (min / max / sum / count) at 1m, 15m, 1h and 1d.
+
+Every reading that arrives through the ingestion path is folded into the open
+bucket of each resolution (O(fields x resolutions) per reading, no query).
+When a bucket's time is over it moves to a pending list, and flush() appends
+pending buckets to one fixed-width record file per device and resolution:
+
+    <root>/<resolution>/<device>.bin    records: t (int64 ns, bucket start, UTC)
+                                        then <field>.min/.max/.sum/.count (float64)
+
+Files are append-only and sorted by time, so reading a range is a memory map
+plus two binary searches. A reading for an older bucket (late data) is merged
+into the pending or stored record if there is one. On close() the open buckets
+are written as well; after a restart the last record is reopened if new
+readings still fall into it.
+
+series() answers chart queries: it picks the coarsest rollup whose step
+divides the requested step and merges its buckets up to that step if needed.
+
+Coverage is kept in <root>/coverage.json and survives restarts:
+
+    {"since": ns, "flushed": ns, "clean": bool, "gaps": [[start, end], ...]}
+
+`since` is when the store was first started, `flushed` the last flush. A clean
+close() writes the open buckets and sets `clean`. After an unclean stop the
+buckets not yet on disk are lost, so the next start records [flushed, now) as
+a gap. covers() tells whether a range is complete (after `since`, inside the
+rollup's retention, no gap); callers query InfluxDB otherwise, and for steps no
+rollup divides (resolution_for() returns None).
+"""
+import json
+import os
+import threading
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+# Resolution name -> bucket length in seconds (finest first)
+ROLLUPS = {"1m": 60, "15m": 900, "1h": 3600, "1d": 86400}
+# Days of buckets kept per resolution (0 = forever)
+RETENTION_DAYS = {"1m": 14, "15m": 400, "1h": 1830, "1d": 0}
+AGGREGATES = ("min", "max", "sum", "count")
+COVERAGE_FILE = "coverage.json"
+MAX_GAPS = 100  # older gaps move `since` forward
+
+
+class _Series:
+    __slots__ = ("open_t", "open", "pending", "loaded")
+
+    def __init__(self):
+        self.open_t = None  # bucket start (ns) of the open bucket
+        self.open = None  # [min, max, sum, count] per field, flattened
+        self.pending = []  # closed buckets not yet on disk: (t, values)
+        self.loaded = False  # the last stored record was checked for reopening
+
+
+class RollupStore:
+    def __init__(self, root, fields, rollups=None, retention_days=None):
+        """
+        Args:
+            root (str): Directory for the record files (created on first flush).
+            fields (sequence): Fields rolled up (others in a reading are ignored).
+            rollups (dict): {name: seconds} resolutions, finest first (default ROLLUPS).
+            retention_days (dict): {name: days} kept per resolution (default RETENTION_DAYS).
+        """
+        self.root = root
+        self.fields = list(fields)
+        self._index = {f: i for i, f in enumerate(self.fields)}
+        self.rollups = dict(rollups or ROLLUPS)
+        self.steps = {name: int(seconds * 1e9) for name, seconds in self.rollups.items()}
+        self.retention = {name: pd.Timedelta(days=days) for name, days in (retention_days or RETENTION_DAYS).items()
+                          if days}
+        self.dtype = np.dtype([("t", "<i8")] + [(f"{f}.{a}", "<f8") for f in self.fields for a in AGGREGATES])
+        self._series = {}  # (device_id, rollup) -> _Series
+        self._devices = set(self._stored_devices())
+        self._lock = threading.Lock()
+        self._pruned_on = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.readings = 0
+        self.late_merged = 0
+        self.late_dropped = 0
+        self.records_written = 0
+        self._load_coverage()
+
+    def _path(self, device_id, rollup):
+        return os.path.join(self.root, rollup, quote(device_id, safe='') + ".bin")
+
+    def _load_coverage(self):
+        """Coverage of earlier runs; a new store (or an unreadable file) is covered from now on."""
+        now = pd.Timestamp.now(tz='UTC').value
+        try:
+            with open(os.path.join(self.root, COVERAGE_FILE)) as f:
+                meta = json.load(f)
+            self.covered_since = int(meta["since"])
+            self.gaps = [[int(a), int(b)] for a, b in meta.get("gaps", [])]
+            if not meta.get("clean"):
+                # Stopped without close(): what was not flushed yet is lost
+                self.gaps.append([int(meta.get("flushed", self.covered_since)), now])
+        except FileNotFoundError:
+            self.covered_since, self.gaps = now, []
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ [Rollups] Coverage file unreadable, covering from now on: {e}")
+            self.covered_since, self.gaps = now, []
+        while len(self.gaps) > MAX_GAPS:
+            self.covered_since = max(self.covered_since, self.gaps.pop(0)[1])
+        self._flushed_at = now
+
+    def _save_coverage(self, clean):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, COVERAGE_FILE)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"since": self.covered_since, "flushed": self._flushed_at, "clean": clean,
+                       "gaps": self.gaps}, f)
+        os.replace(tmp, path)
+
+    def _stored_devices(self):
+        devices = set()
+        for rollup in self.rollups:
+            try:
+                names = os.listdir(os.path.join(self.root, rollup))
+            except OSError:
+                continue
+            devices.update(unquote(n[:-4]) for n in names if n.endswith(".bin"))
+        return devices
+
+    def _stored(self, device_id, rollup, mode='r'):
+        """Memory map of a record file (None if missing or empty)."""
+        path = self._path(device_id, rollup)
+        try:
+            if os.path.getsize(path) < self.dtype.itemsize:
+                return None
+            return np.memmap(path, dtype=self.dtype, mode=mode,
+                             shape=(os.path.getsize(path) // self.dtype.itemsize,))
+        except OSError:
+            return None
+
+    def devices(self):
+        with self._lock:
+            return sorted(self._devices)
+
+    # --- ingestion ---
+
+    def _empty(self):
+        n = len(self.fields)
+        values = [0.0] * (4 * n)
+        for i in range(n):
+            values[4 * i] = values[4 * i + 1] = float('nan')
+        return values
+
+    @staticmethod
+    def _fold(values, items):
+        for i, x in items:
+            j = 4 * i
+            if not values[j + 3]:
+                values[j] = values[j + 1] = x
+            else:
+                if x < values[j]:
+                    values[j] = x
+                if x > values[j + 1]:
+                    values[j + 1] = x
+            values[j + 2] += x
+            values[j + 3] += 1
+
+    def _reopen(self, device_id, rollup, series, t):
+        """After a restart: continue the last stored bucket if the reading falls into it."""
+        series.loaded = True
+        stored = self._stored(device_id, rollup)
+        if stored is None or stored["t"][-1] != t:
+            return
+        record = stored[-1]
+        series.open_t = t
+        series.open = [float(record[name]) for name in self.dtype.names[1:]]
+        del record, stored
+        os.truncate(self._path(device_id, rollup), os.path.getsize(self._path(device_id, rollup)) -
+                    self.dtype.itemsize)
+
+    def _merge_late(self, device_id, rollup, series, t, items):
+        for pt, values in series.pending:
+            if pt == t:
+                self._fold(values, items)
+                return True
+        stored = self._stored(device_id, rollup, mode='r+')
+        if stored is None:
+            return False
+        i = int(np.searchsorted(stored["t"], t))
+        if i == len(stored) or stored["t"][i] != t:
+            return False
+        values = [float(stored[i][name]) for name in self.dtype.names[1:]]
+        self._fold(values, items)
+        stored[i] = (t, *values)
+        stored.flush()
+        return True
+
+    def add(self, device_id, fields, ts=None):
+        """
+        Fold one reading into every resolution.
+
+        Args:
+            device_id (str): Device key.
+            fields (dict): {field: value}; fields not rolled up and non-finite values are skipped.
+            ts (pd.Timestamp | int): Reading time (ns since epoch if int); defaults to now.
+        """
+        items = [(self._index[f], float(v)) for f, v in fields.items()
+                 if f in self._index and v is not None and np.isfinite(v)]
+        if not items:
+            return
+        ts = pd.Timestamp.now(tz='UTC').value if ts is None else ts if isinstance(ts, int) else pd.Timestamp(ts).value
+        with self._lock:
+            self.readings += 1
+            self._devices.add(device_id)
+            for rollup, step in self.steps.items():
+                t = ts - ts % step
+                key = (device_id, rollup)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = _Series()
+                if not series.loaded and series.open_t is None:
+                    self._reopen(device_id, rollup, series, t)
+                if series.open_t is None:
+                    series.open_t, series.open = t, self._empty()
+                elif t > series.open_t:
+                    series.pending.append((series.open_t, series.open))
+                    series.open_t, series.open = t, self._empty()
+                elif t < series.open_t:
+                    if self._merge_late(device_id, rollup, series, t, items):
+                        self.late_merged += 1
+                    else:
+                        self.late_dropped += 1
+                    continue
+                self._fold(series.open, items)
+
+    # --- persistence ---
+
+    def flush(self, include_open=False, now=None):
+        """Append closed buckets (and with include_open, the open ones) to the record files."""
+        with self._lock:
+            flushed_at = pd.Timestamp.now(tz='UTC').value
+            for (device_id, rollup), series in self._series.items():
+                rows = series.pending
+                if include_open and series.open_t is not None:
+                    rows = rows + [(series.open_t, series.open)]
+                    series.open_t = series.open = None
+                    series.loaded = False
+                if not rows:
+                    continue
+                records = np.array([(t, *values) for t, values in rows], dtype=self.dtype)
+                path = self._path(device_id, rollup)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'ab') as f:
+                    f.write(records.tobytes())
+                series.pending = []
+                self.records_written += len(records)
+            # Everything before flushed_at is on disk except the open buckets (and all of it with include_open)
+            self._flushed_at = flushed_at
+            self._save_coverage(clean=include_open)
+        self._prune(now)
+
+    def _prune(self, now=None):
+        if not self.retention:
+            return
+        now = pd.Timestamp.now(tz='UTC') if now is None else now
+        today = now.floor('1D')
+        with self._lock:
+            if self._pruned_on == today:
+                return
+            self._pruned_on = today
+            for rollup, keep in self.retention.items():
+                cutoff = (now - keep).value
+                for device_id in self._devices:
+                    stored = self._stored(device_id, rollup)
+                    if stored is None or stored["t"][0] >= cutoff:
+                        continue
+                    path = self._path(device_id, rollup)
+                    kept = np.array(stored[np.searchsorted(stored["t"], cutoff):])
+                    del stored
+                    tmp = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp, 'wb') as f:
+                        f.write(kept.tobytes())
+                    os.replace(tmp, path)
+
+    def start_flusher(self, interval=10.0):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            self._save_coverage(clean=False)  # a crash from here on leaves a gap
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="rollup-flush", daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ [Rollups] Flush error: {e}")
+
+    def close(self):
+        """Stop the flusher and write everything, open buckets included."""
+        self._stop.set()
+        self.flush(include_open=True)
+
+    # --- queries ---
+
+    def resolution_for(self, step):
+        """Coarsest rollup whose bucket length divides `step` (pd.Timedelta); None if none does."""
+        step_ns = step.value
+        best = None
+        for rollup, size in self.steps.items():
+            if size <= step_ns and step_ns % size == 0:
+                best = rollup
+        return best
+
+    def covers(self, start, step):
+        """
+        True if series(start=start, step=step) up to now is complete: its first bucket
+        (the one holding `start`) began after the store was first started, is inside the
+        retention of the rollup used, and no bucket from there on overlaps a gap.
+        """
+        rollup = self.resolution_for(step)
+        if rollup is None:
+            return False
+        start_ns, step_ns = pd.Timestamp(start).value, step.value
+        first = start_ns - start_ns % step_ns
+        if first < self.covered_since:
+            return False
+        keep = self.retention.get(rollup)
+        if keep is not None and first < (pd.Timestamp.now(tz='UTC') - keep).value:
+            return False
+        # A gap also spoils the bucket it ends in, whose start is before `end`
+        return all(end <= first for _, end in self.gaps)
+
+    def auto_step(self, span, max_points):
+        """Finest rollup step that draws `span` (pd.Timedelta) in at most max_points buckets."""
+        for rollup, seconds in self.rollups.items():
+            if span.total_seconds() / seconds <= max_points:
+                return pd.Timedelta(seconds=seconds)
+        return pd.Timedelta(seconds=list(self.rollups.values())[-1])
+
+    def read(self, device_id, rollup, start, stop):
+        """
+        Buckets of one rollup with start <= t < stop: stored, pending and the open one.
+
+        Returns:
+            np.ndarray: Structured records (self.dtype), sorted by t.
+        """
+        lo_t, hi_t = pd.Timestamp(start).value, pd.Timestamp(stop).value
+        parts = []
+        with self._lock:
+            stored = self._stored(device_id, rollup)
+            if stored is not None:
+                lo, hi = np.searchsorted(stored["t"], [lo_t, hi_t])
+                parts.append(np.array(stored[lo:hi]))
+                del stored
+            series = self._series.get((device_id, rollup))
+            if series is not None:
+                rows = series.pending + ([(series.open_t, series.open)] if series.open_t is not None else [])
+                rows = [(t, *values) for t, values in rows if lo_t <= t < hi_t]
+                if rows:
+                    parts.append(np.array(rows, dtype=self.dtype))
+        if not parts:
+            return np.empty(0, dtype=self.dtype)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def series(self, device_id, start, stop, step, fields=None, agg="mean"):
+        """
+        Aggregated chart series for one device.
+
+        Args:
+            device_id (str): Device key.
+            start, stop (pd.Timestamp): Range (UTC); the bucket holding `start` is included whole.
+            step (pd.Timedelta): Bucket length of the result.
+            fields (sequence): Fields to return (default all).
+            agg (str): "mean", "min", "max", "sum" or "count".
+
+        Returns:
+            tuple: (bucket starts as int64 ns array, {field: float64 array}, rollup used).
+        """
+        rollup = self.resolution_for(step)
+        if rollup is None:
+            raise ValueError(f"no rollup divides {step}")
+        step_ns = max(step.value, self.steps[rollup])
+        start_ns = pd.Timestamp(start).value
+        records = self.read(device_id, rollup, start_ns - start_ns % step_ns, stop)  # whole first bucket
+        t = records["t"]
+        fields = self.fields if fields is None else [f for f in fields if f in self._index]
+        if step_ns > self.steps[rollup] and len(t):
+            # Merge consecutive buckets into step-long ones
+            keys = t - t % step_ns
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            t = keys[starts]
+
+            def reduce(column, fn):
+                return fn.reduceat(records[column], starts)
+
+            merged = {}
+            for f in fields:
+                merged[f] = {
+                    "min": reduce(f"{f}.min", np.fmin), "max": reduce(f"{f}.max", np.fmax),
+                    "sum": reduce(f"{f}.sum", np.add), "count": reduce(f"{f}.count", np.add)}
+        else:
+            merged = {f: {a: records[f"{f}.{a}"] for a in AGGREGATES} for f in fields}
+
+        out = {}
+        for f, columns in merged.items():
+            if agg == "mean":
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    out[f] = np.where(columns["count"] > 0, columns["sum"] / columns["count"], np.nan)
+            else:
+                out[f] = np.asarray(columns[agg], dtype=np.float64)
+        return t, out, rollup
+
+    def stats(self):
+        size = 0
+        for directory, _, names in os.walk(self.root):
+            size += sum(os.path.getsize(os.path.join(directory, n)) for n in names if n.endswith(".bin"))
+        with self._lock:
+            return {
+                "root": self.root,
+                "rollups": list(self.rollups),
+                "covered_since": pd.Timestamp(self.covered_since, tz='UTC').isoformat(),
+                "gaps": [[pd.Timestamp(a, tz='UTC').isoformat(), pd.Timestamp(b, tz='UTC').isoformat()]
+                         for a, b in self.gaps],
+                "devices": len(self._devices),
+                "readings": self.readings,
+                "pending_buckets": sum(len(s.pending) for s in self._series.values()),
+                "records_written": self.records_written,
+                "late_merged": self.late_merged,
+                "late_dropped": self.late_dropped,
+                "bytes_on_disk": size,
+            }
@@ -0,0 +1,118 @@
+"""
+Per-dashboard subscriptions and Socket.IO room naming.
+
+Each connected dashboard (Socket.IO sid) has its own current device (and its
+production line) plus a set of explicitly subscribed devices / lines, e.g. the
+local bots it renders; switching the current device leaves the explicit
+subscriptions alone. Device ids are the ones updates are keyed by: gateway ids
+(energy*<line>*<machine>) and local `ip_TYPE` keys.
+
+Every device and every line maps to a Socket.IO room; the server joins a session to the rooms it subscribes to and
+emits device updates only to the rooms of that device, so outbound traffic
+grows with the number of interested sessions rather than with all clients.
+
+This module only keeps the bookkeeping; joining and leaving the actual rooms is
+left to the caller (flask_socketio.join_room / leave_room).
+"""
+import threading
+
+DEVICE_ROOM_PREFIX = "device:"
+LINE_ROOM_PREFIX = "line:"
+
+
+def device_room(device_id):
+    return f"{DEVICE_ROOM_PREFIX}{device_id}"
+
+
+def line_room(line):
+    return f"{LINE_ROOM_PREFIX}{line}"
+
+
+class DashboardSession:
+    __slots__ = ("sid", "current_device", "current_line", "devices", "lines")
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.current_device = None  # until the first switch, the registry's default_device
+        self.current_line = None
+        self.devices = set()
+        self.lines = set()
+
+    def rooms(self):
+        devices = self.devices | {self.current_device} if self.current_device else self.devices
+        lines = self.lines | {self.current_line} if self.current_line is not None else self.lines
+        return {device_room(d) for d in devices} | {line_room(l) for l in lines}
+
+
+class SubscriptionRegistry:
+    def __init__(self, default_device=None):
+        """
+        Args:
+            default_device (str): Current device given to new sessions and used
+                when nobody is connected.
+        """
+        self.default_device = default_device
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def open(self, sid):
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is None:
+                session = self._sessions[sid] = DashboardSession(sid)
+            return session
+
+    def close(self, sid):
+        """Forget a session. Returns the rooms it was in."""
+        with self._lock:
+            session = self._sessions.pop(sid, None)
+        return session.rooms() if session else set()
+
+    def get(self, sid):
+        return self._sessions.get(sid)
+
+    def subscribe(self, sid, devices=(), lines=()):
+        """Add subscriptions. Returns the rooms the session must join."""
+        session = self.open(sid)
+        with self._lock:
+            before = session.rooms()
+            session.devices.update(str(d) for d in devices)
+            session.lines.update(str(l) for l in lines)
+            return session.rooms() - before
+
+    def unsubscribe(self, sid, devices=(), lines=()):
+        """Drop subscriptions. Returns the rooms the session must leave."""
+        session = self.open(sid)
+        with self._lock:
+            before = session.rooms()
+            session.devices.difference_update(str(d) for d in devices)
+            session.lines.difference_update(str(l) for l in lines)
+            return before - session.rooms()
+
+    def set_current_device(self, sid, device_id, line=None):
+        """
+        Switch a session's current device, moving its device/line rooms from the
+        previous one to the new one (explicit subscriptions are kept).
+
+        Returns:
+            (join, leave): Sets of rooms to join and to leave.
+        """
+        session = self.open(sid)
+        with self._lock:
+            before = session.rooms()
+            session.current_device = device_id
+            session.current_line = str(line) if line is not None else None
+            after = session.rooms()
+            return after - before, before - after
+
+    def current_devices(self):
+        """Distinct current devices of all sessions (the default one if nobody is connected)."""
+        with self._lock:
+            devices = {s.current_device or self.default_device for s in self._sessions.values()}
+            devices.discard(None)
+        if not devices and self.default_device:
+            devices.add(self.default_device)
+        return sorted(devices)
+
+    def session_count(self):
+        return len(self._sessions)
@@ -0,0 +1,179 @@
+"""
+Local on-disk cache of per-device, per-day telemetry (memory-mapped NumPy).
+
+Finished days never change in the monitor database, so once a day has been
+pulled it is written under
+
+    <root>/<bucket>/<kind>/<device>/<YYYY-MM-DD>.time.npy     int64 ns since epoch (UTC)
+    <root>/<bucket>/<kind>/<device>/<YYYY-MM-DD>.values.npy   float64, one row per field
+
+where `kind` is "raw" or the aggregation step ("60s"). Each field is stored
+contiguously, so reading back is a memory map plus one concatenate, with no
+parsing and no network. A day is only stored after it has been over for
+`settle_minutes` (late writes). The current day is always queried.
+
+InfluxConnector uses the store transparently (see InfluxConnector._fetch_range);
+offline scripts can call read() directly.
+"""
+import os
+import threading
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+DAY = pd.Timedelta(days=1)
+
+
+class TelemetryStore:
+    def __init__(self, root, fields, settle_minutes=60, retention_days=90):
+        """
+        Args:
+            root (str): Cache directory (created on first write).
+            fields (sequence): Column order of the stored values (NUMERIC_FIELDS).
+            settle_minutes (int): How long after midnight (UTC) a day is considered final.
+            retention_days (int): Days older than this are deleted when new days are written
+                (0 keeps everything).
+        """
+        self.root = root
+        self.fields = list(fields)
+        self.settle = pd.Timedelta(minutes=settle_minutes)
+        self.retention = pd.Timedelta(days=retention_days) if retention_days else None
+        self._lock = threading.Lock()
+        self._pruned_on = None
+        self.day_hits = 0
+        self.day_writes = 0
+        self.bytes_read = 0
+
+    @staticmethod
+    def kind(every=None):
+        """Directory name for raw rows (every=None) or aggregates per `every` (pd.Timedelta)."""
+        return "raw" if every is None else f"{int(every.total_seconds())}s"
+
+    def _dir(self, bucket, kind, device_id):
+        return os.path.join(self.root, quote(bucket, safe=''), kind, quote(device_id or '_all', safe=''))
+
+    def _paths(self, bucket, kind, device_id, day):
+        base = os.path.join(self._dir(bucket, kind, device_id), day.strftime('%Y-%m-%d'))
+        return base + ".time.npy", base + ".values.npy"
+
+    def final_days(self, start, stop, now=None):
+        """
+        Day starts (UTC midnight) from the day containing `start` that are over and
+        settled, stopping before `stop`'s day if it is still open.
+
+        Returns:
+            list: pd.Timestamp per day, in order (empty if the first day is not final).
+        """
+        now = pd.Timestamp.now(tz='UTC') if now is None else now
+        end = now - self.settle if stop is None else min(stop, now - self.settle)
+        days = []
+        day = start.floor(DAY)
+        while day + DAY <= end:
+            days.append(day)
+            day += DAY
+        return days
+
+    def has(self, bucket, kind, device_id, day):
+        return os.path.exists(self._paths(bucket, kind, device_id, day)[0])
+
+    def write_days(self, bucket, kind, device_id, days, df, now=None):
+        """
+        Store `df` (rows indexed by _time) split by day; days without rows are stored
+        empty so they are not queried again.
+        """
+        directory = self._dir(bucket, kind, device_id)
+        os.makedirs(directory, exist_ok=True)
+        if df is not None and len(df):
+            stamps = df.index.as_unit('ns').asi8
+            values = np.full((len(self.fields), len(df)), np.nan)
+            for i, field in enumerate(self.fields):
+                if field in df.columns:
+                    values[i] = df[field].to_numpy(dtype=np.float64)
+        else:
+            stamps = np.empty(0, dtype=np.int64)
+            values = np.empty((len(self.fields), 0))
+        for day in days:
+            lo, hi = np.searchsorted(stamps, [day.value, (day + DAY).value])
+            time_path, values_path = self._paths(bucket, kind, device_id, day)
+            # values first, time last: a day counts as stored once its time file exists
+            for path, array in ((values_path, values[:, lo:hi]), (time_path, stamps[lo:hi])):
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(array))
+                os.replace(tmp, path)
+            with self._lock:
+                self.day_writes += 1
+        self._prune(now)
+
+    def read(self, bucket, kind, device_id, start, stop):
+        """
+        Stored rows in [start, stop) for the days that are on disk.
+
+        Returns:
+            pd.DataFrame: Rows indexed by _time (UTC) with the store's fields, or None if
+                nothing in the range is stored.
+        """
+        stamps, blocks = [], []
+        day = start.floor(DAY)
+        while day < stop:
+            time_path, values_path = self._paths(bucket, kind, device_id, day)
+            try:
+                t = np.load(time_path, mmap_mode='r')
+                v = np.load(values_path, mmap_mode='r')
+            except (FileNotFoundError, ValueError):
+                t = None
+            if t is not None and v.shape == (len(self.fields), len(t)):
+                lo, hi = np.searchsorted(t, [start.value, stop.value])
+                stamps.append(t[lo:hi])
+                blocks.append(v[:, lo:hi])
+                with self._lock:
+                    self.day_hits += 1
+            day += DAY
+        if not stamps:
+            return None
+        time_ns = np.concatenate(stamps)
+        block = np.concatenate(blocks, axis=1)
+        with self._lock:
+            self.bytes_read += time_ns.nbytes + block.nbytes
+        if not len(time_ns):
+            return pd.DataFrame(columns=self.fields, index=pd.DatetimeIndex([], tz='UTC', name='_time'),
+                                dtype=np.float64)
+        index = pd.DatetimeIndex(time_ns.view('datetime64[ns]'), name='_time').tz_localize('UTC')
+        return pd.DataFrame(block.T, index=index, columns=self.fields, copy=False)
+
+    def _prune(self, now=None):
+        if self.retention is None:
+            return
+        now = pd.Timestamp.now(tz='UTC') if now is None else now
+        today = now.floor(DAY)
+        with self._lock:
+            if self._pruned_on == today:
+                return
+            self._pruned_on = today
+        oldest = (today - self.retention).strftime('%Y-%m-%d')
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith('.npy') and name[:10] < oldest:
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except OSError:
+                        pass
+
+    def stats(self):
+        files, size = 0, 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.time.npy'):
+                    files += 1
+                if name.endswith('.npy'):
+                    size += os.path.getsize(os.path.join(directory, name))
+        with self._lock:
+            return {
+                "root": self.root,
+                "days_stored": files,
+                "bytes_on_disk": size,
+                "day_hits": self.day_hits,
+                "day_writes": self.day_writes,
+                "bytes_read": self.bytes_read,
+            }